@@ -17,8 +17,18 @@ intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 # データベースインスタンスを1つ作成（全Controllerで共有）
+# Controllerからは非同期ラッパー経由で使い、イベントループをブロックしない
 from models.database import Database
-database = Database()
+from models.async_database import AsyncDatabase
+database = AsyncDatabase(Database())
+
+# HoYoLABサービスも1つを共有（Clientプール・キャッシュを全Controllerで使い回す）
+from services.hoyolab_service import HoyolabService
+hoyolab_service = HoyolabService()
+
+# 通知サービスも1つを共有（隔離・スケジューラー・送信キューをどのControllerからも同じものを使う）
+from services.notification_service import NotificationService
+notification_service = NotificationService(bot, database)
 
 @bot.event
 async def on_ready():
@@ -44,6 +54,8 @@ async def load_extensions():
             try:
                 # データベースインスタンスをbotに保存（Controllerから参照可能にする）
                 bot.database = database
+                bot.hoyolab_service = hoyolab_service
+                bot.notification_service = notification_service
                 await bot.load_extension(f'controllers.{filename[:-3]}')
                 print(f'✅ {filename} を読み込みました')
                 loaded_count += 1
@@ -55,9 +67,15 @@ async def load_extensions():
     print(f'\n合計 {loaded_count} 個のコントローラーを読み込みました')
 
 async def main():
-    async with bot:
-        await load_extensions()
-        await bot.start(os.getenv('DISCORD_TOKEN'))
+    try:
+        async with bot:
+            await load_extensions()
+            await notification_service.start()  # 前回送れなかった通知も送る
+            await bot.start(os.getenv('DISCORD_TOKEN'))
+    finally:
+        await notification_service.close()
+        await hoyolab_service.close()
+        database.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
\ No newline at end of file
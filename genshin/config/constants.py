@@ -27,6 +27,7 @@ class ResinConstants:
     MAX_RESIN = 200  # 最大樹脂数
     RESIN_RECOVERY_MINUTES = 8  # 1樹脂回復にかかる分数
     RESIN_RECOVERY_SECONDS = RESIN_RECOVERY_MINUTES * 60  # 秒換算
+    NOTES_SNAPSHOT_MAX_AGE_MINUTES = 30  # これより新しい取得結果があれば推定値で応答する
 
 
 # ===== 色設定 =====
@@ -69,6 +70,64 @@ class MessageConstants:
     RESIN_RECOVERY_INFO = "樹脂は8分で1回復します"
     DM_NOTIFICATION_INFO = "DMでお知らせします"
 
+# ===== 通知関連 =====
+class NotificationConstants:
+    # スケジューラー
+    SCHEDULER_TICK_SECONDS = 60  # チェック時刻を迎えたユーザーを探す間隔
+    RECONCILE_INTERVAL_MINUTES = 30  # DBと対象ユーザーを再同期する間隔
+    RECHECK_AFTER_NOTIFY_MINUTES = 30  # 閾値到達後の再チェック間隔
+    RETRY_AFTER_ERROR_MINUTES = 30  # 取得失敗時の再試行間隔
+    SCHEDULE_SLOT_COUNT = 10  # チェックを分散させるスロット数（1スロット = SCHEDULER_TICK_SECONDS）
+    SCHEDULE_ALIGN_TOLERANCE_SECONDS = 120  # スロットに揃えるときに本来の時刻から前後にずらせる上限
+    
+    # 再通知
+    DEFAULT_RENOTIFY_MINUTES = 0  # 0なら閾値を下回って再び届くまで再通知しない
+    MAX_RENOTIFY_MINUTES = 1440  # ユーザーが設定できる再通知間隔の上限
+    
+    # 樹脂以外の資源の通知
+    RESOURCE_ALERT_LABELS = {
+        'realm_currency': '🏠 洞天宝銭',
+        'transformer': '⚗️ 参量物質変換器',
+        'expeditions': '🧭 探索派遣',
+        'commissions': '📋 デイリー任務',
+    }
+    DEFAULT_COMMISSION_REMINDER_HOUR = 20  # デイリー任務が未完了なら通知する時刻（時）
+    
+    # ダイジェスト（複数の通知を1通にまとめる）
+    DIGEST_WINDOW_MINUTES = 15  # 最初の通知からこの時間内に起きた通知をまとめて送る
+    
+    # 送信キュー（DiscordへのDM送信）
+    DELIVERY_WORKERS = 4  # 送信ワーカー数（樹脂チェックの並行数とは独立）
+    DELIVERY_RATE_PER_SECOND = 20  # 1秒あたりの送信数（Discordの全体制限より低く）
+    DELIVERY_BURST = 5  # 瞬間的に許可する送信数
+    DELIVERY_MAX_ATTEMPTS = 5  # 一時的なエラーで再送する最大回数
+    DELIVERY_RETRY_BASE_SECONDS = 5  # 再送間隔の基準（指数的に増やす）
+    DELIVERY_RETRY_MAX_SECONDS = 300  # 再送間隔の上限
+    DELIVERY_LATENCY_SAMPLES = 1000  # 遅延の統計に使う直近の件数
+
+    # 並行処理
+    MAX_CONCURRENCY = 16  # 同時にチェックするユーザー数の上限
+    USER_TIMEOUT_SECONDS = 45  # 1ユーザーあたりの処理時間の上限（APIの期限より長くする）
+
+# ===== ユーザーの状態（隔離）関連 =====
+class HealthConstants:
+    # 状態（valid以外は樹脂チェックの対象から外す）
+    VALID = 'valid'
+    INVALID_COOKIE = 'invalid_cookie'  # クッキーが無効
+    DM_CLOSED = 'dm_closed'  # DMを受け取れない
+    
+    # 隔離するまでの連続失敗回数
+    MAX_COOKIE_FAILURES = 3  # 一時的な判定ミスに備えて数回は再試行する
+    MAX_DM_FAILURES = 1  # 403は送り直しても結果が変わらない
+    
+    # 隔離中のユーザーへの案内
+    QUARANTINE_MESSAGES = {
+        INVALID_COOKIE: 'HoYoLABのクッキーが無効になったため、自動通知を停止しました。\n'
+                        'BotへのDMで `/set_cookie` を実行し、新しいクッキーを設定し直してください。',
+        DM_CLOSED: 'DMを送信できないため、自動通知を停止しました。\n'
+                   'DMを受け取れる設定にしてから、BotへのDMで `/set_cookie` を実行し直してください。',
+    }
+
 # ===== API・外部サービス関連 =====
 class APIConstants:
     # HoYoLAB関連
@@ -76,8 +135,37 @@ class APIConstants:
     GENSHIN_GAME_RECORD_URL = f"{HOYOLAB_BASE_URL}/game_record/genshin/api"
     
     # リクエスト制限
-    REQUEST_TIMEOUT = 30  # 秒
+    REQUEST_TIMEOUT = 30  # 秒（リトライを含めた1回の呼び出しの期限）
     MAX_RETRIES = 3
+    RETRY_BASE_DELAY_SECONDS = 1.0  # リトライ間隔の基準（指数的に増やし、ジッターを加える）
+    RETRY_MAX_DELAY_SECONDS = 8.0  # リトライ間隔の上限
+    RATE_LIMIT_PER_SECOND = 5  # プロセス全体で1秒あたりに送るリクエスト数
+    RATE_LIMIT_BURST = 10  # 瞬間的に許可するリクエスト数
+    
+    # サーキットブレーカー（HoYoLAB障害時に呼び出しを止める）
+    CIRCUIT_WINDOW_SIZE = 50  # エラー率を計算する直近の呼び出し件数
+    CIRCUIT_MIN_CALLS = 10  # 判定に必要な最小の呼び出し件数
+    CIRCUIT_FAILURE_RATE = 0.5  # この割合以上が失敗したら止める
+    CIRCUIT_SLOW_CALL_SECONDS = 10  # この秒数以上かかった呼び出しを遅延とみなす
+    CIRCUIT_SLOW_CALL_RATE = 0.8  # この割合以上が遅延したら止める
+    CIRCUIT_OPEN_SECONDS = 30  # 止めてから試しに呼び出すまでの秒数
+    CIRCUIT_HALF_OPEN_PROBES = 1  # 試行中に同時に通す呼び出し数
+    
+    # Clientプール・接続の再利用
+    CLIENT_POOL_MAX_SIZE = 512  # 保持するユーザーごとのClient数
+    CLIENT_IDLE_TIMEOUT_SECONDS = 600  # 使われていないClientを破棄するまでの秒数
+    CONNECTION_LIMIT = 64  # 共有コネクタの同時接続数
+    KEEPALIVE_TIMEOUT_SECONDS = 60  # keep-alive接続を保持する秒数
+    
+    # 原神アカウント（UID）情報の更新
+    ACCOUNT_REFRESH_INTERVAL_HOURS = 6  # 更新ジョブの実行間隔
+    ACCOUNT_MAX_AGE_DAYS = 7  # この日数より古い情報を取得し直す
+    ACCOUNT_REFRESH_BATCH_SIZE = 50  # 1回のジョブで更新する最大人数
+    
+    # 所持キャラクター一覧のキャッシュ
+    ROSTER_FRESH_SECONDS = 300  # この秒数以内ならそのまま返す
+    ROSTER_MAX_STALE_SECONDS = 86400  # この秒数までは古いデータを返しつつ裏で再取得
+    ROSTER_CACHE_MAX_CHARACTERS = 50000  # 全ユーザー合計のキャラクター数の上限
     
     # ヘッダー
     DEFAULT_HEADERS = {
@@ -91,10 +179,41 @@ class DatabaseConstants:
     
     # 暗号化関連
     ENCRYPTION_KEY_LENGTH = 32
+    KEY_ROTATION_CHECK_MINUTES = 10  # キーファイルの変更と再暗号化の進捗を確認する間隔
+    REENCRYPT_BATCH_SIZE = 100  # 1トランザクションで暗号化し直す行数
     
     # データ保持期間（日数）
     DATA_RETENTION_DAYS = 30
 
+    # メンテナンス（保持期間を過ぎたデータの削除と圧縮）
+    MAINTENANCE_INTERVAL_HOURS = 24  # 実行間隔
+    PURGE_BATCH_SIZE = 200  # 1トランザクションで削除する行数（書き込みロックを長く持たない）
+    VACUUM_PAGES_PER_STEP = 256  # incremental_vacuumで1回に返すページ数
+    MAINTENANCE_PAUSE_SECONDS = 0.05  # バッチの間に他の処理を通すための待ち時間
+
+    # 接続設定
+    READER_POOL_SIZE = 4  # 読み取り専用接続の数
+    STATEMENT_CACHE_SIZE = 128  # 接続ごとのプリペアドステートメントキャッシュ数
+    BUSY_TIMEOUT_SECONDS = 5  # ロック待ちのタイムアウト
+
+    # 非同期アクセス設定
+    ASYNC_EXECUTOR_WORKERS = 1  # DB専用スレッドの数
+    ASYNC_QUEUE_MAX_SIZE = 64  # 同時に投入できるDB処理の上限
+
+    # 復号済みクッキーのキャッシュ
+    COOKIE_CACHE_MAX_SIZE = 1024  # 保持する最大ユーザー数
+    COOKIE_CACHE_TTL_SECONDS = 600  # 有効期間（秒）
+
+    # 書き込みバッファ（ノートのスナップショット・チェック予定・DMチャンネルIDなど、失っても作り直せる書き込み）
+    WRITE_BEHIND_ENABLED = True  # Falseなら書き込みごとにコミットする
+    WRITE_BEHIND_INTERVAL_MS = 500  # まとめて書き込む間隔（ミリ秒）
+    WRITE_BEHIND_MAX_ROWS = 500  # この件数が溜まったら間隔を待たずに書き込む
+    WRITE_BEHIND_MAX_PENDING = 5000  # 書き込みが失敗し続けた場合に溜める上限（超えたら古いものから捨てる）
+
+    # リマインダー対象の一括取得
+    REMINDER_BATCH_SIZE = 200  # 1回のfetchで読む行数
+    DECRYPT_WORKERS = 4  # バッチ復号のスレッド数（1なら同じスレッドで復号）
+
 # ===== キャラクター名マッピング =====
 class CharacterNameMapping:
     """英語名→日本語名の変換マッピング"""
@@ -3,36 +3,58 @@
 HoYoLAB関連のコマンドコントローラー
 """
 
+import time
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import genshin
 
-from models.database import Database
+from config.constants import APIConstants, DatabaseConstants, NotificationConstants, HealthConstants
+from models.async_database import AsyncDatabase
+from services.circuit_breaker import CircuitOpenError
 from services.hoyolab_service import HoyolabService
+from services.key_rotation_service import KeyRotationService
+from services.maintenance_service import MaintenanceService
 from services.notification_service import NotificationService
+from services.resource_alert_service import ResourceAlertService
+from services.notes_service import NotesService
 from views.embeds import EmbedBuilder
 
 
 class HoyolabController(commands.Cog):
     """HoYoLAB関連のコマンドを処理するController"""
     
-    def __init__(self, bot: commands.Bot, database: Database):
+    def __init__(
+        self,
+        bot: commands.Bot,
+        database: AsyncDatabase,
+        hoyolab_service: HoyolabService,
+        notification_service: NotificationService
+    ):
         self.bot = bot
         self.database = database
-        self.hoyolab_service = HoyolabService()
-        self.notification_service = NotificationService(bot, database)
+        self.hoyolab_service = hoyolab_service
+        self.notes_service = NotesService(database, self.hoyolab_service)
+        self.notification_service = notification_service
+        self.maintenance_service = MaintenanceService(database)
+        self.key_rotation_service = KeyRotationService(database)
         self.resin_check_loop.start()  # 樹脂チェックタスク開始
+        self.account_refresh_loop.start()  # UID情報の更新タスク開始
+        self.maintenance_loop.start()  # 保持期間を過ぎたデータの削除タスク開始
+        self.key_rotation_loop.start()  # 暗号化キーの切り替えタスク開始
     
-    def cog_unload(self):
+    async def cog_unload(self):
         """Cog終了時にタスクを停止"""
         self.resin_check_loop.cancel()
+        self.account_refresh_loop.cancel()
+        self.maintenance_loop.cancel()
+        self.key_rotation_loop.cancel()
     
-    @tasks.loop(minutes=30)  # 30分ごとにチェック
+    @tasks.loop(seconds=NotificationConstants.SCHEDULER_TICK_SECONDS)
     async def resin_check_loop(self):
-        """定期的に樹脂をチェックして通知"""
+        """チェック時刻を迎えたユーザーの樹脂をチェックして通知"""
         try:
-            await self.notification_service.check_all_resin_reminders(self.hoyolab_service)
+            await self.notification_service.check_all_resin_reminders(self.notes_service)
         except Exception as e:
             print(f"樹脂チェックループエラー: {e}")
     
@@ -41,6 +63,48 @@ class HoyolabController(commands.Cog):
         """Bot起動完了を待つ"""
         await self.bot.wait_until_ready()
     
+    @tasks.loop(hours=APIConstants.ACCOUNT_REFRESH_INTERVAL_HOURS)
+    async def account_refresh_loop(self):
+        """保存済みのUID情報を定期的に更新（未保存のユーザーも補完）"""
+        try:
+            await self.hoyolab_service.refresh_stale_accounts(
+                self.database, self.notification_service.quarantine_on_failure
+            )
+        except Exception as e:
+            print(f"UID情報更新ループエラー: {e}")
+    
+    @account_refresh_loop.before_loop
+    async def before_account_refresh(self):
+        """Bot起動完了を待つ"""
+        await self.bot.wait_until_ready()
+    
+    @tasks.loop(hours=DatabaseConstants.MAINTENANCE_INTERVAL_HOURS)
+    async def maintenance_loop(self):
+        """保持期間を過ぎたデータを削除し、DBファイルを圧縮"""
+        try:
+            report = await self.maintenance_service.run()
+            print(report.summary())
+        except Exception as e:
+            print(f"メンテナンスループエラー: {e}")
+    
+    @maintenance_loop.before_loop
+    async def before_maintenance(self):
+        """Bot起動完了を待つ"""
+        await self.bot.wait_until_ready()
+    
+    @tasks.loop(minutes=DatabaseConstants.KEY_ROTATION_CHECK_MINUTES)
+    async def key_rotation_loop(self):
+        """キーファイルの変更を取り込み、古いキーのクッキーを暗号化し直す"""
+        try:
+            await self.key_rotation_service.run()
+        except Exception as e:
+            print(f"暗号化キー切り替えループエラー: {e}")
+    
+    @key_rotation_loop.before_loop
+    async def before_key_rotation(self):
+        """Bot起動完了を待つ"""
+        await self.bot.wait_until_ready()
+    
     @app_commands.command(name='help', description='Botの使い方とコマンド一覧を表示します')
     async def help(self, interaction: discord.Interaction):
         """ヘルプコマンド"""
@@ -74,7 +138,7 @@ class HoyolabController(commands.Cog):
                 return
             
             # テスト接続
-            success, accounts, error = await self.hoyolab_service.validate_cookies(cookie_dict)
+            success, accounts, error = await self.hoyolab_service.validate_cookies(cookie_dict, interaction.user.id)
             
             if not success:
                 await interaction.response.send_message(
@@ -84,9 +148,13 @@ class HoyolabController(commands.Cog):
                 return
             
             # データベースにクッキーを保存
-            if self.database.save_user_cookies(interaction.user.id, cookie_dict):
-                # 原神アカウント情報を取得
+            if await self.database.save_user_cookies(interaction.user.id, cookie_dict):
+                # 原神アカウント情報を取得（UIDは以降のコマンドで使うため保存）
                 genshin_accounts = [acc for acc in accounts if acc.game == genshin.Game.GENSHIN]
+                await self.database.save_genshin_accounts(
+                    interaction.user.id,
+                    self.hoyolab_service.to_account_rows(genshin_accounts)
+                )
                 embed = EmbedBuilder.cookie_set_embed(genshin_accounts)
                 await interaction.response.send_message(embed=embed, ephemeral=True)
             else:
@@ -102,9 +170,10 @@ class HoyolabController(commands.Cog):
             )
     
     @app_commands.command(name='user_status', description='現在のゲーム内状況を取得します')
-    async def status(self, interaction: discord.Interaction):
+    @app_commands.describe(refresh='HoYoLABから最新の情報を取得する（省略時は直近の取得結果から推定）')
+    async def status(self, interaction: discord.Interaction, refresh: bool = False):
         """ゲーム内状況表示コマンド"""
-        user_cookies = self.database.get_user_cookies(interaction.user.id)
+        user_cookies = await self.database.get_user_cookies(interaction.user.id)
         if not user_cookies:
             await interaction.response.send_message(
                 '❌ HoYoLABのクッキーが設定されていません。\n'
@@ -113,23 +182,45 @@ class HoyolabController(commands.Cog):
             )
             return
         
+        # クッキーが無効と判定済みならAPIを呼ばずに案内
+        if await self.database.get_user_health(interaction.user.id) == HealthConstants.INVALID_COOKIE:
+            await interaction.response.send_message(
+                f'❌ {HealthConstants.QUARANTINE_MESSAGES[HealthConstants.INVALID_COOKIE]}',
+                ephemeral=True
+            )
+            return
+        
         try:
             await interaction.response.defer()
             
             # ユーザー情報を取得
-            notes = await self.hoyolab_service.get_genshin_notes(user_cookies)
+            # 直近の取得結果が新しければAPIを呼ばずに推定値を使う
+            uid = await self.database.get_genshin_uid(interaction.user.id)
+            notes = await self.notes_service.get_notes(
+                interaction.user.id, user_cookies, uid=uid, refresh=refresh
+            )
             
             # Embedを生成して送信
             embed = EmbedBuilder.user_status_embed(notes)
-            embed.set_footer(text=f'HoYoLAB APIより取得 | UID: {interaction.user.id}')
+            if notes.is_estimated:
+                minutes = int(notes.age_seconds // 60)
+                source = f'{minutes}分前の取得結果から推定'
+            else:
+                source = 'HoYoLAB APIより取得'
+            embed.set_footer(text=f'{source} | UID: {interaction.user.id}')
             
             await interaction.followup.send(embed=embed)
         
         except genshin.errors.InvalidCookies:
+            await self.notification_service.quarantine_on_failure(
+                interaction.user.id, HealthConstants.INVALID_COOKIE
+            )
             await interaction.followup.send(
                 '❌ クッキーが無効です。新しいクッキーを設定してください。',
                 ephemeral=True
             )
+        except CircuitOpenError as e:
+            await interaction.followup.send(f'⏳ {e}', ephemeral=True)
         except Exception as e:
             await interaction.followup.send(
                 f'❌ エラーが発生しました: {str(e)}',
@@ -139,7 +230,7 @@ class HoyolabController(commands.Cog):
     @app_commands.command(name='characters', description='所持キャラクター一覧を表示します')
     async def characters(self, interaction: discord.Interaction):
         """キャラクター一覧表示コマンド"""
-        user_cookies = self.database.get_user_cookies(interaction.user.id)
+        user_cookies = await self.database.get_user_cookies(interaction.user.id)
         if not user_cookies:
             await interaction.response.send_message(
                 '❌ HoYoLABのクッキーが設定されていません。\n'
@@ -148,11 +239,21 @@ class HoyolabController(commands.Cog):
             )
             return
         
+        # クッキーが無効と判定済みならAPIを呼ばずに案内
+        if await self.database.get_user_health(interaction.user.id) == HealthConstants.INVALID_COOKIE:
+            await interaction.response.send_message(
+                f'❌ {HealthConstants.QUARANTINE_MESSAGES[HealthConstants.INVALID_COOKIE]}',
+                ephemeral=True
+            )
+            return
+        
         try:
             await interaction.response.defer()
             
             # キャラクター一覧を取得
-            characters = await self.hoyolab_service.get_genshin_characters(user_cookies)
+            uid = await self.database.get_genshin_uid(interaction.user.id)
+            roster = await self.hoyolab_service.get_genshin_roster(user_cookies, uid=uid, user_id=interaction.user.id)
+            characters = roster.characters
             
             if not characters:
                 await interaction.followup.send('キャラクターが見つかりませんでした。')
@@ -168,10 +269,28 @@ class HoyolabController(commands.Cog):
                 chars_by_element=chars_by_element,
                 element_order=ElementConstants.ELEMENT_ORDER
             )
-            embed.set_footer(text=f'HoYoLAB APIより取得 | UID: {interaction.user.id}')
+            if roster.from_cache:
+                fetched_at = int(time.time() - roster.age_seconds)
+                source = f'キャッシュ（{int(roster.age_seconds // 60)}分前に取得）'
+                if roster.refreshing:
+                    source += '・最新の一覧を取得中'
+                embed.description = f'{embed.description or ""}\n取得日時: <t:{fetched_at}:f>'.strip()
+            else:
+                source = 'HoYoLAB APIより取得'
+            embed.set_footer(text=f'{source} | UID: {interaction.user.id}')
             
             await interaction.followup.send(embed=embed)
         
+        except genshin.errors.InvalidCookies:
+            await self.notification_service.quarantine_on_failure(
+                interaction.user.id, HealthConstants.INVALID_COOKIE
+            )
+            await interaction.followup.send(
+                '❌ クッキーが無効です。新しいクッキーを設定してください。',
+                ephemeral=True
+            )
+        except CircuitOpenError as e:
+            await interaction.followup.send(f'⏳ {e}', ephemeral=True)
         except Exception as e:
             await interaction.followup.send(
                 f'❌ エラーが発生しました: {str(e)}',
@@ -181,26 +300,44 @@ class HoyolabController(commands.Cog):
     @app_commands.command(name='resin_notification', description='樹脂の自動通知を設定します')
     @app_commands.describe(
         enabled='通知を有効にするか',
-        threshold='通知する樹脂の閾値（デフォルト: 満タン）'
+        threshold='通知する樹脂の閾値（デフォルト: 満タン）',
+        renotify='閾値以上のまま再通知する間隔（分、デフォルト: 再通知しない）'
     )
     @app_commands.choices(enabled=[
         app_commands.Choice(name='有効', value='on'),
         app_commands.Choice(name='無効', value='off'),
     ])
-    async def resin_notification(self, interaction: discord.Interaction, enabled: str, threshold: int = None):
+    async def resin_notification(
+        self,
+        interaction: discord.Interaction,
+        enabled: str,
+        threshold: int = None,
+        renotify: int = None
+    ):
         """樹脂通知設定コマンド"""
-        # クッキーが設定されているか確認
-        user_cookies = self.database.get_user_cookies(interaction.user.id)
-        if not user_cookies:
-            await interaction.response.send_message(
-                '❌ HoYoLABのクッキーが設定されていません。\n'
-                'まず `/set_cookie` コマンドでクッキーを設定してください。',
-                ephemeral=True
-            )
-            return
-        
         is_enabled = (enabled == 'on')
         
+        # 有効にする場合だけ確認する（無効にする設定はクッキーがなくても隔離中でも保存する）
+        if is_enabled:
+            # クッキーが設定されているか確認
+            user_cookies = await self.database.get_user_cookies(interaction.user.id)
+            if not user_cookies:
+                await interaction.response.send_message(
+                    '❌ HoYoLABのクッキーが設定されていません。\n'
+                    'まず `/set_cookie` コマンドでクッキーを設定してください。',
+                    ephemeral=True
+                )
+                return
+            
+            # 隔離中は通知を送れないので、先に復帰方法を案内
+            health = await self.database.get_user_health(interaction.user.id)
+            if health in HealthConstants.QUARANTINE_MESSAGES:
+                await interaction.response.send_message(
+                    f'❌ {HealthConstants.QUARANTINE_MESSAGES[health]}',
+                    ephemeral=True
+                )
+                return
+        
         # 閾値のバリデーション
         if threshold is not None and (threshold < 1 or threshold > 200):
             await interaction.response.send_message(
@@ -209,17 +346,163 @@ class HoyolabController(commands.Cog):
             )
             return
         
-        # 設定を保存
+        max_renotify = NotificationConstants.MAX_RENOTIFY_MINUTES
+        if renotify is not None and (renotify < 0 or renotify > max_renotify):
+            await interaction.response.send_message(
+                f'❌ 再通知の間隔は0〜{max_renotify}分の範囲で設定してください。',
+                ephemeral=True
+            )
+            return
+        
+        renotify_minutes = renotify if renotify else NotificationConstants.DEFAULT_RENOTIFY_MINUTES
+        
+        # 設定を保存（設定を変えたら通知済みの記録もリセット）
         settings = {
             'resin_reminder_enabled': is_enabled,
-            'resin_threshold': threshold if threshold else 200
+            'resin_threshold': threshold if threshold else 200,
+            'resin_renotify_minutes': renotify_minutes,
+            'last_notified_at': None,
+            'last_notified_resin': None
         }
         
-        if self.database.save_user_settings(interaction.user.id, **settings):
+        if await self.database.save_user_settings(interaction.user.id, **settings):
+            # 設定変更をすぐに反映（次のループで即チェック。通知が1つも無ければ予定から外れる）
+            self.notification_service.scheduler.schedule(interaction.user.id, time.time(), exact=True)
+            
             embed = EmbedBuilder.resin_notification_settings_embed(
                 enabled=is_enabled,
-                threshold=threshold if threshold else 200
+                threshold=threshold if threshold else 200,
+                renotify_minutes=renotify_minutes
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        else:
+            await interaction.response.send_message(
+                '❌ 設定の保存に失敗しました。',
+                ephemeral=True
+            )
+    
+    @app_commands.command(name='resource_alert', description='樹脂以外の資源の自動通知を設定します')
+    @app_commands.describe(
+        kind='通知する資源',
+        enabled='通知を有効にするか',
+        threshold='洞天宝銭: 通知する量（デフォルト: 上限） / 探索派遣: 完了数（デフォルト: すべて） / デイリー任務: 通知する時刻（0〜23時、デフォルト: 20時）',
+        timezone='デイリー任務の時刻のタイムゾーン（例: Asia/Tokyo、デフォルト: 設定済みのもの、未設定ならUTC）'
+    )
+    @app_commands.choices(
+        kind=[
+            app_commands.Choice(name=label, value=kind)
+            for kind, label in NotificationConstants.RESOURCE_ALERT_LABELS.items()
+        ],
+        enabled=[
+            app_commands.Choice(name='有効', value='on'),
+            app_commands.Choice(name='無効', value='off'),
+        ]
+    )
+    async def resource_alert(
+        self,
+        interaction: discord.Interaction,
+        kind: str,
+        enabled: str,
+        threshold: int = None,
+        timezone: str = None
+    ):
+        """資源通知設定コマンド"""
+        user_id = interaction.user.id
+        label = NotificationConstants.RESOURCE_ALERT_LABELS[kind]
+        
+        if enabled != 'on':
+            if await self.database.delete_resource_alert(user_id, kind):
+                embed = EmbedBuilder.success_embed(
+                    title='資源通知設定完了',
+                    description=f'{label} の通知を無効にしました。'
+                )
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+            else:
+                await interaction.response.send_message('❌ 設定の保存に失敗しました。', ephemeral=True)
+            return
+        
+        # クッキーが設定されているか確認
+        user_cookies = await self.database.get_user_cookies(user_id)
+        if not user_cookies:
+            await interaction.response.send_message(
+                '❌ HoYoLABのクッキーが設定されていません。\n'
+                'まず `/set_cookie` コマンドでクッキーを設定してください。',
+                ephemeral=True
+            )
+            return
+        
+        # 隔離中は通知を送れないので、先に復帰方法を案内
+        health = await self.database.get_user_health(user_id)
+        if health in HealthConstants.QUARANTINE_MESSAGES:
+            await interaction.response.send_message(
+                f'❌ {HealthConstants.QUARANTINE_MESSAGES[health]}',
+                ephemeral=True
             )
+            return
+        
+        # 閾値のバリデーション（変換器は閾値を使わない）
+        error = None
+        if kind == 'transformer':
+            threshold = None
+        elif threshold is not None:
+            if kind == 'realm_currency' and threshold < 1:
+                error = '洞天宝銭の量は1以上で設定してください。'
+            elif kind == 'expeditions' and not 1 <= threshold <= 5:
+                error = '探索派遣の完了数は1〜5の範囲で設定してください。'
+            elif kind == 'commissions' and not 0 <= threshold <= 23:
+                error = 'デイリー任務の通知時刻は0〜23時の範囲で設定してください。'
+        if timezone is not None and ResourceAlertService.resolve_timezone(timezone) is None:
+            error = f'タイムゾーン `{timezone}` が見つかりません。`Asia/Tokyo` のような形式で指定してください。'
+        if error:
+            await interaction.response.send_message(f'❌ {error}', ephemeral=True)
+            return
+        
+        if not await self.database.save_resource_alert(user_id, kind, threshold):
+            await interaction.response.send_message('❌ 設定の保存に失敗しました。', ephemeral=True)
+            return
+        if timezone is not None and not await self.database.save_user_settings(user_id, timezone=timezone):
+            await interaction.response.send_message('❌ タイムゾーンの保存に失敗しました。', ephemeral=True)
+            return
+        
+        # 次のループで即チェック
+        self.notification_service.scheduler.schedule(user_id, time.time(), exact=True)
+        
+        if kind == 'realm_currency':
+            condition = f'{threshold}に達したら' if threshold else '上限に達したら'
+        elif kind == 'expeditions':
+            condition = f'{threshold}件完了したら' if threshold else 'すべて完了したら'
+        elif kind == 'commissions':
+            hour = threshold if threshold is not None else NotificationConstants.DEFAULT_COMMISSION_REMINDER_HOUR
+            if timezone is None:
+                settings = await self.database.get_user_settings(user_id)
+                timezone = (settings or {}).get('timezone') or 'UTC'
+            condition = f'{hour}時（{timezone}）を過ぎても未完了なら'
+        else:
+            condition = '使用可能になったら'
+        embed = EmbedBuilder.success_embed(
+            title='資源通知設定完了',
+            description=f'{label} が{condition}DMで通知します。\n'
+                        '樹脂の通知と同じ取得結果から判定するため、APIの呼び出しは増えません。'
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    @app_commands.command(name='notification_digest', description='通知をまとめて1通で受け取るか設定します')
+    @app_commands.describe(enabled='通知をまとめて受け取るか')
+    @app_commands.choices(enabled=[
+        app_commands.Choice(name='有効', value='on'),
+        app_commands.Choice(name='無効', value='off'),
+    ])
+    async def notification_digest(self, interaction: discord.Interaction, enabled: str):
+        """ダイジェスト設定コマンド"""
+        is_enabled = (enabled == 'on')
+        
+        if await self.database.save_user_settings(interaction.user.id, digest_enabled=is_enabled):
+            window = NotificationConstants.DIGEST_WINDOW_MINUTES
+            if is_enabled:
+                description = f'最初の通知から{window}分以内に届いた通知を、1通のDMにまとめて送ります。'
+            else:
+                description = '通知をそのつど送ります。'
+            embed = EmbedBuilder.success_embed(title='通知まとめ設定完了', description=description)
             await interaction.response.send_message(embed=embed, ephemeral=True)
         else:
             await interaction.response.send_message(
@@ -230,7 +513,8 @@ class HoyolabController(commands.Cog):
     @app_commands.command(name='delete_cookie', description='保存されたクッキーを削除します')
     async def delete_cookie(self, interaction: discord.Interaction):
         """クッキー削除コマンド"""
-        if self.database.delete_user_cookies(interaction.user.id):
+        if await self.database.delete_user_cookies(interaction.user.id):
+            self.hoyolab_service.client_pool.discard(interaction.user.id)
             embed = EmbedBuilder.success_embed(
                 title='クッキー削除完了',
                 description='保存されていたHoYoLABクッキーを削除しました。'
@@ -245,5 +529,5 @@ class HoyolabController(commands.Cog):
 
 async def setup(bot: commands.Bot):
     """Cogをセットアップ"""
-    # bot.databaseはbot.pyで初期化済み
-    await bot.add_cog(HoyolabController(bot, bot.database))
+    # bot.database・bot.hoyolab_service・bot.notification_serviceはbot.pyで初期化済み
+    await bot.add_cog(HoyolabController(bot, bot.database, bot.hoyolab_service, bot.notification_service))
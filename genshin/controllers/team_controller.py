@@ -8,8 +8,11 @@ from discord.ext import commands
 from discord import app_commands
 import genshin
 
-from models.database import Database
+from config.constants import HealthConstants
+from models.async_database import AsyncDatabase
+from services.circuit_breaker import CircuitOpenError
 from services.hoyolab_service import HoyolabService
+from services.notification_service import NotificationService
 from services.team_service import TeamService
 from views.embeds import EmbedBuilder
 
@@ -17,16 +20,23 @@ from views.embeds import EmbedBuilder
 class TeamController(commands.Cog):
     """チーム編成関連のコマンドを処理するController"""
     
-    def __init__(self, bot: commands.Bot, database: Database):
+    def __init__(
+        self,
+        bot: commands.Bot,
+        database: AsyncDatabase,
+        hoyolab_service: HoyolabService,
+        notification_service: NotificationService
+    ):
         self.bot = bot
         self.database = database
-        self.hoyolab_service = HoyolabService()
+        self.hoyolab_service = hoyolab_service
+        self.notification_service = notification_service
         self.team_service = TeamService()
     
     @app_commands.command(name='team_generator', description='所持キャラからランダムなチーム編成を提案します')
     async def team_generator(self, interaction: discord.Interaction):
         """チーム編成生成コマンド"""
-        user_cookies = self.database.get_user_cookies(interaction.user.id)
+        user_cookies = await self.database.get_user_cookies(interaction.user.id)
         if not user_cookies:
             await interaction.response.send_message(
                 '❌ HoYoLABのクッキーが設定されていません。\n'
@@ -35,11 +45,20 @@ class TeamController(commands.Cog):
             )
             return
         
+        # クッキーが無効と判定済みならAPIを呼ばずに案内
+        if await self.database.get_user_health(interaction.user.id) == HealthConstants.INVALID_COOKIE:
+            await interaction.response.send_message(
+                f'❌ {HealthConstants.QUARANTINE_MESSAGES[HealthConstants.INVALID_COOKIE]}',
+                ephemeral=True
+            )
+            return
+        
         try:
             await interaction.response.defer()
             
             # HoYoLAB APIから所持キャラを取得
-            characters = await self.hoyolab_service.get_genshin_characters(user_cookies)
+            uid = await self.database.get_genshin_uid(interaction.user.id)
+            characters = await self.hoyolab_service.get_genshin_characters(user_cookies, uid=uid, user_id=interaction.user.id)
             
             if not characters:
                 await interaction.followup.send('❌ キャラクターが見つかりませんでした。')
@@ -66,10 +85,15 @@ class TeamController(commands.Cog):
             await interaction.followup.send(embed=embed)
         
         except genshin.errors.InvalidCookies:
+            await self.notification_service.quarantine_on_failure(
+                interaction.user.id, HealthConstants.INVALID_COOKIE
+            )
             await interaction.followup.send(
                 '❌ クッキーが無効です。新しいクッキーを設定してください。',
                 ephemeral=True
             )
+        except CircuitOpenError as e:
+            await interaction.followup.send(f'⏳ {e}', ephemeral=True)
         except Exception as e:
             await interaction.followup.send(
                 f'❌ エラーが発生しました: {str(e)}',
@@ -79,5 +103,5 @@ class TeamController(commands.Cog):
 
 async def setup(bot: commands.Bot):
     """Cogをセットアップ"""
-    # bot.databaseはbot.pyで初期化済み
-    await bot.add_cog(TeamController(bot, bot.database))
+    # bot.database・bot.hoyolab_service・bot.notification_serviceはbot.pyで初期化済み
+    await bot.add_cog(TeamController(bot, bot.database, bot.hoyolab_service, bot.notification_service))
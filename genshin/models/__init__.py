@@ -4,6 +4,12 @@ Model Layer - データ構造とDB操作
 """
 
 from .database import Database
-from .user import User
+from .async_database import AsyncDatabase
+from .user import User, ReminderTarget
+from .notes import NotesSnapshot
+from .alert import Alert, ResourceAlertSetting
 
-__all__ = ['Database', 'User']
+__all__ = [
+    'Database', 'AsyncDatabase', 'User', 'ReminderTarget', 'NotesSnapshot',
+    'Alert', 'ResourceAlertSetting'
+]
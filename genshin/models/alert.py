@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+通知する出来事のモデル
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class Alert:
+    """ユーザーに知らせる出来事（ダイジェストでは複数を1通にまとめる）"""
+    user_id: int
+    kind: str  # 出来事の種類（'resin' など。同じ種類は最新の1件だけ残す）
+    title: str
+    message: str
+    value: int  # 通知時点の値（通知済みの記録に使う）
+    triggered_at: float  # 検知した時刻（UNIX時間）
+
+
+@dataclass
+class ResourceAlertSetting:
+    """樹脂以外の資源の通知設定と通知状態"""
+    kind: str  # 'realm_currency' / 'transformer' / 'expeditions' / 'commissions'
+    threshold: Optional[int] = None  # 種類ごとの閾値（Noneなら既定値）
+    last_notified_at: Optional[float] = None  # 最後に通知した時刻（UNIX時間）
+    last_notified_value: Optional[int] = None  # 最後に通知したときの値
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+非同期データベースアクセス層
+Databaseの同期メソッドを専用スレッドで実行し、イベントループを止めない
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Callable, AsyncIterator
+
+from config.constants import DatabaseConstants
+from models.alert import ResourceAlertSetting
+from models.database import Database
+from models.notes import NotesSnapshot
+from models.user import ReminderTarget
+
+
+class AsyncDatabase:
+    """Databaseの非同期ラッパー（SQLiteとFernetの処理をDB専用スレッドに逃がす）"""
+
+    def __init__(
+        self,
+        database: Database,
+        max_pending: int = DatabaseConstants.ASYNC_QUEUE_MAX_SIZE,
+        workers: int = DatabaseConstants.ASYNC_EXECUTOR_WORKERS
+    ):
+        """
+        非同期ラッパーを初期化
+
+        Args:
+            database: ラップするDatabaseインスタンス
+            max_pending: 同時に投入できる処理の上限（超えると呼び出し側が待機する）
+            workers: DB専用スレッドの数
+        """
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='database')
+        self._max_pending = max_pending
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        同期関数をDBスレッドで実行
+
+        キューが上限に達している場合は空きが出るまで待機する（バックプレッシャー）
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+
+        self._pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._executor, functools.partial(func, *args, **kwargs)
+                )
+        finally:
+            self._pending -= 1
+
+    @property
+    def pending(self) -> int:
+        """投入待ち・実行待ち・実行中の処理数"""
+        return self._pending
+
+    def close(self) -> None:
+        """実行中の処理を待ってからDBを閉じる"""
+        self._executor.shutdown(wait=True)
+        self.database.close()
+
+    # === クッキー関連のメソッド ===
+
+    async def save_user_cookies(self, user_id: int, cookies: dict) -> bool:
+        """ユーザーのクッキーを暗号化して保存"""
+        return await self._run(self.database.save_user_cookies, user_id, cookies)
+
+    async def get_user_cookies(self, user_id: int) -> Optional[dict]:
+        """ユーザーのクッキーを復号化して取得"""
+        return await self._run(self.database.get_user_cookies, user_id)
+
+    async def delete_user_cookies(self, user_id: int) -> bool:
+        """ユーザーのクッキーを削除"""
+        return await self._run(self.database.delete_user_cookies, user_id)
+
+    # === ユーザーの状態（隔離）関連のメソッド ===
+
+    async def get_user_health(self, user_id: int) -> Optional[str]:
+        """ユーザーの状態を取得"""
+        return await self._run(self.database.get_user_health, user_id)
+
+    async def record_health_failure(self, user_id: int, status: str, max_failures: int) -> bool:
+        """失敗を記録し、上限に達したら隔離"""
+        return await self._run(self.database.record_health_failure, user_id, status, max_failures)
+
+    async def reset_health_failures(self, user_ids: List[int]) -> bool:
+        """連続失敗回数をまとめて0に戻す"""
+        return await self._run(self.database.reset_health_failures, user_ids)
+
+    # === 原神アカウント関連のメソッド ===
+
+    async def save_genshin_accounts(self, user_id: int, accounts: List[Tuple[int, str, int, str]]) -> bool:
+        """ユーザーの原神アカウント一覧を保存"""
+        return await self._run(self.database.save_genshin_accounts, user_id, accounts)
+
+    async def get_genshin_uid(self, user_id: int) -> Optional[int]:
+        """ユーザーのメインの原神UIDを取得"""
+        return await self._run(self.database.get_genshin_uid, user_id)
+
+    async def get_users_needing_account_refresh(self, max_age_days: int, limit: int) -> List[int]:
+        """原神アカウント情報が未保存、または古くなったユーザーを取得"""
+        return await self._run(self.database.get_users_needing_account_refresh, max_age_days, limit)
+
+    async def mark_accounts_checked(self, user_ids: List[int]) -> bool:
+        """アカウント情報の更新を試みた時刻を記録"""
+        return await self._run(self.database.mark_accounts_checked, user_ids)
+
+    # === リアルタイムノート関連のメソッド ===
+
+    async def save_notes_snapshot(self, snapshot: NotesSnapshot) -> bool:
+        """リアルタイムノートのスナップショットを保存"""
+        return await self._run(self.database.save_notes_snapshot, snapshot)
+
+    async def get_notes_snapshot(self, user_id: int) -> Optional[NotesSnapshot]:
+        """リアルタイムノートのスナップショットを取得"""
+        return await self._run(self.database.get_notes_snapshot, user_id)
+
+    # === 設定関連のメソッド ===
+
+    async def save_user_settings(self, user_id: int, **settings) -> bool:
+        """ユーザー設定を保存"""
+        return await self._run(self.database.save_user_settings, user_id, **settings)
+
+    async def save_user_settings_bulk(self, rows: List[Tuple[int, Dict[str, Any]]]) -> bool:
+        """複数ユーザーの設定を1トランザクションでまとめて保存"""
+        return await self._run(self.database.save_user_settings_bulk, rows)
+
+    async def get_user_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """ユーザー設定を取得"""
+        return await self._run(self.database.get_user_settings, user_id)
+
+    async def delete_user_settings(self, user_id: int) -> bool:
+        """ユーザー設定を削除"""
+        return await self._run(self.database.delete_user_settings, user_id)
+
+    async def get_all_users_with_resin_reminder(self) -> List[Tuple[int, bool, int]]:
+        """樹脂リマインダーが有効なすべてのユーザーを取得"""
+        return await self._run(self.database.get_all_users_with_resin_reminder)
+
+    async def iter_reminder_targets(self, user_ids: Optional[List[int]] = None) -> AsyncIterator[ReminderTarget]:
+        """リマインダー対象を順に取得（バッチの読み込みと復号はDBスレッドで行う）"""
+        batches = self.database.iter_reminder_target_batches(user_ids)
+        try:
+            while True:
+                batch = await self._run(next, batches, None)
+                if batch is None:
+                    break
+                for target in batch:
+                    yield target
+        finally:
+            await self._run(batches.close)
+
+    # === リマインダーのスケジュール関連のメソッド ===
+
+    async def get_reminder_schedule(self) -> List[Tuple[int, Optional[float]]]:
+        """リマインダー対象ユーザーと次回チェック時刻を取得"""
+        return await self._run(self.database.get_reminder_schedule)
+
+    async def save_reminder_schedules(self, rows: List[Tuple[int, float]]) -> bool:
+        """次回チェック時刻をまとめて保存"""
+        return await self._run(self.database.save_reminder_schedules, rows)
+
+    async def delete_reminder_schedule(self, user_id: int) -> bool:
+        """ユーザーの次回チェック時刻を削除"""
+        return await self._run(self.database.delete_reminder_schedule, user_id)
+
+    # === 資源通知関連のメソッド ===
+
+    async def get_resource_alerts(self, user_id: int) -> List[ResourceAlertSetting]:
+        """ユーザーの資源通知設定を取得"""
+        return await self._run(self.database.get_resource_alerts, user_id)
+
+    async def save_resource_alert(self, user_id: int, kind: str, threshold: Optional[int]) -> bool:
+        """資源通知を有効にする"""
+        return await self._run(self.database.save_resource_alert, user_id, kind, threshold)
+
+    async def delete_resource_alert(self, user_id: int, kind: str) -> bool:
+        """資源通知を無効にする"""
+        return await self._run(self.database.delete_resource_alert, user_id, kind)
+
+    async def mark_resource_alerts_sent(self, rows: List[Tuple[int, str, float, int]]) -> bool:
+        """資源通知の通知済み記録をまとめて保存"""
+        return await self._run(self.database.mark_resource_alerts_sent, rows)
+
+    async def clear_resource_alert_states(self, rows: List[Tuple[int, str]]) -> bool:
+        """資源通知の通知済み記録をまとめて消去"""
+        return await self._run(self.database.clear_resource_alert_states, rows)
+
+    # === DMチャンネル関連のメソッド ===
+
+    async def get_dm_channel_id(self, user_id: int) -> Optional[int]:
+        """保存済みのDMチャンネルIDを取得"""
+        return await self._run(self.database.get_dm_channel_id, user_id)
+
+    async def save_dm_channel_id(self, user_id: int, channel_id: int) -> bool:
+        """DMチャンネルIDを保存"""
+        return await self._run(self.database.save_dm_channel_id, user_id, channel_id)
+
+    async def delete_dm_channel_id(self, user_id: int) -> bool:
+        """DMチャンネルIDを削除"""
+        return await self._run(self.database.delete_dm_channel_id, user_id)
+
+    # === 送信キュー関連のメソッド ===
+
+    async def enqueue_outbound_message(self, user_id: int, payload: str, created_at: float) -> Optional[int]:
+        """送信待ちのメッセージを保存"""
+        return await self._run(self.database.enqueue_outbound_message, user_id, payload, created_at)
+
+    async def get_pending_outbound_messages(self) -> List[Tuple[int, int, str, int, float, float]]:
+        """送信待ちのメッセージをすべて取得"""
+        return await self._run(self.database.get_pending_outbound_messages)
+
+    async def update_outbound_message(self, message_id: int, attempts: int, next_attempt_at: float) -> bool:
+        """送信待ちのメッセージの再送予定を更新"""
+        return await self._run(self.database.update_outbound_message, message_id, attempts, next_attempt_at)
+
+    async def delete_outbound_message(self, message_id: int) -> bool:
+        """送信を終えたメッセージを削除"""
+        return await self._run(self.database.delete_outbound_message, message_id)
+
+    # === 保持期間・メンテナンス関連のメソッド ===
+
+    async def purge_abandoned_users(self, cutoff: float, batch_size: int) -> int:
+        """放置されたユーザーのデータを1バッチ分削除"""
+        return await self._run(self.database.purge_abandoned_users, cutoff, batch_size)
+
+    async def purge_expired_rows(self, table: str, cutoff: float, batch_size: int) -> int:
+        """保持期間を過ぎた行を1バッチ分削除"""
+        return await self._run(self.database.purge_expired_rows, table, cutoff, batch_size)
+
+    async def get_storage_stats(self) -> Dict[str, int]:
+        """DBファイルの使用状況を取得"""
+        return await self._run(self.database.get_storage_stats)
+
+    async def incremental_vacuum(self, pages: int) -> int:
+        """空きページを少しだけファイルから返す"""
+        return await self._run(self.database.incremental_vacuum, pages)
+
+    async def optimize(self) -> bool:
+        """クエリプランナーの統計を更新"""
+        return await self._run(self.database.optimize)
+
+    # === 暗号化キーの切り替え関連のメソッド ===
+
+    async def reload_encryption_keys(self) -> bool:
+        """キーファイルが変更されていれば読み直す"""
+        return await self._run(self.database.reload_encryption_keys)
+
+    async def reencrypt_cookies_batch(self, batch_size: int) -> Tuple[int, int, bool]:
+        """古いキーで暗号化されたクッキーを先頭のキーで暗号化し直す（1バッチ分）"""
+        return await self._run(self.database.reencrypt_cookies_batch, batch_size)
+
+    # === ユーザーデータの完全削除 ===
+
+    async def delete_all_user_data(self, user_id: int) -> bool:
+        """ユーザーの全データを削除（クッキーと設定の両方）"""
+        return await self._run(self.database.delete_all_user_data, user_id)
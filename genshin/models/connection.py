@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite接続管理
+長寿命の接続（書き込み1本＋読み取りプール）を保持して使い回す
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from config.constants import DatabaseConstants
+
+
+class ConnectionPool:
+    """SQLite接続プール（WALモード・書き込み接続1本＋読み取り接続複数本）"""
+
+    def __init__(
+        self,
+        db_path: str,
+        reader_count: int = DatabaseConstants.READER_POOL_SIZE,
+        cached_statements: int = DatabaseConstants.STATEMENT_CACHE_SIZE,
+        busy_timeout: float = DatabaseConstants.BUSY_TIMEOUT_SECONDS
+    ):
+        """
+        接続プールを初期化
+
+        Args:
+            db_path: データベースファイルのパス
+            reader_count: 読み取り専用接続の数
+            cached_statements: 接続ごとのプリペアドステートメントキャッシュ数
+            busy_timeout: ロック待ちのタイムアウト（秒）
+        """
+        self.db_path = db_path
+        self._cached_statements = cached_statements
+        self._busy_timeout = busy_timeout
+        self._closed = False
+
+        # 書き込みは1本の接続に直列化する（SQLiteの書き込みロックは1つだけ）
+        self._writer = self._connect()
+        # 新しいDBは削除で空いたページを少しずつ返せるようにする（既存のDBには効かない）
+        self._writer.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._writer_lock = threading.Lock()
+
+        # 読み取りはWALにより書き込みと並行して実行できる
+        self._readers: queue.Queue = queue.Queue(maxsize=reader_count)
+        self._all_readers: List[sqlite3.Connection] = []
+        for _ in range(reader_count):
+            conn = self._connect()
+            conn.execute('PRAGMA query_only=ON')
+            self._readers.put(conn)
+            self._all_readers.append(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        """共通設定で接続を作成"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self._busy_timeout,
+            check_same_thread=False,  # プール経由で複数スレッドから使う
+            cached_statements=self._cached_statements,
+            isolation_level=None  # トランザクションは明示的に制御する
+        )
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        書き込み用接続を取得（ブロック全体が1トランザクション）
+
+        正常終了でCOMMIT、例外発生時はROLLBACKする
+        """
+        with self._writer_lock:
+            conn = self._writer
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            else:
+                conn.execute('COMMIT')
+
+    def execute_script(self, script: str) -> None:
+        """
+        書き込み用接続でSQLスクリプトを実行（トランザクションはスクリプト側で書く）
+
+        execute()は結果の行を返さない文を1ステップしか実行しないため、
+        ステップごとに処理が進むPRAGMA（incremental_vacuumなど）はこちらで実行する
+        """
+        with self._writer_lock:
+            self._writer.executescript(script)
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """読み取り用接続をプールから借りる"""
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def close(self) -> None:
+        """すべての接続を閉じる"""
+        if self._closed:
+            return
+        self._closed = True
+
+        with self._writer_lock:
+            self._writer.close()
+        for conn in self._all_readers:
+            conn.close()
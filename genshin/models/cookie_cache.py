@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+復号済みクッキーのキャッシュ
+SELECT・Fernet復号を毎回行わないためのTTL付きLRUキャッシュ
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from config.constants import DatabaseConstants
+
+
+class _CacheEntry:
+    """キャッシュエントリ（平文はゼロ埋めできるようbytearrayで保持）"""
+
+    __slots__ = ('plaintext', 'expires_at')
+
+    def __init__(self, plaintext: bytearray, expires_at: float):
+        self.plaintext = plaintext
+        self.expires_at = expires_at
+
+    def wipe(self) -> None:
+        """平文をゼロ埋めする"""
+        self.plaintext[:] = bytes(len(self.plaintext))
+
+
+class CookieCache:
+    """復号済みクッキーのTTL付きLRUキャッシュ（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        max_size: int = DatabaseConstants.COOKIE_CACHE_MAX_SIZE,
+        ttl: float = DatabaseConstants.COOKIE_CACHE_TTL_SECONDS
+    ):
+        """
+        キャッシュを初期化
+
+        Args:
+            max_size: 保持する最大ユーザー数
+            ttl: エントリの有効期間（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[int, _CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0  # 無効化のたびに進める（古い読み取り結果の書き戻し防止）
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def version(self) -> int:
+        """現在の無効化バージョン（読み取り開始前に取得してput()に渡す）"""
+        return self._version
+
+    def get(self, user_id: int) -> Optional[dict]:
+        """
+        キャッシュからクッキーを取得
+
+        Args:
+            user_id: ユーザーID
+
+        Returns:
+            dict: クッキーの辞書（呼び出し側で変更してよいコピー）、なければNone
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry.expires_at <= time.monotonic():
+                self._remove(user_id)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return json.loads(entry.plaintext)
+
+    def put(self, user_id: int, plaintext: bytes, version: int) -> None:
+        """
+        復号済みクッキー（JSON）をキャッシュに保存
+
+        Args:
+            user_id: ユーザーID
+            plaintext: 復号済みのクッキーJSON
+            version: 読み取り開始時点のversion（その後に無効化があれば保存しない）
+        """
+        with self._lock:
+            if version != self._version:
+                return
+
+            self._remove(user_id)
+            self._entries[user_id] = _CacheEntry(
+                bytearray(plaintext), time.monotonic() + self.ttl
+            )
+
+            while len(self._entries) > self.max_size:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        """ユーザーのエントリを破棄（クッキー更新・削除時に呼ぶ）"""
+        with self._lock:
+            self._version += 1
+            self._remove(user_id)
+
+    def clear(self) -> None:
+        """すべてのエントリを破棄"""
+        with self._lock:
+            self._version += 1
+            for entry in self._entries.values():
+                entry.wipe()
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミス数などの統計を取得"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def _remove(self, user_id: int) -> None:
+        """エントリを削除して平文をゼロ埋め（ロック取得済みで呼ぶ）"""
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            entry.wipe()
@@ -5,82 +5,195 @@
 """
 
 import sqlite3
+import hashlib
 import json
 import os
-from cryptography.fernet import Fernet
-from typing import Optional, Dict, Any, List, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+from config.constants import DatabaseConstants, HealthConstants
+from models.connection import ConnectionPool
+from models.cookie_cache import CookieCache
+from models.migrations import migrate
+from models.write_buffer import WriteBuffer
+from models.alert import ResourceAlertSetting
+from models.notes import NotesSnapshot
+from models.user import ReminderTarget
+
+
+@dataclass(frozen=True)
+class _KeySet:
+    """キーファイルから読んだ暗号化キーの組（読み直すときは組ごと差し替える）"""
+    cipher: MultiFernet  # 先頭のキーで暗号化し、復号はすべてのキーを順に試す
+    fernets: Tuple[Fernet, ...]  # キーファイルの順（先頭が現在のキー）
+    fingerprint: str  # 先頭のキーの識別子
+    mtime: float  # 読んだときのキーファイルの更新時刻
 
 
 class Database:
     """データベース操作クラス（Cogではない純粋なDB層）"""
     
-    def __init__(self, db_path: str = 'user_data.db', key_path: str = 'encryption.key'):
+    def __init__(
+        self,
+        db_path: str = 'user_data.db',
+        key_path: str = 'encryption.key',
+        write_behind: bool = DatabaseConstants.WRITE_BEHIND_ENABLED
+    ):
         """
         データベースを初期化
         
         Args:
             db_path: データベースファイルのパス
-            key_path: 暗号化キーファイルのパス
+            key_path: 暗号化キーファイルのパス（1行に1つ、先頭が新しい書き込みに使うキー）
+            write_behind: 失っても作り直せる書き込みを溜めてまとめてコミットするか
+                          （クッキー・設定などは常にすぐコミットする）
         """
         self.db_path = db_path
         self.key_path = key_path
-        self.cipher = self._get_cipher()
+        self._keys = self._load_keys()
+        self._pool = ConnectionPool(db_path)
+        self.cookie_cache = CookieCache()
+        self._settings_column_names: Optional[frozenset] = None  # 書き換えられるuser_settingsのカラム
         self._init_database()
+        self._write_buffer = WriteBuffer(self._pool) if write_behind else None
+        # リマインダー対象のバッチ復号用（1なら呼び出し元のスレッドで復号）
+        self._decrypt_executor = (
+            ThreadPoolExecutor(max_workers=DatabaseConstants.DECRYPT_WORKERS, thread_name_prefix='decrypt')
+            if DatabaseConstants.DECRYPT_WORKERS > 1 else None
+        )
     
-    def _get_cipher(self) -> Fernet:
-        """暗号化キーを取得または生成"""
-        if os.path.exists(self.key_path):
-            with open(self.key_path, 'rb') as key_file:
-                key = key_file.read()
+    def close(self) -> None:
+        """書き込み待ちを書き込んでからデータベース接続を閉じる"""
+        if self._write_buffer is not None:
+            self._write_buffer.close()
+        if self._decrypt_executor is not None:
+            self._decrypt_executor.shutdown(wait=True)
+        self._pool.close()
+    
+    def _write_behind(self, table: str, key: int, sql: str, params: tuple, value: Any = None) -> None:
+        """
+        書き込みバッファに溜める（バッファを使わない設定ならすぐにコミット）
+        
+        Args:
+            table: テーブル名
+            key: 行を識別するキー（user_id）
+            sql: 何度実行しても同じ結果になるSQL
+            params: SQLのパラメーター
+            value: 書き込むまでの間、読み込みで返す値
+        """
+        if self._write_buffer is not None:
+            self._write_buffer.put(table, key, sql, params, value)
         else:
-            key = Fernet.generate_key()
+            with self._pool.writer() as conn:
+                conn.execute(sql, params)
+    
+    def _buffered(self, table: str, key: int) -> Any:
+        """書き込み待ちの値を取得（なければWriteBuffer.MISSING）"""
+        if self._write_buffer is None:
+            return WriteBuffer.MISSING
+        return self._write_buffer.get(table, key)
+    
+    def _discard_buffered(self, table: str, key: int) -> None:
+        """行を削除する前に書き込み待ちを破棄（削除した行を書き戻さない）"""
+        if self._write_buffer is not None:
+            self._write_buffer.discard(table, key)
+    
+    def flush_writes(self) -> int:
+        """
+        書き込み待ちをすぐに書き込む（テーブル全体を読む前など）
+        
+        Returns:
+            int: 書き込んだ件数
+        """
+        if self._write_buffer is None:
+            return 0
+        return self._write_buffer.flush()
+    
+    @property
+    def cipher(self) -> MultiFernet:
+        """現在の暗号化キー（先頭のキーで暗号化し、復号はすべてのキーを順に試す）"""
+        return self._keys.cipher
+    
+    @property
+    def key_fingerprint(self) -> str:
+        """現在の（先頭の）暗号化キーの識別子"""
+        return self._keys.fingerprint
+    
+    def _load_keys(self) -> _KeySet:
+        """
+        暗号化キーを読み込む（キーファイルがなければ生成）
+        
+        Returns:
+            _KeySet: 読み込んだキーの組
+        """
+        if not os.path.exists(self.key_path):
             with open(self.key_path, 'wb') as key_file:
-                key_file.write(key)
-        return Fernet(key)
+                key_file.write(Fernet.generate_key())
+        
+        mtime = os.path.getmtime(self.key_path)
+        with open(self.key_path, 'rb') as key_file:
+            keys = [line.strip() for line in key_file.read().splitlines() if line.strip()]
+        if not keys:
+            raise ValueError(f"暗号化キーがありません: {self.key_path}")
+        
+        fernets = tuple(Fernet(key) for key in keys)
+        return _KeySet(
+            cipher=MultiFernet(fernets),
+            fernets=fernets,
+            fingerprint=hashlib.sha256(keys[0]).hexdigest()[:16],
+            mtime=mtime
+        )
     
-    def _init_database(self) -> None:
-        """データベーステーブルを初期化"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # user_cookiesテーブル
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_cookies (
-                user_id INTEGER PRIMARY KEY,
-                encrypted_cookies TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # user_settingsテーブル
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_settings (
-                user_id INTEGER PRIMARY KEY,
-                resin_reminder_enabled BOOLEAN DEFAULT FALSE,
-                resin_threshold INTEGER DEFAULT 200,
-                notification_channel_id INTEGER,
-                timezone TEXT DEFAULT 'UTC',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    @staticmethod
+    def add_encryption_key(key_path: str = 'encryption.key') -> None:
+        """
+        新しい暗号化キーをキーファイルの先頭に追加（古いキーは復号用に残す）
         
-        # resin_thresholdカラムの追加（既存DBとの互換性のため）
-        try:
-            cursor.execute("SELECT resin_threshold FROM user_settings LIMIT 1")
-        except sqlite3.OperationalError:
-            cursor.execute("ALTER TABLE user_settings ADD COLUMN resin_threshold INTEGER DEFAULT 200")
-            print("データベースを更新しました: resin_threshold カラムを追加")
+        起動中のBotは次の再暗号化チェックでキーファイルを読み直すため、停止は不要
         
-        conn.commit()
-        conn.close()
+        Args:
+            key_path: 暗号化キーファイルのパス
+        """
+        with open(key_path, 'rb') as key_file:
+            current = key_file.read().strip()
+        temp_path = f'{key_path}.tmp'
+        with open(temp_path, 'wb') as key_file:
+            key_file.write(Fernet.generate_key() + b'\n' + current + b'\n')
+        os.replace(temp_path, key_path)
+    
+    def reload_encryption_keys(self) -> bool:
+        """
+        キーファイルが変更されていれば読み直す（読めなければ今のキーを使い続ける）
+        
+        Returns:
+            bool: 読み直したらTrue
+        """
+        try:
+            if os.path.getmtime(self.key_path) == self._keys.mtime:
+                return False
+            # 組を作ってから1回の代入で差し替える（他のスレッドが古いキーと新しい識別子を混ぜて読まない）
+            self._keys = self._load_keys()
+            print(f"暗号化キーを読み直しました（現在のキー: {self.key_fingerprint}）")
+            return True
+        except Exception as e:
+            print(f"暗号化キーの読み直しエラー（今のキーを使い続けます）: {e}")
+            return False
+    
+    def _init_database(self) -> None:
+        """未適用のマイグレーションを適用してテーブルを最新にする"""
+        migrate(self._pool)
     
     # === クッキー関連のメソッド ===
     
     def save_user_cookies(self, user_id: int, cookies: dict) -> bool:
         """
-        ユーザーのクッキーを暗号化して保存
+        ユーザーのクッキーを暗号化して保存（隔離状態も解除する）
+        
+        別のアカウントに切り替えた場合に前のアカウントのノートから推定しないよう、
+        ノートのスナップショットも削除する
         
         Args:
             user_id: ユーザーID
@@ -91,18 +204,20 @@ class Database:
         """
         try:
             cookies_json = json.dumps(cookies)
-            encrypted_cookies = self.cipher.encrypt(cookies_json.encode())
+            keys = self._keys
+            encrypted_cookies = keys.cipher.encrypt(cookies_json.encode())
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            self._discard_buffered('notes_snapshots', user_id)
+            with self._pool.writer() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO user_cookies (
+                        user_id, encrypted_cookies, key_fingerprint, health_status, health_failures, updated_at
+                    )
+                    VALUES (?, ?, ?, ?, 0, CURRENT_TIMESTAMP)
+                ''', (user_id, encrypted_cookies.decode(), keys.fingerprint, HealthConstants.VALID))
+                conn.execute('DELETE FROM notes_snapshots WHERE user_id = ?', (user_id,))
             
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_cookies (user_id, encrypted_cookies, updated_at)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            ''', (user_id, encrypted_cookies.decode()))
-            
-            conn.commit()
-            conn.close()
+            self.cookie_cache.invalidate(user_id)
             return True
         except Exception as e:
             print(f"クッキー保存エラー: {e}")
@@ -118,17 +233,21 @@ class Database:
         Returns:
             dict: クッキーの辞書、存在しない場合はNone
         """
+        cached = self.cookie_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT encrypted_cookies FROM user_cookies WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            conn.close()
+            version = self.cookie_cache.version
+            with self._pool.reader() as conn:
+                result = conn.execute(
+                    'SELECT encrypted_cookies FROM user_cookies WHERE user_id = ?', (user_id,)
+                ).fetchone()
             
             if result:
                 encrypted_cookies = result[0].encode()
                 decrypted_cookies = self.cipher.decrypt(encrypted_cookies)
+                self.cookie_cache.put(user_id, decrypted_cookies, version)
                 return json.loads(decrypted_cookies.decode())
             return None
         except Exception as e:
@@ -146,71 +265,350 @@ class Database:
             bool: 成功したらTrue
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM user_cookies WHERE user_id = ?', (user_id,))
-            conn.commit()
-            conn.close()
+            self._discard_buffered('notes_snapshots', user_id)
+            with self._pool.writer() as conn:
+                conn.execute('DELETE FROM user_cookies WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM genshin_accounts WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM notes_snapshots WHERE user_id = ?', (user_id,))
+            self.cookie_cache.invalidate(user_id)
             return True
         except Exception as e:
             print(f"クッキー削除エラー: {e}")
             return False
     
-    # === 設定関連のメソッド ===
+    # === ユーザーの状態（隔離）関連のメソッド ===
     
-    def save_user_settings(self, user_id: int, **settings) -> bool:
+    def get_user_health(self, user_id: int) -> Optional[str]:
         """
-        ユーザー設定を保存
+        ユーザーの状態を取得
         
         Args:
             user_id: ユーザーID
-            **settings: 設定項目（キーワード引数）
+            
+        Returns:
+            str: HealthConstantsの状態、クッキー未設定ならNone
+        """
+        try:
+            with self._pool.reader() as conn:
+                result = conn.execute(
+                    'SELECT health_status FROM user_cookies WHERE user_id = ?', (user_id,)
+                ).fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            print(f"状態取得エラー: {e}")
+            return None
+    
+    def record_health_failure(self, user_id: int, status: str, max_failures: int) -> bool:
+        """
+        失敗を記録し、連続失敗回数が上限に達したら隔離する
+        
+        Args:
+            user_id: ユーザーID
+            status: 隔離するときの状態
+            max_failures: 隔離するまでの連続失敗回数
+            
+        Returns:
+            bool: 今回の失敗で隔離したらTrue（既に隔離済みならFalse）
+        """
+        try:
+            with self._pool.writer() as conn:
+                row = conn.execute(
+                    'SELECT health_status, health_failures FROM user_cookies WHERE user_id = ?', (user_id,)
+                ).fetchone()
+                if row is None or row[0] != HealthConstants.VALID:
+                    return False
+                
+                failures = (row[1] or 0) + 1
+                quarantined = failures >= max_failures
+                conn.execute('''
+                    UPDATE user_cookies SET health_status = ?, health_failures = ?, quarantined_at = ?
+                    WHERE user_id = ?
+                ''', (
+                    status if quarantined else HealthConstants.VALID,
+                    failures,
+                    time.time() if quarantined else None,
+                    user_id
+                ))
+            return quarantined
+        except Exception as e:
+            print(f"状態保存エラー: {e}")
+            return False
+    
+    def reset_health_failures(self, user_ids: List[int]) -> bool:
+        """
+        正常に処理できたユーザーの連続失敗回数をまとめて0に戻す
+        
+        Args:
+            user_ids: ユーザーIDのリスト
             
         Returns:
             bool: 成功したらTrue
         """
+        if not user_ids:
+            return True
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            batch_size = DatabaseConstants.REMINDER_BATCH_SIZE
+            with self._pool.writer() as conn:
+                for i in range(0, len(user_ids), batch_size):
+                    chunk = user_ids[i:i + batch_size]
+                    placeholders = ', '.join('?' * len(chunk))
+                    conn.execute(f'''
+                        UPDATE user_cookies SET health_failures = 0
+                        WHERE user_id IN ({placeholders}) AND health_status = ?
+                    ''', [*chunk, HealthConstants.VALID])
+            return True
+        except Exception as e:
+            print(f"状態保存エラー: {e}")
+            return False
+    
+    # === 原神アカウント関連のメソッド ===
+    
+    def save_genshin_accounts(self, user_id: int, accounts: List[Tuple[int, str, int, str]]) -> bool:
+        """
+        ユーザーの原神アカウント一覧を保存（既存の一覧は置き換え）
+        
+        Args:
+            user_id: ユーザーID
+            accounts: (uid, region, level, nickname) のリスト（先頭がメインアカウント）
             
-            # 既存の設定を確認
-            cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
-            existing = cursor.fetchone()
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            with self._pool.writer() as conn:
+                conn.execute('DELETE FROM genshin_accounts WHERE user_id = ?', (user_id,))
+                conn.executemany('''
+                    INSERT OR REPLACE INTO genshin_accounts (user_id, uid, region, level, nickname)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(user_id, *account) for account in accounts])
+            return True
+        except Exception as e:
+            print(f"アカウント保存エラー: {e}")
+            return False
+    
+    def get_genshin_uid(self, user_id: int) -> Optional[int]:
+        """
+        ユーザーのメインの原神UIDを取得
+        
+        Args:
+            user_id: ユーザーID
             
-            if existing:
-                # 更新
-                set_clause = []
-                values = []
-                for key, value in settings.items():
-                    set_clause.append(f"{key} = ?")
-                    values.append(value)
-                
-                if set_clause:
-                    values.append(user_id)
-                    cursor.execute(f'''
-                        UPDATE user_settings 
-                        SET {", ".join(set_clause)}, updated_at = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    ''', values)
-            else:
-                # 新規作成
-                columns = ['user_id'] + list(settings.keys())
-                placeholders = ['?'] * len(columns)
-                values = [user_id] + list(settings.values())
-                
-                cursor.execute(f'''
-                    INSERT INTO user_settings ({", ".join(columns)})
-                    VALUES ({", ".join(placeholders)})
-                ''', values)
+        Returns:
+            int: UID、保存されていない場合はNone
+        """
+        try:
+            with self._pool.reader() as conn:
+                result = conn.execute('''
+                    SELECT uid FROM genshin_accounts
+                    WHERE user_id = ?
+                    ORDER BY rowid
+                    LIMIT 1
+                ''', (user_id,)).fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            print(f"UID取得エラー: {e}")
+            return None
+    
+    def get_users_needing_account_refresh(self, max_age_days: int, limit: int) -> List[int]:
+        """
+        原神アカウント情報が未保存、または古くなったユーザーを取得
+        
+        更新を試みた時刻が古い順に返すので、アカウントがない・取得に失敗し続けるユーザーが
+        毎回先頭に来て他のユーザーの更新を止めることはない
+        
+        Args:
+            max_age_days: この日数より古い情報を更新対象にする
+            limit: 取得する最大人数
             
-            conn.commit()
-            conn.close()
+        Returns:
+            List[int]: ユーザーIDのリスト
+        """
+        try:
+            with self._pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT c.user_id
+                    FROM user_cookies c
+                    LEFT JOIN (
+                        SELECT user_id, MIN(updated_at) AS updated_at
+                        FROM genshin_accounts
+                        GROUP BY user_id
+                    ) a ON a.user_id = c.user_id
+                    WHERE (a.updated_at IS NULL OR a.updated_at < datetime('now', ?))
+                      AND c.health_status = 'valid'
+                    ORDER BY COALESCE(c.accounts_checked_at, 0)
+                    LIMIT ?
+                ''', (f'-{max_age_days} days', limit)).fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            print(f"アカウント更新対象取得エラー: {e}")
+            return []
+    
+    def mark_accounts_checked(self, user_ids: List[int]) -> bool:
+        """
+        アカウント情報の更新を試みた時刻を記録（成功・失敗にかかわらず）
+        
+        Args:
+            user_ids: ユーザーIDのリスト
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        if not user_ids:
+            return True
+        try:
+            placeholders = ', '.join('?' * len(user_ids))
+            with self._pool.writer() as conn:
+                conn.execute(f'''
+                    UPDATE user_cookies SET accounts_checked_at = ?
+                    WHERE user_id IN ({placeholders})
+                ''', (time.time(), *user_ids))
+            return True
+        except Exception as e:
+            print(f"アカウント更新時刻保存エラー: {e}")
+            return False
+    
+    # === リアルタイムノート関連のメソッド ===
+    
+    def save_notes_snapshot(self, snapshot: NotesSnapshot) -> bool:
+        """
+        リアルタイムノートのスナップショットを保存（書き込みバッファ経由）
+        
+        Args:
+            snapshot: スナップショット
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            self._write_behind('notes_snapshots', snapshot.user_id, '''
+                INSERT OR REPLACE INTO notes_snapshots (
+                    user_id, fetched_at, current_resin, max_resin, resin_recovery_seconds,
+                    current_realm_currency, max_realm_currency, realm_currency_recovery_seconds,
+                    transformer_recovery_seconds, completed_commissions, max_commissions,
+                    remaining_resin_discounts, max_resin_discounts, expedition_remaining_seconds
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', astuple(snapshot), snapshot)
+            return True
+        except Exception as e:
+            print(f"ノート保存エラー: {e}")
+            return False
+    
+    def get_notes_snapshot(self, user_id: int) -> Optional[NotesSnapshot]:
+        """
+        リアルタイムノートのスナップショットを取得
+        
+        Args:
+            user_id: ユーザーID
+            
+        Returns:
+            NotesSnapshot: スナップショット、存在しない場合はNone
+        """
+        buffered = self._buffered('notes_snapshots', user_id)
+        if buffered is not WriteBuffer.MISSING:
+            return buffered
+        
+        try:
+            with self._pool.reader() as conn:
+                result = conn.execute('''
+                    SELECT user_id, fetched_at, current_resin, max_resin, resin_recovery_seconds,
+                           current_realm_currency, max_realm_currency, realm_currency_recovery_seconds,
+                           transformer_recovery_seconds, completed_commissions, max_commissions,
+                           remaining_resin_discounts, max_resin_discounts, expedition_remaining_seconds
+                    FROM notes_snapshots WHERE user_id = ?
+                ''', (user_id,)).fetchone()
+            return NotesSnapshot(*result) if result else None
+        except Exception as e:
+            print(f"ノート取得エラー: {e}")
+            return None
+    
+    # === 設定関連のメソッド ===
+    
+    def _settings_columns(self, keys) -> List[str]:
+        """
+        設定項目の名前をスキーマと照合（SQLに埋め込むため、存在するカラムだけを許可する）
+        
+        Args:
+            keys: 設定項目の名前
+            
+        Returns:
+            List[str]: 設定項目の名前のリスト
+            
+        Raises:
+            ValueError: user_settingsにない、または書き換えられない項目が含まれている
+        """
+        if self._settings_column_names is None:
+            with self._pool.reader() as conn:
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(user_settings)')}
+            self._settings_column_names = frozenset(columns - {'user_id', 'created_at', 'updated_at'})
+        
+        columns = list(keys)
+        unknown = [column for column in columns if column not in self._settings_column_names]
+        if unknown:
+            raise ValueError(f"不明な設定項目です: {', '.join(unknown)}")
+        return columns
+    
+    @staticmethod
+    def _settings_upsert_sql(columns: List[str]) -> str:
+        """設定の1行をINSERTし、既にあれば指定した項目だけを更新するSQL"""
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        if not columns:
+            return f'INSERT INTO user_settings (user_id) VALUES ({placeholders}) ON CONFLICT(user_id) DO NOTHING'
+        assignments = ', '.join(f'{column} = excluded.{column}' for column in columns)
+        return f'''
+            INSERT INTO user_settings (user_id, {', '.join(columns)})
+            VALUES ({placeholders})
+            ON CONFLICT(user_id) DO UPDATE SET {assignments}, updated_at = CURRENT_TIMESTAMP
+        '''
+    
+    def save_user_settings(self, user_id: int, **settings) -> bool:
+        """
+        ユーザー設定を保存（1文のupsertで作成・更新する）
+        
+        Args:
+            user_id: ユーザーID
+            **settings: 設定項目（キーワード引数、user_settingsのカラム名）
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            columns = self._settings_columns(settings)
+            with self._pool.writer() as conn:
+                conn.execute(self._settings_upsert_sql(columns), [user_id, *settings.values()])
             return True
         except Exception as e:
             print(f"設定保存エラー: {e}")
             return False
     
+    def save_user_settings_bulk(self, rows: List[Tuple[int, Dict[str, Any]]]) -> bool:
+        """
+        複数ユーザーの設定を1トランザクションでまとめて保存
+        
+        同じ項目を書き換える行ごとにまとめてexecutemanyで実行する
+        
+        Args:
+            rows: (user_id, 設定項目の辞書) のリスト
+            
+        Returns:
+            bool: 成功したらTrue（1件でも失敗したら何も保存しない）
+        """
+        if not rows:
+            return True
+        try:
+            groups: Dict[Tuple[str, ...], List[List[Any]]] = {}
+            for user_id, settings in rows:
+                columns = tuple(self._settings_columns(settings))
+                groups.setdefault(columns, []).append([user_id, *settings.values()])
+            
+            with self._pool.writer() as conn:
+                for columns, params in groups.items():
+                    conn.executemany(self._settings_upsert_sql(list(columns)), params)
+            return True
+        except Exception as e:
+            print(f"設定一括保存エラー: {e}")
+            return False
+    
     def get_user_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
         """
         ユーザー設定を取得
@@ -222,18 +620,14 @@ class Database:
             dict: 設定の辞書、存在しない場合はNone
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                columns = [description[0] for description in cursor.description]
-                conn.close()
-                return dict(zip(columns, result))
+            with self._pool.reader() as conn:
+                cursor = conn.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
+                result = cursor.fetchone()
+                
+                if result:
+                    columns = [description[0] for description in cursor.description]
+                    return dict(zip(columns, result))
             
-            conn.close()
             return None
         except Exception as e:
             print(f"設定取得エラー: {e}")
@@ -250,12 +644,9 @@ class Database:
             bool: 成功したらTrue
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM user_settings WHERE user_id = ?', (user_id,))
-            conn.commit()
-            conn.close()
+            with self._pool.writer() as conn:
+                conn.execute('DELETE FROM user_settings WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM resource_alerts WHERE user_id = ?', (user_id,))
             return True
         except Exception as e:
             print(f"設定削除エラー: {e}")
@@ -269,22 +660,709 @@ class Database:
             List[Tuple]: (user_id, enabled, threshold) のリスト
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self._pool.reader() as conn:
+                users = conn.execute('''
+                    SELECT user_id, resin_reminder_enabled, resin_threshold
+                    FROM user_settings 
+                    WHERE resin_reminder_enabled = 1
+                ''').fetchall()
             
-            cursor.execute('''
-                SELECT user_id, resin_reminder_enabled, resin_threshold
-                FROM user_settings 
-                WHERE resin_reminder_enabled = 1
-            ''')
-            
-            users = cursor.fetchall()
-            conn.close()
             return users
         except Exception as e:
             print(f"ユーザー一覧取得エラー: {e}")
             return []
     
+    # 通知を1つ以上有効にしているユーザー（部分インデックスと主キーだけで求める）
+    _REMINDER_USERS = '''
+        reminder_users(user_id) AS (
+            SELECT user_id FROM user_settings WHERE resin_reminder_enabled = 1
+            UNION
+            SELECT user_id FROM resource_alerts
+        )
+    '''
+    
+    def iter_reminder_targets(
+        self,
+        user_ids: Optional[List[int]] = None,
+        batch_size: int = DatabaseConstants.REMINDER_BATCH_SIZE
+    ) -> Iterator[ReminderTarget]:
+        """
+        樹脂リマインダーが有効で、クッキーを設定済みのユーザーを順に取得
+        
+        Args:
+            user_ids: 対象を絞り込むユーザーIDのリスト（Noneなら全員）
+            batch_size: 1回のクエリで読む行数
+            
+        Yields:
+            ReminderTarget: 設定と復号済みクッキー
+        """
+        for batch in self.iter_reminder_target_batches(user_ids, batch_size):
+            yield from batch
+    
+    def iter_reminder_target_batches(
+        self,
+        user_ids: Optional[List[int]] = None,
+        batch_size: int = DatabaseConstants.REMINDER_BATCH_SIZE
+    ) -> Iterator[List[ReminderTarget]]:
+        """
+        リマインダー対象をバッチ単位で取得（設定とクッキーを1クエリでJOIN）
+        
+        バッチごとに読み取り接続を借りて返すため、yieldの間は接続もWALの読み取りスナップショットも持たない。
+        全員を読む場合はuser_idのキーセットページングで続きを読む
+        
+        Args:
+            user_ids: 対象を絞り込むユーザーIDのリスト（Noneなら全員）
+            batch_size: 1回のクエリで読む行数
+            
+        Yields:
+            List[ReminderTarget]: 復号済みのバッチ
+        """
+        try:
+            if user_ids is None:
+                after = 0
+                while True:
+                    rows, targets = self._read_reminder_batch(
+                        'c.user_id > ? ORDER BY c.user_id LIMIT ?', (after, batch_size)
+                    )
+                    if targets:
+                        yield targets
+                    if len(rows) < batch_size:
+                        break
+                    after = rows[-1][0]
+            else:
+                # IN句はバッチサイズごとに分割する
+                for i in range(0, len(user_ids), batch_size):
+                    chunk = user_ids[i:i + batch_size]
+                    placeholders = ', '.join('?' * len(chunk))
+                    _, targets = self._read_reminder_batch(f'c.user_id IN ({placeholders})', chunk)
+                    if targets:
+                        yield targets
+        except Exception as e:
+            print(f"リマインダー対象取得エラー: {e}")
+    
+    def _read_reminder_batch(self, condition: str, params) -> Tuple[List[Tuple], List[ReminderTarget]]:
+        """
+        リマインダー対象を1バッチ読み込んで復号（読み取り接続は復号の前に返す）
+        
+        Args:
+            condition: 絞り込み条件（WHERE c.health_status = 'valid' AND の後に続く）
+            params: 条件のパラメーター
+            
+        Returns:
+            tuple: (読み込んだ行, 復号できた対象)
+        """
+        query = f'''
+            WITH {self._REMINDER_USERS}
+            SELECT c.user_id, s.resin_threshold, c.encrypted_cookies,
+                   (SELECT a.uid FROM genshin_accounts a
+                    WHERE a.user_id = c.user_id ORDER BY a.rowid LIMIT 1) AS genshin_uid,
+                   s.resin_renotify_minutes, s.last_notified_at, s.last_notified_resin,
+                   s.digest_enabled, s.resin_reminder_enabled, c.health_failures, s.timezone
+            FROM reminder_users t
+            JOIN user_cookies c ON c.user_id = t.user_id
+            LEFT JOIN user_settings s ON s.user_id = c.user_id
+            WHERE c.health_status = 'valid' AND {condition}
+        '''
+        with self._pool.reader() as conn:
+            rows = conn.execute(query, params).fetchall()
+            alert_rows = self._read_resource_alerts(conn, [row[0] for row in rows])
+        targets = self._decrypt_reminder_rows(rows)
+        self._attach_resource_alerts(targets, alert_rows)
+        return rows, targets
+    
+    def _decrypt_reminder_rows(self, rows: List[Tuple]) -> List[ReminderTarget]:
+        """リマインダー対象の行をまとめて復号（復号できない行はスキップ）"""
+        mapper = self._decrypt_executor.map if self._decrypt_executor is not None else map
+        targets = []
+        for row, cookies in zip(rows, mapper(self._decrypt_cookies_or_none, [row[2] for row in rows])):
+            if cookies is None:
+                continue
+            (user_id, threshold, _, genshin_uid, renotify_minutes,
+             notified_at, notified_resin, digest, resin_enabled, health_failures, timezone) = row
+            targets.append(ReminderTarget(
+                user_id=user_id,
+                resin_threshold=threshold,
+                cookies=cookies,
+                genshin_uid=genshin_uid,
+                renotify_minutes=renotify_minutes or 0,
+                last_notified_at=notified_at,
+                last_notified_resin=notified_resin,
+                digest_enabled=bool(digest),
+                resin_reminder_enabled=bool(resin_enabled),
+                health_failures=health_failures or 0,
+                timezone=timezone or 'UTC'
+            ))
+        return targets
+    
+    @staticmethod
+    def _read_resource_alerts(conn: sqlite3.Connection, user_ids: List[int]) -> List[Tuple]:
+        """バッチ内のユーザーの資源通知設定を1クエリで読み込む"""
+        if not user_ids:
+            return []
+        placeholders = ', '.join('?' * len(user_ids))
+        return conn.execute(f'''
+            SELECT user_id, kind, threshold, last_notified_at, last_notified_value
+            FROM resource_alerts WHERE user_id IN ({placeholders})
+        ''', user_ids).fetchall()
+    
+    @staticmethod
+    def _attach_resource_alerts(targets: List[ReminderTarget], rows: List[Tuple]) -> None:
+        """資源通知設定を対象に付ける（復号できずに除いたユーザーの行は無視）"""
+        by_user = {target.user_id: target for target in targets}
+        for user_id, kind, threshold, notified_at, notified_value in rows:
+            if user_id not in by_user:
+                continue
+            by_user[user_id].resource_alerts[kind] = ResourceAlertSetting(
+                kind=kind,
+                threshold=threshold,
+                last_notified_at=notified_at,
+                last_notified_value=notified_value
+            )
+    
+    def _decrypt_cookies_or_none(self, encrypted_cookies: str) -> Optional[dict]:
+        """暗号化されたクッキーを復号（失敗したらNone）"""
+        try:
+            return json.loads(self.cipher.decrypt(encrypted_cookies.encode()))
+        except Exception as e:
+            print(f"クッキー復号エラー: {e}")
+            return None
+    
+    # === リマインダーのスケジュール関連のメソッド ===
+    
+    def get_reminder_schedule(self) -> List[Tuple[int, Optional[float]]]:
+        """
+        リマインダー対象ユーザーと次回チェック時刻を取得
+        
+        Returns:
+            List[Tuple]: (user_id, due_at) のリスト。未スケジュールならdue_atはNone
+        """
+        self.flush_writes()
+        try:
+            with self._pool.reader() as conn:
+                return conn.execute(f'''
+                    WITH {self._REMINDER_USERS}
+                    SELECT c.user_id, r.due_at
+                    FROM reminder_users t
+                    JOIN user_cookies c ON c.user_id = t.user_id
+                    LEFT JOIN reminder_schedule r ON r.user_id = c.user_id
+                    WHERE c.health_status = 'valid'
+                ''').fetchall()
+        except Exception as e:
+            print(f"スケジュール取得エラー: {e}")
+            return []
+    
+    def save_reminder_schedules(self, rows: List[Tuple[int, float]]) -> bool:
+        """
+        次回チェック時刻をまとめて保存（書き込みバッファ経由。バッファを使わない場合は1トランザクション）
+        
+        Args:
+            rows: (user_id, due_at) のリスト
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        sql = 'INSERT OR REPLACE INTO reminder_schedule (user_id, due_at) VALUES (?, ?)'
+        try:
+            if self._write_buffer is None:
+                with self._pool.writer() as conn:
+                    conn.executemany(sql, rows)
+            else:
+                for user_id, due_at in rows:
+                    self._write_buffer.put('reminder_schedule', user_id, sql, (user_id, due_at), due_at)
+            return True
+        except Exception as e:
+            print(f"スケジュール保存エラー: {e}")
+            return False
+    
+    def delete_reminder_schedule(self, user_id: int) -> bool:
+        """
+        ユーザーの次回チェック時刻を削除
+        
+        Args:
+            user_id: ユーザーID
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            self._discard_buffered('reminder_schedule', user_id)
+            with self._pool.writer() as conn:
+                conn.execute('DELETE FROM reminder_schedule WHERE user_id = ?', (user_id,))
+            return True
+        except Exception as e:
+            print(f"スケジュール削除エラー: {e}")
+            return False
+    
+    # === 資源通知関連のメソッド ===
+    
+    def get_resource_alerts(self, user_id: int) -> List[ResourceAlertSetting]:
+        """
+        ユーザーの資源通知設定を取得
+        
+        Args:
+            user_id: ユーザーID
+            
+        Returns:
+            List[ResourceAlertSetting]: 有効な資源通知のリスト
+        """
+        try:
+            with self._pool.reader() as conn:
+                rows = conn.execute('''
+                    SELECT kind, threshold, last_notified_at, last_notified_value
+                    FROM resource_alerts WHERE user_id = ?
+                ''', (user_id,)).fetchall()
+            return [ResourceAlertSetting(*row) for row in rows]
+        except Exception as e:
+            print(f"資源通知設定取得エラー: {e}")
+            return []
+    
+    def save_resource_alert(self, user_id: int, kind: str, threshold: Optional[int]) -> bool:
+        """
+        資源通知を有効にする（通知状態はリセット）
+        
+        Args:
+            user_id: ユーザーID
+            kind: 資源の種類
+            threshold: 閾値（Noneなら既定値）
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            with self._pool.writer() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO resource_alerts (user_id, kind, threshold)
+                    VALUES (?, ?, ?)
+                ''', (user_id, kind, threshold))
+            return True
+        except Exception as e:
+            print(f"資源通知設定保存エラー: {e}")
+            return False
+    
+    def delete_resource_alert(self, user_id: int, kind: str) -> bool:
+        """
+        資源通知を無効にする
+        
+        Args:
+            user_id: ユーザーID
+            kind: 資源の種類
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            with self._pool.writer() as conn:
+                conn.execute('DELETE FROM resource_alerts WHERE user_id = ? AND kind = ?', (user_id, kind))
+            return True
+        except Exception as e:
+            print(f"資源通知設定削除エラー: {e}")
+            return False
+    
+    def mark_resource_alerts_sent(self, rows: List[Tuple[int, str, float, int]]) -> bool:
+        """
+        資源通知の通知済み記録をまとめて保存
+        
+        Args:
+            rows: (user_id, kind, notified_at, notified_value) のリスト
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            with self._pool.writer() as conn:
+                conn.executemany('''
+                    UPDATE resource_alerts
+                    SET last_notified_at = ?, last_notified_value = ?
+                    WHERE user_id = ? AND kind = ?
+                ''', [(notified_at, value, user_id, kind) for user_id, kind, notified_at, value in rows])
+            return True
+        except Exception as e:
+            print(f"資源通知状態保存エラー: {e}")
+            return False
+    
+    def clear_resource_alert_states(self, rows: List[Tuple[int, str]]) -> bool:
+        """
+        資源通知の通知済み記録をまとめて消去
+        
+        Args:
+            rows: (user_id, kind) のリスト
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            with self._pool.writer() as conn:
+                conn.executemany('''
+                    UPDATE resource_alerts
+                    SET last_notified_at = NULL, last_notified_value = NULL
+                    WHERE user_id = ? AND kind = ?
+                ''', rows)
+            return True
+        except Exception as e:
+            print(f"資源通知状態消去エラー: {e}")
+            return False
+    
+    # === DMチャンネル関連のメソッド ===
+    
+    def get_dm_channel_id(self, user_id: int) -> Optional[int]:
+        """
+        保存済みのDMチャンネルIDを取得
+        
+        Args:
+            user_id: ユーザーID
+            
+        Returns:
+            int: チャンネルID、未保存ならNone
+        """
+        buffered = self._buffered('dm_channels', user_id)
+        if buffered is not WriteBuffer.MISSING:
+            return buffered
+        
+        try:
+            with self._pool.reader() as conn:
+                result = conn.execute(
+                    'SELECT channel_id FROM dm_channels WHERE user_id = ?', (user_id,)
+                ).fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            print(f"DMチャンネル取得エラー: {e}")
+            return None
+    
+    def save_dm_channel_id(self, user_id: int, channel_id: int) -> bool:
+        """
+        DMチャンネルIDを保存（書き込みバッファ経由）
+        
+        Args:
+            user_id: ユーザーID
+            channel_id: DMチャンネルID
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            self._write_behind('dm_channels', user_id, '''
+                INSERT OR REPLACE INTO dm_channels (user_id, channel_id, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (user_id, channel_id), channel_id)
+            return True
+        except Exception as e:
+            print(f"DMチャンネル保存エラー: {e}")
+            return False
+    
+    def delete_dm_channel_id(self, user_id: int) -> bool:
+        """
+        DMチャンネルIDを削除
+        
+        Args:
+            user_id: ユーザーID
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            self._discard_buffered('dm_channels', user_id)
+            with self._pool.writer() as conn:
+                conn.execute('DELETE FROM dm_channels WHERE user_id = ?', (user_id,))
+            return True
+        except Exception as e:
+            print(f"DMチャンネル削除エラー: {e}")
+            return False
+    
+    # === 送信キュー関連のメソッド ===
+    
+    def enqueue_outbound_message(self, user_id: int, payload: str, created_at: float) -> Optional[int]:
+        """
+        送信待ちのメッセージを保存
+        
+        Args:
+            user_id: 送信先のユーザーID
+            payload: EmbedのJSON
+            created_at: キューに入れた時刻（UNIX時間）
+            
+        Returns:
+            int: メッセージID、失敗したらNone
+        """
+        try:
+            with self._pool.writer() as conn:
+                cursor = conn.execute('''
+                    INSERT INTO outbound_messages (user_id, payload, next_attempt_at, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, payload, created_at, created_at))
+                return cursor.lastrowid
+        except Exception as e:
+            print(f"送信キュー保存エラー: {e}")
+            return None
+    
+    def get_pending_outbound_messages(self) -> List[Tuple[int, int, str, int, float, float]]:
+        """
+        送信待ちのメッセージをすべて取得（古い順）
+        
+        Returns:
+            List[Tuple]: (id, user_id, payload, attempts, next_attempt_at, created_at) のリスト
+        """
+        try:
+            with self._pool.reader() as conn:
+                return conn.execute('''
+                    SELECT id, user_id, payload, attempts, next_attempt_at, created_at
+                    FROM outbound_messages
+                    ORDER BY id
+                ''').fetchall()
+        except Exception as e:
+            print(f"送信キュー取得エラー: {e}")
+            return []
+    
+    def update_outbound_message(self, message_id: int, attempts: int, next_attempt_at: float) -> bool:
+        """
+        送信待ちのメッセージの再送予定を更新
+        
+        Args:
+            message_id: メッセージID
+            attempts: これまでの失敗回数
+            next_attempt_at: 次に送信する時刻（UNIX時間）
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            with self._pool.writer() as conn:
+                conn.execute('''
+                    UPDATE outbound_messages SET attempts = ?, next_attempt_at = ?
+                    WHERE id = ?
+                ''', (attempts, next_attempt_at, message_id))
+            return True
+        except Exception as e:
+            print(f"送信キュー更新エラー: {e}")
+            return False
+    
+    def delete_outbound_message(self, message_id: int) -> bool:
+        """
+        送信を終えたメッセージを削除
+        
+        Args:
+            message_id: メッセージID
+            
+        Returns:
+            bool: 成功したらTrue
+        """
+        try:
+            with self._pool.writer() as conn:
+                conn.execute('DELETE FROM outbound_messages WHERE id = ?', (message_id,))
+            return True
+        except Exception as e:
+            print(f"送信キュー削除エラー: {e}")
+            return False
+    
+    # === 保持期間・メンテナンス関連のメソッド ===
+    
+    # ユーザーごとのデータを持つテーブル（放置ユーザーの削除で使う）
+    _USER_TABLES = (
+        'user_cookies', 'user_settings', 'resource_alerts', 'reminder_schedule',
+        'dm_channels', 'genshin_accounts', 'notes_snapshots', 'outbound_messages'
+    )
+    
+    def purge_abandoned_users(self, cutoff: float, batch_size: int) -> int:
+        """
+        放置されたユーザーのデータを1バッチ分削除
+        
+        放置されたユーザー: 隔離されたまま保持期間を過ぎた、またはクッキーを削除したまま
+        設定が保持期間以上更新されていない
+        
+        Args:
+            cutoff: この時刻（UNIX時間）より前のものを削除する
+            batch_size: 1回で削除する最大人数（書き込みロックを長く持たないため小さくする）
+            
+        Returns:
+            int: 削除した人数（batch_size未満なら残りはない）
+        """
+        abandoned = '''
+            SELECT user_id FROM user_cookies
+            WHERE health_status != 'valid' AND quarantined_at < :cutoff
+            UNION
+            SELECT s.user_id FROM user_settings s
+            WHERE s.updated_at < datetime(:cutoff, 'unixepoch')
+              AND NOT EXISTS (SELECT 1 FROM user_cookies c WHERE c.user_id = s.user_id)
+        '''
+        try:
+            with self._pool.reader() as conn:
+                candidates = [row[0] for row in conn.execute(
+                    f'{abandoned} LIMIT :limit', {'cutoff': cutoff, 'limit': batch_size}
+                )]
+            if not candidates:
+                return 0
+            
+            # 削除した行が書き戻されないよう、削除の前に書き込み待ちを破棄する
+            # （破棄は書き込み中の完了を待つため、書き込みロックを取る前に行う）
+            for user_id in candidates:
+                for table in ('notes_snapshots', 'reminder_schedule', 'dm_channels'):
+                    self._discard_buffered(table, user_id)
+            
+            with self._pool.writer() as conn:
+                # 読んだ後にクッキーを設定し直したユーザーは除く
+                params = {f'u{i}': user_id for i, user_id in enumerate(candidates)}
+                params['cutoff'] = cutoff
+                placeholders = ', '.join(f':u{i}' for i in range(len(candidates)))
+                user_ids = [row[0] for row in conn.execute(
+                    f'SELECT user_id FROM ({abandoned}) WHERE user_id IN ({placeholders})', params
+                )]
+                if user_ids:
+                    placeholders = ', '.join('?' * len(user_ids))
+                    for table in self._USER_TABLES:
+                        conn.execute(f'DELETE FROM {table} WHERE user_id IN ({placeholders})', user_ids)
+            
+            for user_id in user_ids:
+                self.cookie_cache.invalidate(user_id)
+            return len(user_ids)
+        except Exception as e:
+            print(f"放置ユーザー削除エラー: {e}")
+            return 0
+    
+    def purge_expired_rows(self, table: str, cutoff: float, batch_size: int) -> int:
+        """
+        保持期間を過ぎた行を1バッチ分削除
+        
+        Args:
+            table: 'notes_snapshots'（取得時刻）または 'outbound_messages'（キューに入れた時刻）
+            cutoff: この時刻（UNIX時間）より前のものを削除する
+            batch_size: 1回で削除する最大行数
+            
+        Returns:
+            int: 削除した行数（batch_size未満なら残りはない）
+        """
+        column = {'notes_snapshots': 'fetched_at', 'outbound_messages': 'created_at'}[table]
+        try:
+            with self._pool.writer() as conn:
+                return conn.execute(f'''
+                    DELETE FROM {table} WHERE rowid IN (
+                        SELECT rowid FROM {table} WHERE {column} < ? LIMIT ?
+                    )
+                ''', (cutoff, batch_size)).rowcount
+        except Exception as e:
+            print(f"期限切れデータ削除エラー ({table}): {e}")
+            return 0
+    
+    def get_storage_stats(self) -> Dict[str, int]:
+        """
+        DBファイルの使用状況を取得
+        
+        Returns:
+            dict: bytes（ファイルサイズ）, free_bytes（空きページ）, auto_vacuum（2ならincremental）
+        """
+        with self._pool.reader() as conn:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        return {
+            'bytes': page_size * page_count,
+            'free_bytes': page_size * freelist,
+            'auto_vacuum': auto_vacuum
+        }
+    
+    def incremental_vacuum(self, pages: int) -> int:
+        """
+        空きページを少しだけファイルから返す（auto_vacuum=INCREMENTALのDBのみ効果がある）
+        
+        Args:
+            pages: 1回で返す最大ページ数
+            
+        Returns:
+            int: 残りの空きページ数
+        """
+        try:
+            self._pool.execute_script(f'PRAGMA incremental_vacuum({int(pages)});')
+            with self._pool.reader() as conn:
+                return conn.execute('PRAGMA freelist_count').fetchone()[0]
+        except Exception as e:
+            print(f"incremental_vacuumエラー: {e}")
+            return 0
+    
+    def optimize(self) -> bool:
+        """クエリプランナーの統計を更新（PRAGMA optimize）"""
+        try:
+            with self._pool.writer() as conn:
+                conn.execute('PRAGMA optimize')
+            return True
+        except Exception as e:
+            print(f"optimizeエラー: {e}")
+            return False
+    
+    # === 暗号化キーの切り替え関連のメソッド ===
+    
+    _REENCRYPT_STATE = 'reencrypt_cookies'
+    
+    def reencrypt_cookies_batch(self, batch_size: int) -> Tuple[int, int, bool]:
+        """
+        古いキーで暗号化されたクッキーを先頭のキーで暗号化し直す（1バッチ分）
+        
+        進捗（処理済みのuser_id）はmaintenance_stateに保存し、再起動しても続きから再開する。
+        先頭のキーが変わったら最初からやり直す。先頭のキーで暗号化済みと記録された行は読まず、
+        記録のない行（v6より前に保存した行）は1度だけ復号してキーを記録する。
+        復号と暗号化は書き込みロックの外で行い、書き込みは読んだときから変わっていない行だけを更新する
+        
+        Args:
+            batch_size: 1回で確認する行数
+            
+        Returns:
+            tuple: (暗号化し直した件数, どのキーでも復号できなかった件数, すべて終わったか)
+        """
+        keys = self._keys
+        fingerprint = keys.fingerprint
+        try:
+            with self._pool.reader() as conn:
+                state = conn.execute(
+                    'SELECT value FROM maintenance_state WHERE name = ?', (self._REENCRYPT_STATE,)
+                ).fetchone()
+                progress = json.loads(state[0]) if state else {}
+                if progress.get('key') != fingerprint:
+                    progress = {'key': fingerprint, 'after': 0, 'done': False}
+                if progress['done']:
+                    return 0, 0, True
+                rows = conn.execute('''
+                    SELECT user_id, encrypted_cookies FROM user_cookies
+                    WHERE user_id > ? AND (key_fingerprint IS NULL OR key_fingerprint != ?)
+                    ORDER BY user_id LIMIT ?
+                ''', (progress['after'], fingerprint, batch_size)).fetchall()
+            
+            updates = []
+            failed = 0
+            for user_id, encrypted_cookies in rows:
+                token = encrypted_cookies.encode()
+                # キーを順に試して1度だけ復号する（先頭のキーで復号できたら暗号文はそのまま）
+                for index, fernet in enumerate(keys.fernets):
+                    try:
+                        plaintext = fernet.decrypt(token)
+                    except InvalidToken:
+                        continue
+                    new_token = encrypted_cookies if index == 0 else keys.cipher.encrypt(plaintext).decode()
+                    updates.append((new_token, fingerprint, user_id, encrypted_cookies))
+                    break
+                else:
+                    failed += 1
+            
+            if rows:
+                progress['after'] = rows[-1][0]
+            progress['done'] = len(rows) < batch_size
+            with self._pool.writer() as conn:
+                rewritten = sum(
+                    conn.execute('''
+                        UPDATE user_cookies SET encrypted_cookies = ?, key_fingerprint = ?
+                        WHERE user_id = ? AND encrypted_cookies = ?
+                    ''', params).rowcount
+                    for params in updates if params[0] != params[3]
+                )
+                conn.executemany('''
+                    UPDATE user_cookies SET key_fingerprint = ?
+                    WHERE user_id = ? AND encrypted_cookies = ?
+                ''', [(fp, user_id, token) for token, fp, user_id, old in updates if token == old])
+                conn.execute(
+                    'INSERT OR REPLACE INTO maintenance_state (name, value) VALUES (?, ?)',
+                    (self._REENCRYPT_STATE, json.dumps(progress))
+                )
+            return rewritten, failed, progress['done']
+        except Exception as e:
+            print(f"クッキーの再暗号化エラー: {e}")
+            return 0, 0, True
+    
     # === ユーザーデータの完全削除 ===
     
     def delete_all_user_data(self, user_id: int) -> bool:
@@ -298,6 +1376,9 @@ class Database:
             bool: 成功したらTrue
         """
         try:
+            self.cookie_cache.invalidate(user_id)
+            self.delete_reminder_schedule(user_id)
+            self.delete_dm_channel_id(user_id)
             cookies_deleted = self.delete_user_cookies(user_id)
             settings_deleted = self.delete_user_settings(user_id)
             return cookies_deleted or settings_deleted
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+データベースのマイグレーション
+PRAGMA user_version でスキーマのバージョンを管理し、未適用のマイグレーションだけを1トランザクションで適用する
+"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+from models.connection import ConnectionPool
+
+
+# === マイグレーション ===
+# 追加するときは末尾に (バージョン, 説明, 関数) を足す。適用済みのものは変更しない
+
+def _create_baseline(conn: sqlite3.Connection) -> None:
+    """
+    バージョン管理を始める前のスキーマを作成
+
+    バージョン管理以前のDBにはテーブルが既にあり、カラムが足りないことがあるため、
+    このマイグレーションだけは既存のテーブルを確認して不足分を追加する
+    """
+    # user_cookiesテーブル
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_cookies (
+            user_id INTEGER PRIMARY KEY,
+            encrypted_cookies TEXT,
+            health_status TEXT DEFAULT 'valid',
+            health_failures INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # user_settingsテーブル
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            resin_reminder_enabled BOOLEAN DEFAULT FALSE,
+            resin_threshold INTEGER DEFAULT 200,
+            resin_renotify_minutes INTEGER DEFAULT 0,
+            last_notified_at REAL,
+            last_notified_resin INTEGER,
+            digest_enabled BOOLEAN DEFAULT FALSE,
+            notification_channel_id INTEGER,
+            timezone TEXT DEFAULT 'UTC',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # reminder_scheduleテーブル（次回の樹脂チェック時刻）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_schedule (
+            user_id INTEGER PRIMARY KEY,
+            due_at REAL NOT NULL
+        )
+    ''')
+
+    # genshin_accountsテーブル（クッキーに紐づく原神アカウント）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS genshin_accounts (
+            user_id INTEGER NOT NULL,
+            uid INTEGER NOT NULL,
+            region TEXT,
+            level INTEGER,
+            nickname TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, uid)
+        )
+    ''')
+
+    # notes_snapshotsテーブル（最後に取得したリアルタイムノート）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notes_snapshots (
+            user_id INTEGER PRIMARY KEY,
+            fetched_at REAL NOT NULL,
+            current_resin INTEGER,
+            max_resin INTEGER,
+            resin_recovery_seconds INTEGER,
+            current_realm_currency INTEGER,
+            max_realm_currency INTEGER,
+            realm_currency_recovery_seconds INTEGER,
+            transformer_recovery_seconds INTEGER,
+            completed_commissions INTEGER,
+            max_commissions INTEGER,
+            remaining_resin_discounts INTEGER,
+            max_resin_discounts INTEGER,
+            expedition_remaining_seconds TEXT DEFAULT ''
+        )
+    ''')
+
+    # resource_alertsテーブル（樹脂以外の資源の通知設定と通知状態）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS resource_alerts (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            threshold INTEGER,
+            last_notified_at REAL,
+            last_notified_value INTEGER,
+            PRIMARY KEY (user_id, kind)
+        )
+    ''')
+
+    # dm_channelsテーブル（通知先のDMチャンネル）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dm_channels (
+            user_id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # outbound_messagesテーブル（Discordへの送信待ち）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbound_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+    # バージョン管理以前に後から追加したカラム
+    for table, column, definition in (
+        ('user_settings', 'resin_threshold', 'INTEGER DEFAULT 200'),
+        ('user_settings', 'resin_renotify_minutes', 'INTEGER DEFAULT 0'),
+        ('user_settings', 'last_notified_at', 'REAL'),
+        ('user_settings', 'last_notified_resin', 'INTEGER'),
+        ('user_settings', 'digest_enabled', 'BOOLEAN DEFAULT FALSE'),
+        ('notes_snapshots', 'expedition_remaining_seconds', "TEXT DEFAULT ''"),
+        ('user_cookies', 'health_status', "TEXT DEFAULT 'valid'"),
+        ('user_cookies', 'health_failures', 'INTEGER DEFAULT 0'),
+    ):
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if column not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _create_reminder_indexes(conn: sqlite3.Connection) -> None:
+    """樹脂チェック対象の読み込みで全件走査しないためのインデックス"""
+    # 通知が有効なユーザーだけを持つ部分インデックス（rowid = user_idも持つので表を読まずに済む）
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_settings_resin_enabled
+        ON user_settings(resin_reminder_enabled) WHERE resin_reminder_enabled = 1
+    ''')
+
+
+def _add_quarantined_at(conn: sqlite3.Connection) -> None:
+    """隔離した時刻（保持期間を過ぎたら削除するため）"""
+    conn.execute('ALTER TABLE user_cookies ADD COLUMN quarantined_at REAL')
+    # 既に隔離済みのユーザーは今から数える
+    conn.execute('''
+        UPDATE user_cookies SET quarantined_at = CAST(strftime('%s', 'now') AS REAL)
+        WHERE health_status != 'valid'
+    ''')
+
+
+def _create_maintenance_state(conn: sqlite3.Connection) -> None:
+    """中断しても続きから再開するための、バックグラウンド処理の進捗"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+
+def _add_accounts_checked_at(conn: sqlite3.Connection) -> None:
+    """最後にアカウント情報の更新を試みた時刻（失敗しても更新対象を順番に回すため）"""
+    conn.execute('ALTER TABLE user_cookies ADD COLUMN accounts_checked_at REAL')
+
+
+def _add_key_fingerprint(conn: sqlite3.Connection) -> None:
+    """クッキーを暗号化したキーの識別子（再暗号化で先頭のキーの行を復号せずに飛ばすため）"""
+    # 既存の行はNULLのまま。再暗号化で1度だけ復号して記録する
+    conn.execute('ALTER TABLE user_cookies ADD COLUMN key_fingerprint TEXT')
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, '初期スキーマ', _create_baseline),
+    (2, '樹脂チェック対象のインデックス', _create_reminder_indexes),
+    (3, '隔離した時刻', _add_quarantined_at),
+    (4, 'メンテナンスの進捗', _create_maintenance_state),
+    (5, 'アカウント情報の更新を試みた時刻', _add_accounts_checked_at),
+    (6, 'クッキーを暗号化したキー', _add_key_fingerprint),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# === 実行 ===
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """DBのスキーマのバージョンを取得"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(pool: ConnectionPool) -> int:
+    """
+    未適用のマイグレーションを適用
+
+    最新ならPRAGMAを1回読むだけで終わる。適用する場合はすべてを1トランザクションで行い、
+    途中で失敗したら何も変更しない
+
+    Args:
+        pool: 接続プール
+
+    Returns:
+        int: 適用したマイグレーションの数
+    """
+    with pool.reader() as conn:
+        if get_schema_version(conn) >= LATEST_VERSION:
+            return 0
+
+    with pool.writer() as conn:
+        # 別プロセスが先に適用した場合に備えて、ロックを取ってから読み直す
+        current = get_schema_version(conn)
+        pending = [migration for migration in MIGRATIONS if migration[0] > current]
+        for version, description, apply in pending:
+            apply(conn)
+        if pending:
+            conn.execute(f'PRAGMA user_version = {pending[-1][0]}')
+
+    for version, description, _ in pending:
+        print(f"データベースを更新しました: v{version} {description}")
+    return len(pending)
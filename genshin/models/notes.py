@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+リアルタイムノートのスナップショット
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class NotesSnapshot:
+    """HoYoLABから取得したリアルタイムノートの記録（取得時点の値）"""
+    user_id: int
+    fetched_at: float  # 取得時刻（UNIX時間）
+    current_resin: int
+    max_resin: int
+    resin_recovery_seconds: int  # 満タンまでの残り秒数
+    current_realm_currency: int
+    max_realm_currency: int
+    realm_currency_recovery_seconds: int  # 洞天宝銭が満タンになるまでの残り秒数
+    transformer_recovery_seconds: Optional[int]  # 参量物質変換器の残り秒数（未入手ならNone）
+    completed_commissions: int
+    max_commissions: int
+    remaining_resin_discounts: int
+    max_resin_discounts: int
+    expedition_remaining_seconds: str = ''  # 各探索派遣の残り秒数（カンマ区切り）
@@ -3,9 +3,11 @@
 ユーザーデータモデル
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
+
+from models.alert import ResourceAlertSetting
 
 
 @dataclass
@@ -21,12 +23,33 @@ class User:
     updated_at: Optional[datetime] = None
 
 
+@dataclass
+class ReminderTarget:
+    """樹脂チェック対象（設定とクッキーを1件にまとめたもの）"""
+    user_id: int
+    resin_threshold: int
+    cookies: dict
+    genshin_uid: Optional[int] = None
+    renotify_minutes: int = 0  # 通知後も閾値以上のときに再通知する間隔（0なら状態が変わったときだけ）
+    last_notified_at: Optional[float] = None  # 最後に通知した時刻（UNIX時間）
+    last_notified_resin: Optional[int] = None  # 最後に通知したときの樹脂数
+    digest_enabled: bool = False  # 通知をまとめて1通で送るか
+    resin_reminder_enabled: bool = True  # Falseなら樹脂以外の通知だけをチェック
+    health_failures: int = 0  # 連続失敗回数（上限に達したら隔離）
+    timezone: str = 'UTC'  # 時刻で判定する通知（デイリー任務）に使うタイムゾーン
+    resource_alerts: Dict[str, ResourceAlertSetting] = field(default_factory=dict)  # 種類 -> 設定
+
+
 @dataclass
 class UserSettings:
     """ユーザー設定を表すデータクラス"""
     user_id: int
     resin_reminder_enabled: bool = False
     resin_threshold: int = 200
+    resin_renotify_minutes: int = 0
+    last_notified_at: Optional[float] = None
+    last_notified_resin: Optional[int] = None
+    digest_enabled: bool = False
     notification_channel_id: Optional[int] = None
     timezone: str = 'UTC'
     created_at: Optional[datetime] = None
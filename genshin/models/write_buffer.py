@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+書き込みバッファ（write-behind）
+失っても作り直せる書き込みを溜めて、一定時間または一定件数ごとに1トランザクションでまとめて書き込む
+"""
+
+import threading
+from typing import Any, Dict, Hashable, List, Tuple
+
+from config.constants import DatabaseConstants
+from models.connection import ConnectionPool
+
+
+class _PendingWrite:
+    """書き込み待ちの1行"""
+    __slots__ = ('sql', 'params', 'value')
+
+    def __init__(self, sql: str, params: tuple, value: Any):
+        self.sql = sql
+        self.params = params
+        self.value = value  # 書き込み前に読まれたときに返す値
+
+
+class WriteBuffer:
+    """同じキーへの書き込みは最新のものだけを残し、まとめてコミットする書き込みバッファ"""
+
+    MISSING = object()  # overlayにない場合の戻り値
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        interval_ms: int = DatabaseConstants.WRITE_BEHIND_INTERVAL_MS,
+        max_rows: int = DatabaseConstants.WRITE_BEHIND_MAX_ROWS,
+        max_pending: int = DatabaseConstants.WRITE_BEHIND_MAX_PENDING
+    ):
+        """
+        書き込みバッファを初期化し、書き込みスレッドを起動
+
+        Args:
+            pool: 接続プール
+            interval_ms: 書き込む間隔（ミリ秒）
+            max_rows: この件数が溜まったら間隔を待たずに書き込む
+            max_pending: 書き込みが失敗し続けた場合に溜める上限（超えたら古いものから捨てる）
+        """
+        self._pool = pool
+        self._interval = interval_ms / 1000
+        self._max_rows = max_rows
+        self._max_pending = max_pending
+        self._pending: Dict[Tuple[str, Hashable], _PendingWrite] = {}
+        self._lock = threading.Lock()  # _pendingの保護
+        self._flush_lock = threading.Lock()  # 書き込み中は破棄（discard）を待たせる
+        self._wake = threading.Event()
+        self._closed = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.dropped = 0  # 上限を超えて捨てた件数
+        self._dropped_logged = 0
+        self._thread = threading.Thread(target=self._run, name='database-write-behind', daemon=True)
+        self._thread.start()
+
+    # === 書き込み・読み込み ===
+
+    def put(self, table: str, key: Hashable, sql: str, params: tuple, value: Any = None) -> None:
+        """
+        書き込みを溜める（同じキーの書き込み待ちは置き換える）
+
+        上限を超えたら最も古い書き込み待ちを捨てる（どれも失っても作り直せる）
+
+        Args:
+            table: テーブル名
+            key: 行を識別するキー（通常はuser_id）
+            sql: 実行するSQL（INSERT OR REPLACEなど、何度実行しても同じ結果になるもの）
+            params: SQLのパラメーター
+            value: 書き込むまでの間、get()で返す値
+        """
+        with self._lock:
+            # 置き換えたものは末尾（新しい側）に移す
+            self._pending.pop((table, key), None)
+            self._pending[(table, key)] = _PendingWrite(sql, params, value)
+            while len(self._pending) > self._max_pending:
+                del self._pending[next(iter(self._pending))]
+                self.dropped += 1
+            full = len(self._pending) >= self._max_rows
+        if full:
+            self._wake.set()
+
+    def get(self, table: str, key: Hashable) -> Any:
+        """
+        書き込み待ちの値を取得（read-your-writes）
+
+        Returns:
+            書き込み待ちの値。なければ WriteBuffer.MISSING
+        """
+        with self._lock:
+            pending = self._pending.get((table, key))
+        return pending.value if pending is not None else self.MISSING
+
+    def discard(self, table: str, key: Hashable) -> None:
+        """
+        書き込み待ちを破棄（直後に行を削除する場合に、削除した行を書き戻さないようにする）
+
+        書き込み中ならその完了を待ってから破棄する
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._pending.pop((table, key), None)
+
+    @property
+    def depth(self) -> int:
+        """書き込み待ちの件数"""
+        return len(self._pending)
+
+    # === 書き込み ===
+
+    def flush(self) -> int:
+        """
+        書き込み待ちを1トランザクションで書き込む
+
+        書き込みが終わるまでは書き込み待ちとして残し、読み込みからも見えるようにする
+
+        Returns:
+            int: 書き込んだ件数
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.items())
+            if not batch:
+                return 0
+
+            # 同じSQLはexecutemanyでまとめて実行
+            groups: Dict[str, List[tuple]] = {}
+            for _, pending in batch:
+                groups.setdefault(pending.sql, []).append(pending.params)
+            try:
+                with self._pool.writer() as conn:
+                    for sql, params in groups.items():
+                        conn.executemany(sql, params)
+            except Exception as e:
+                print(f"書き込みバッファのエラー（次回に再試行）: {e}")
+                if self.dropped > self._dropped_logged:
+                    print(
+                        f"書き込みバッファが上限（{self._max_pending}件）を超えたため、"
+                        f"古い書き込み待ちを{self.dropped - self._dropped_logged}件捨てました"
+                    )
+                    self._dropped_logged = self.dropped
+                return 0
+
+            # 書き込み中に新しい値で置き換えられたものは残す
+            with self._lock:
+                for key, pending in batch:
+                    if self._pending.get(key) is pending:
+                        del self._pending[key]
+            self.flushes += 1
+            self.rows_written += len(batch)
+            return len(batch)
+
+    def _run(self) -> None:
+        """一定間隔、または件数が溜まったときに書き込む"""
+        while not self._closed:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._pending:
+                self.flush()
+
+    def close(self) -> None:
+        """書き込みスレッドを止め、残りを書き込む"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
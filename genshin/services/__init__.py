@@ -6,9 +6,15 @@ Service Layer - ビジネスロジック
 from .hoyolab_service import HoyolabService
 from .team_service import TeamService
 from .notification_service import NotificationService
+from .notes_service import NotesService
+from .maintenance_service import MaintenanceService
+from .key_rotation_service import KeyRotationService
 
 __all__ = [
     'HoyolabService',
     'TeamService',
-    'NotificationService'
+    'NotificationService',
+    'NotesService',
+    'MaintenanceService',
+    'KeyRotationService'
 ]
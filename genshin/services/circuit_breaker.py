@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+HoYoLAB APIのサーキットブレーカー
+障害中は呼び出しを止めて即座に失敗させ、応答待ちのコルーチンが溜まるのを防ぐ
+"""
+
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+from config.constants import APIConstants
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いていて呼び出しを止めている"""
+
+    def __init__(self, retry_after: float):
+        """
+        Args:
+            retry_after: 呼び出しを再開するまでの秒数の目安
+        """
+        self.retry_after = retry_after
+        super().__init__(
+            f"HoYoLABが応答していないため、リクエストを一時停止しています"
+            f"（約{max(1, math.ceil(retry_after))}秒後に再開）"
+        )
+
+
+class CircuitBreaker:
+    """直近のエラー率・遅延からAPIの障害を検知するサーキットブレーカー"""
+
+    CLOSED = 'closed'  # 通常どおり呼び出す
+    OPEN = 'open'  # 呼び出しを止めて即座に失敗させる
+    HALF_OPEN = 'half_open'  # 試しに少数だけ呼び出して回復を確認する
+
+    def __init__(
+        self,
+        name: str = 'HoYoLAB',
+        window_size: int = APIConstants.CIRCUIT_WINDOW_SIZE,
+        min_calls: int = APIConstants.CIRCUIT_MIN_CALLS,
+        failure_rate: float = APIConstants.CIRCUIT_FAILURE_RATE,
+        slow_call_seconds: float = APIConstants.CIRCUIT_SLOW_CALL_SECONDS,
+        slow_call_rate: float = APIConstants.CIRCUIT_SLOW_CALL_RATE,
+        open_seconds: float = APIConstants.CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = APIConstants.CIRCUIT_HALF_OPEN_PROBES
+    ):
+        """
+        サーキットブレーカーを初期化
+
+        Args:
+            name: ログに出す名前
+            window_size: エラー率を計算する直近の呼び出し件数
+            min_calls: 判定に必要な最小の呼び出し件数
+            failure_rate: この割合以上が失敗したら開く
+            slow_call_seconds: この秒数以上かかった呼び出しを遅延とみなす
+            slow_call_rate: この割合以上が遅延したら開く
+            open_seconds: 開いてから試行（half-open）に移るまでの秒数
+            half_open_probes: 試行中に同時に通す呼び出し数
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._state = self.CLOSED
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)  # (失敗, 遅延)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._generation = 0  # 状態が変わるたびに進める（呼び出しがどの状態で始まったかの識別）
+        self.rejected = 0  # 開いている間に止めた呼び出し数
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        """現在の状態（CLOSED / OPEN / HALF_OPEN）"""
+        return self._state
+
+    def check(self) -> None:
+        """
+        呼び出しを止めているか確認（枠は取らない。レート制限の待ちに入る前の確認用）
+
+        Raises:
+            CircuitOpenError: 開いている、または試行枠が埋まっている
+        """
+        if self._state == self.OPEN:
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(remaining)
+        elif self._state == self.HALF_OPEN and self._probes >= self.half_open_probes:
+            self.rejected += 1
+            raise CircuitOpenError(0)
+
+    def allow(self) -> int:
+        """
+        呼び出してよいか確認（通す場合は結果をrecordまたはreleaseで必ず報告する）
+
+        Returns:
+            int: 呼び出しを始めた時点の世代（recordとreleaseに渡す）
+
+        Raises:
+            CircuitOpenError: 開いている、または試行枠が埋まっている
+        """
+        if self._state == self.OPEN:
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(remaining)
+            self._transition(self.HALF_OPEN, '試行を開始')
+
+        if self._state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(0)
+            self._probes += 1
+
+        return self._generation
+
+    def record(self, latency: float, failed: bool, generation: int) -> None:
+        """
+        呼び出し結果を報告
+
+        別の状態のときに始まった呼び出し（開く前・試行に移る前に始まったものなど）の結果は判定に使わない。
+        試行中は、試行として通した呼び出しの結果だけで閉じるか開き直すかを決める
+
+        Args:
+            latency: 所要秒数
+            failed: APIの障害による失敗（タイムアウト・通信エラー・アクセス過多）ならTrue
+            generation: allowが返した世代
+        """
+        if generation != self._generation:
+            return
+
+        slow = latency >= self.slow_call_seconds
+
+        if self._state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if failed or slow:
+                self._open(f'試行が失敗 ({latency:.1f}秒)')
+            else:
+                self._transition(self.CLOSED, f'試行が成功 ({latency:.1f}秒)')
+            return
+
+        self._outcomes.append((failed, slow))
+        if len(self._outcomes) < self.min_calls:
+            return
+
+        failures = sum(1 for f, _ in self._outcomes if f)
+        slows = sum(1 for _, s in self._outcomes if s)
+        if failures / len(self._outcomes) >= self.failure_rate:
+            self._open(f'エラー率 {failures}/{len(self._outcomes)}')
+        elif slows / len(self._outcomes) >= self.slow_call_rate:
+            self._open(f'遅延率 {slows}/{len(self._outcomes)}')
+
+    def release(self, generation: int) -> None:
+        """結果を判定に使わずに呼び出しを終える（キャンセル時など）"""
+        if generation == self._generation and self._state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """状態と直近のエラー率などの統計を取得"""
+        total = len(self._outcomes)
+        return {
+            'state': self._state,
+            'window_calls': total,
+            'failure_rate': sum(1 for f, _ in self._outcomes if f) / total if total else 0.0,
+            'slow_rate': sum(1 for _, s in self._outcomes if s) / total if total else 0.0,
+            'rejected': self.rejected,
+            'times_opened': self.times_opened
+        }
+
+    def _open(self, reason: str) -> None:
+        """開いて呼び出しを止める"""
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+        self._transition(self.OPEN, f'{reason}、{self.open_seconds:.0f}秒間停止')
+
+    def _transition(self, state: str, reason: str) -> None:
+        """状態を変えてログに出す"""
+        print(f"サーキットブレーカー[{self.name}]: {self._state} -> {state} ({reason})")
+        self._state = state
+        self._generation += 1
+        self._outcomes.clear()
+        self._probes = 0
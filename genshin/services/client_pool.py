@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+genshin.Clientのプール
+ユーザーごとのClientと共有HTTP接続を使い回し、TLSハンドシェイクを減らす
+"""
+
+import time
+import types
+from collections import OrderedDict
+from typing import Optional, Hashable
+
+import aiohttp
+import genshin
+
+from config.constants import APIConstants
+
+
+class _PooledClient:
+    """プール内のClientと付随情報"""
+
+    __slots__ = ('client', 'cookies', 'last_used')
+
+    def __init__(self, client: genshin.Client, cookies: dict):
+        self.client = client
+        self.cookies = cookies
+        self.last_used = time.monotonic()
+
+
+class ClientPool:
+    """ユーザーごとのgenshin.Clientを保持するLRUプール（アイドル時間で破棄）"""
+
+    def __init__(
+        self,
+        max_size: int = APIConstants.CLIENT_POOL_MAX_SIZE,
+        idle_timeout: float = APIConstants.CLIENT_IDLE_TIMEOUT_SECONDS
+    ):
+        """
+        プールを初期化
+
+        Args:
+            max_size: 保持する最大Client数
+            idle_timeout: 使われていないClientを破棄するまでの秒数
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clients: 'OrderedDict[Hashable, _PooledClient]' = OrderedDict()
+        self._connector: Optional[aiohttp.TCPConnector] = None
+
+    def acquire(self, cookies: dict, key: Optional[Hashable] = None) -> genshin.Client:
+        """
+        Clientを取得（なければ作成）
+
+        Args:
+            cookies: クッキーの辞書
+            key: プールのキー（通常はDiscordのユーザーID。省略時はltuid_v2）
+
+        Returns:
+            genshin.Client: 共有接続を使うClient
+        """
+        self._prune()
+
+        if key is None:
+            key = cookies.get('ltuid_v2')
+
+        entry = self._clients.get(key)
+        if entry is not None and entry.cookies == cookies:
+            entry.last_used = time.monotonic()
+            self._clients.move_to_end(key)
+            return entry.client
+
+        # 初回、またはクッキーが更新された場合は作り直す
+        client = genshin.Client(cookies)
+        client.cookie_manager.create_session = self._create_session
+        self._disable_library_retry(client.cookie_manager)
+        self._clients[key] = _PooledClient(client, dict(cookies))
+        self._clients.move_to_end(key)
+
+        while len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+
+        return client
+
+    def discard(self, key: Hashable) -> None:
+        """Clientを破棄（クッキー削除時など）"""
+        self._clients.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    async def close(self) -> None:
+        """すべてのClientを破棄して共有接続を閉じる"""
+        self._clients.clear()
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+    def _create_session(self, **kwargs) -> aiohttp.ClientSession:
+        """
+        genshin.pyがリクエストごとに作るセッションを共有コネクタ上に作る
+
+        セッションを閉じてもコネクタは閉じないため、keep-alive接続が次のリクエストで再利用される
+        """
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=APIConstants.CONNECTION_LIMIT,
+                keepalive_timeout=APIConstants.KEEPALIVE_TIMEOUT_SECONDS
+            )
+
+        return aiohttp.ClientSession(
+            cookie_jar=aiohttp.DummyCookieJar(),
+            connector=self._connector,
+            connector_owner=False,
+            **kwargs
+        )
+
+    @staticmethod
+    def _disable_library_retry(manager) -> None:
+        """
+        genshin.pyのアクセス過多（VisitsTooFrequently）の自動リトライを外す
+
+        HoyolabServiceがバックオフ付きでリトライするため、二重にリトライすると
+        1回の呼び出しでAPIConstants.MAX_RETRIESを大きく超えてリクエストを送ってしまう
+        """
+        request = getattr(type(manager)._request, '__wrapped__', None)
+        if request is not None:
+            manager._request = types.MethodType(request, manager)
+
+    def _prune(self) -> None:
+        """アイドル時間を超えたClientを破棄（LRU順なので先頭から見る）"""
+        deadline = time.monotonic() - self.idle_timeout
+        while self._clients:
+            key, entry = next(iter(self._clients.items()))
+            if entry.last_used > deadline:
+                break
+            del self._clients[key]
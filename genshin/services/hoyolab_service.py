@@ -4,28 +4,141 @@ HoYoLAB API連携サービス
 APIとのやり取りやデータ取得を担当
 """
 
+import asyncio
+import random
+import time
+import aiohttp
 import genshin
-from typing import Optional, List, Tuple
-from config.constants import CharacterNameMapping, ElementConstants
+from typing import Any, Awaitable, Callable, Optional, List, Tuple
+from config.constants import APIConstants, CharacterNameMapping, ElementConstants, HealthConstants
+from services.circuit_breaker import CircuitBreaker
+from services.client_pool import ClientPool
+from services.rate_limiter import RateLimiter
+from services.roster_cache import Roster, RosterCache
+from services.single_flight import SingleFlight
 
 
 class HoyolabService:
     """HoYoLAB API連携サービスクラス"""
     
+    def __init__(self):
+        """HoYoLABサービスを初期化（全Controllerで1つを共有する）"""
+        self.client_pool = ClientPool()
+        self.roster_cache = RosterCache()
+        self.single_flight = SingleFlight()  # 同じユーザー・同じエンドポイント・同じ優先度の同時取得を1回にまとめる
+        self.rate_limiter = RateLimiter()  # HoYoLABへのリクエスト数をプロセス全体で制限する
+        self.circuit_breaker = CircuitBreaker()  # 障害中は呼び出しを止めて即座に失敗させる
+    
+    async def close(self) -> None:
+        """保持しているClientと接続を閉じる"""
+        await self.roster_cache.close()
+        await self.client_pool.close()
+    
+    # === リクエスト制御 ===
+    
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """
+        リトライで回復が見込めるエラーか判定
+        
+        Args:
+            error: 発生した例外
+            
+        Returns:
+            bool: 一時的なエラー（アクセス過多・通信エラー・タイムアウト）ならTrue
+        """
+        return isinstance(error, (
+            genshin.errors.VisitsTooFrequently,
+            genshin.errors.InternalDatabaseError,
+            aiohttp.ClientConnectionError,
+            asyncio.TimeoutError
+        ))
+    
     @staticmethod
-    async def validate_cookies(cookies: dict) -> Tuple[bool, Optional[List], Optional[str]]:
+    def backoff_delay(attempt: int) -> float:
+        """
+        リトライまでの待ち時間（指数バックオフ＋フルジッター）
+        
+        Args:
+            attempt: 失敗した回数（1始まり）
+            
+        Returns:
+            float: 待ち秒数
+        """
+        ceiling = min(
+            APIConstants.RETRY_MAX_DELAY_SECONDS,
+            APIConstants.RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+        )
+        return random.uniform(0, ceiling)
+    
+    async def _request(self, func: Callable[[], Awaitable[Any]], priority: int = RateLimiter.INTERACTIVE) -> Any:
+        """
+        レート制限・リトライ・期限付きでAPIを呼び出す
+        
+        リトライを含めた全体でAPIConstants.REQUEST_TIMEOUT秒を超えたらasyncio.TimeoutErrorを送出する
+        サーキットブレーカーが開いている間はAPIを呼ばずにCircuitOpenErrorを送出する
+        
+        Args:
+            func: API呼び出し（呼ぶたびに新しいリクエストを送る関数）
+            priority: RateLimiter.INTERACTIVE（コマンド）またはRateLimiter.BACKGROUND（定期処理）
+            
+        Returns:
+            Any: funcの戻り値
+        """
+        deadline = time.monotonic() + APIConstants.REQUEST_TIMEOUT
+        attempt = 0
+        
+        while True:
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                # 止めている間はレート制限の枠を待たず・使わずに失敗させる
+                self.circuit_breaker.check()
+                await asyncio.wait_for(self.rate_limiter.acquire(priority), timeout=remaining)
+                return await self._call_with_breaker(func, deadline)
+            except Exception as e:
+                if attempt > APIConstants.MAX_RETRIES or not self.is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                print(f"HoYoLAB APIリトライ ({attempt}/{APIConstants.MAX_RETRIES}, {delay:.1f}秒後): {e!r}")
+                await asyncio.sleep(delay)
+    
+    async def _call_with_breaker(self, func: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        """APIを1回呼び出し、結果をサーキットブレーカーに報告"""
+        generation = self.circuit_breaker.allow()
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(), timeout=deadline - started)
+        except asyncio.CancelledError:
+            self.circuit_breaker.release(generation)
+            raise
+        except Exception as e:
+            # クッキー無効などはAPIが応答しているので障害には数えない
+            self.circuit_breaker.record(time.monotonic() - started, failed=self.is_retryable(e), generation=generation)
+            raise
+        self.circuit_breaker.record(time.monotonic() - started, failed=False, generation=generation)
+        return result
+    
+    # === API呼び出し ===
+    
+    async def validate_cookies(self, cookies: dict, user_id: Optional[int] = None) -> Tuple[bool, Optional[List], Optional[str]]:
         """
         クッキーの有効性を検証
         
         Args:
             cookies: クッキーの辞書
+            user_id: DiscordのユーザーID（Clientプールのキー）
             
         Returns:
             Tuple[bool, List, str]: (成功フラグ, アカウントリスト, エラーメッセージ)
         """
         try:
-            client = genshin.Client(cookies)
-            accounts = await client.get_game_accounts()
+            client = self.client_pool.acquire(cookies, user_id)
+            accounts = await self._request(client.get_game_accounts)
             
             if not accounts:
                 return False, None, "アカウントが見つかりませんでした"
@@ -67,66 +180,180 @@ class HoyolabService:
         """
         return 'ltuid_v2' in cookies and 'ltoken_v2' in cookies
     
-    @staticmethod
-    async def get_genshin_notes(cookies: dict):
+    async def get_genshin_notes(
+        self,
+        cookies: dict,
+        user_id: Optional[int] = None,
+        uid: Optional[int] = None,
+        priority: int = RateLimiter.INTERACTIVE
+    ):
         """
         原神のリアルタイムノート（樹脂状況など）を取得
         
         Args:
             cookies: クッキーの辞書
+            user_id: DiscordのユーザーID（Clientプールのキー）
+            uid: 保存済みの原神UID（Noneの場合は自動取得）
+            priority: レート制限の優先度（定期処理はRateLimiter.BACKGROUND）
             
         Returns:
             genshin.models.Notes: ノート情報
             
         Raises:
             genshin.errors.InvalidCookies: クッキーが無効
+            asyncio.TimeoutError: リトライしても期限内に取得できなかった
             Exception: その他のエラー
         """
-        client = genshin.Client(cookies)
-        return await client.get_genshin_notes()
+        client = self.client_pool.acquire(cookies, user_id)
+        # 優先度もキーに含め、コマンドが定期処理の取得に相乗りして後回しの待ちに入らないようにする
+        key = ('notes', self._user_key(cookies, user_id), uid, priority)
+        return await self.single_flight.do(
+            key, lambda: self._request(lambda: client.get_genshin_notes(uid), priority)
+        )
     
-    @staticmethod
-    async def get_genshin_characters(cookies: dict, uid: Optional[int] = None) -> List:
+    async def get_genshin_characters(
+        self,
+        cookies: dict,
+        uid: Optional[int] = None,
+        user_id: Optional[int] = None,
+        priority: int = RateLimiter.INTERACTIVE
+    ) -> List:
         """
         所持キャラクター一覧を取得
         
         Args:
             cookies: クッキーの辞書
             uid: ユーザーのUID（Noneの場合は自動取得）
+            user_id: DiscordのユーザーID（Clientプールのキー）
+            priority: レート制限の優先度
             
         Returns:
             List: キャラクターのリスト
         """
-        client = genshin.Client(cookies)
+        return (await self.get_genshin_roster(cookies, uid, user_id, priority)).characters
+    
+    async def get_genshin_roster(
+        self,
+        cookies: dict,
+        uid: Optional[int] = None,
+        user_id: Optional[int] = None,
+        priority: int = RateLimiter.INTERACTIVE
+    ) -> Roster:
+        """
+        所持キャラクター一覧を鮮度（キャッシュか、何秒前の取得か）つきで取得
+        
+        Args:
+            cookies: クッキーの辞書
+            uid: ユーザーのUID（Noneの場合は自動取得）
+            user_id: DiscordのユーザーID（Clientプールのキー）
+            priority: レート制限の優先度
+            
+        Returns:
+            Roster: キャラクターのリストと鮮度
+        """
+        client = self.client_pool.acquire(cookies, user_id)
         
         # UIDが指定されていない場合は自動取得
         if uid is None:
-            accounts = await client.get_game_accounts()
-            genshin_accounts = [acc for acc in accounts if acc.game == genshin.Game.GENSHIN]
+            genshin_accounts = await self.get_genshin_accounts(cookies, user_id, priority)
             
             if not genshin_accounts:
-                return []
+                return Roster([])
             
             uid = genshin_accounts[0].uid
         
-        characters = await client.get_genshin_characters(uid)
-        return characters
+        # 同じUIDの一覧はキャッシュから返す（古ければ裏で取得し直す）
+        return await self.roster_cache.get_roster(
+            uid,
+            lambda: self.single_flight.do(
+                ('characters', uid, priority),
+                lambda: self._request(lambda: client.get_genshin_characters(uid), priority)
+            )
+        )
     
-    @staticmethod
-    async def get_genshin_accounts(cookies: dict) -> List:
+    async def get_genshin_accounts(
+        self,
+        cookies: dict,
+        user_id: Optional[int] = None,
+        priority: int = RateLimiter.INTERACTIVE
+    ) -> List:
         """
         原神アカウント情報を取得
         
         Args:
             cookies: クッキーの辞書
+            user_id: DiscordのユーザーID（Clientプールのキー）
+            priority: レート制限の優先度
             
         Returns:
             List: 原神アカウントのリスト
         """
-        client = genshin.Client(cookies)
-        accounts = await client.get_game_accounts()
+        client = self.client_pool.acquire(cookies, user_id)
+        key = ('accounts', self._user_key(cookies, user_id), priority)
+        accounts = await self.single_flight.do(
+            key, lambda: self._request(client.get_game_accounts, priority)
+        )
         return [acc for acc in accounts if acc.game == genshin.Game.GENSHIN]
     
+    @staticmethod
+    def _user_key(cookies: dict, user_id: Optional[int]):
+        """ユーザーを識別するキー（ユーザーIDがなければltuid_v2）"""
+        return user_id if user_id is not None else cookies.get('ltuid_v2')
+    
+    @staticmethod
+    def to_account_rows(accounts: List) -> List[Tuple[int, str, int, str]]:
+        """
+        原神アカウントをDB保存用の行に変換
+        
+        Args:
+            accounts: 原神アカウントのリスト
+            
+        Returns:
+            List[Tuple]: (uid, region, level, nickname) のリスト
+        """
+        return [(acc.uid, acc.server, acc.level, acc.nickname) for acc in accounts]
+    
+    async def refresh_stale_accounts(
+        self,
+        database,
+        on_failure: Optional[Callable[[int, str], Awaitable[bool]]] = None
+    ) -> int:
+        """
+        UIDが未保存、または古くなったユーザーの原神アカウント情報を取得し直す
+        
+        Args:
+            database: AsyncDatabaseインスタンス
+            on_failure: クッキーが無効だったときに呼ぶ関数（user_id, status）。
+                樹脂チェックと同じ隔離の処理（NotificationService.quarantine_on_failure）を渡す
+            
+        Returns:
+            int: 更新したユーザー数
+        """
+        user_ids = await database.get_users_needing_account_refresh(
+            max_age_days=APIConstants.ACCOUNT_MAX_AGE_DAYS,
+            limit=APIConstants.ACCOUNT_REFRESH_BATCH_SIZE
+        )
+        # 結果にかかわらず試みた時刻を記録し、次回は別のユーザーから更新する
+        await database.mark_accounts_checked(user_ids)
+        
+        refreshed = 0
+        for user_id in user_ids:
+            cookies = await database.get_user_cookies(user_id)
+            if not cookies:
+                continue
+            
+            try:
+                accounts = await self.get_genshin_accounts(cookies, user_id, RateLimiter.BACKGROUND)
+                if await database.save_genshin_accounts(user_id, self.to_account_rows(accounts)):
+                    refreshed += 1
+            except genshin.errors.InvalidCookies:
+                if on_failure is not None:
+                    await on_failure(user_id, HealthConstants.INVALID_COOKIE)
+            except Exception as e:
+                print(f"アカウント情報更新エラー (User {user_id}): {e}")
+        
+        return refreshed
+    
     @staticmethod
     def get_japanese_name(english_name: str) -> str:
         """
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+暗号化キーの切り替えサービス
+キーファイルの変更を検知し、古いキーで暗号化されたクッキーを小さなバッチで暗号化し直す
+"""
+
+import asyncio
+
+from config.constants import DatabaseConstants
+from models.async_database import AsyncDatabase
+
+
+class KeyRotationService:
+    """暗号化キーの切り替え（Botを止めずに、書き込みロックを長く持たずに行う）"""
+
+    def __init__(
+        self,
+        database: AsyncDatabase,
+        batch_size: int = DatabaseConstants.REENCRYPT_BATCH_SIZE,
+        pause_seconds: float = DatabaseConstants.MAINTENANCE_PAUSE_SECONDS
+    ):
+        """
+        暗号化キーの切り替えサービスを初期化
+
+        Args:
+            database: 非同期データベース
+            batch_size: 1トランザクションで暗号化し直す行数
+            pause_seconds: バッチの間の待ち時間
+        """
+        self.database = database
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self._running = False
+
+    async def run(self) -> int:
+        """
+        キーファイルを確認し、終わっていない再暗号化を続ける
+
+        切り替え済み（進捗が完了）なら進捗を1回読むだけで終わる
+
+        Returns:
+            int: 暗号化し直した件数
+        """
+        if self._running:
+            return 0
+        self._running = True
+        try:
+            await self.database.reload_encryption_keys()
+
+            rewritten = failed = 0
+            while True:
+                count, errors, done = await self.database.reencrypt_cookies_batch(self.batch_size)
+                rewritten += count
+                failed += errors
+                if done:
+                    break
+                await asyncio.sleep(self.pause_seconds)
+
+            if rewritten or failed:
+                fingerprint = self.database.database.key_fingerprint
+                print(
+                    f"クッキーの再暗号化が完了しました（{rewritten}件、現在のキー: {fingerprint}）。"
+                    f"古いキーはキーファイルから削除できます"
+                )
+                if failed:
+                    print(f"どのキーでも復号できないクッキー: {failed}件（/set_cookie で再設定が必要です）")
+            return rewritten
+        finally:
+            self._running = False
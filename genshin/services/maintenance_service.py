@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+メンテナンスサービス
+保持期間（DATA_RETENTION_DAYS）を過ぎたデータを小さなバッチで削除し、DBファイルを圧縮する
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict
+
+from config.constants import DatabaseConstants
+from models.async_database import AsyncDatabase
+
+
+@dataclass
+class MaintenanceReport:
+    """1回のメンテナンスの結果"""
+    purged: Dict[str, int] = field(default_factory=dict)  # 種類ごとの削除数
+    bytes_before: int = 0
+    bytes_after: int = 0
+    free_bytes: int = 0  # ファイルに返せずに残った空き領域
+    incremental: bool = True  # auto_vacuum=INCREMENTALが有効か
+    seconds: float = 0.0
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        """ファイルから返した容量"""
+        return max(0, self.bytes_before - self.bytes_after)
+
+    def summary(self) -> str:
+        """ログ用の1行の要約"""
+        purged = ', '.join(f"{kind}={count}" for kind, count in self.purged.items())
+        text = (
+            f"メンテナンス: 削除 {purged} / "
+            f"{self.bytes_before:,} → {self.bytes_after:,} bytes"
+            f"（{self.bytes_reclaimed:,} bytes 回収）/ {self.seconds:.1f}秒"
+        )
+        if not self.incremental and self.free_bytes:
+            # 既存のDBはauto_vacuumを後から有効にできない（VACUUMを1度実行する必要がある）
+            text += f" / 空き {self.free_bytes:,} bytes はVACUUMを実行するまでファイルに残ります"
+        return text
+
+
+class MaintenanceService:
+    """保持期間を過ぎたデータの削除とDBの圧縮"""
+
+    def __init__(
+        self,
+        database: AsyncDatabase,
+        retention_days: int = DatabaseConstants.DATA_RETENTION_DAYS,
+        batch_size: int = DatabaseConstants.PURGE_BATCH_SIZE,
+        vacuum_pages: int = DatabaseConstants.VACUUM_PAGES_PER_STEP,
+        pause_seconds: float = DatabaseConstants.MAINTENANCE_PAUSE_SECONDS
+    ):
+        """
+        メンテナンスサービスを初期化
+
+        Args:
+            database: 非同期データベース
+            retention_days: 保持期間（日数）
+            batch_size: 1トランザクションで削除する行数
+            vacuum_pages: incremental_vacuumで1回に返すページ数
+            pause_seconds: バッチの間の待ち時間
+        """
+        self.database = database
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.pause_seconds = pause_seconds
+        self._running = False
+
+    async def run(self) -> MaintenanceReport:
+        """
+        メンテナンスを1回実行
+
+        1バッチごとに書き込みロックを手放すので、実行中も通知やコマンドの書き込みは止まらない
+
+        Returns:
+            MaintenanceReport: 削除数と回収した容量
+        """
+        report = MaintenanceReport()
+        if self._running:
+            return report
+        self._running = True
+        started = time.monotonic()
+        try:
+            cutoff = time.time() - self.retention_days * 86400
+            stats = await self.database.get_storage_stats()
+            report.bytes_before = stats['bytes']
+            report.incremental = stats['auto_vacuum'] == 2
+
+            # 放置ユーザーを先に削除（そのユーザーの古い行もまとめて消える）
+            report.purged['users'] = await self._drain(
+                lambda: self.database.purge_abandoned_users(cutoff, self.batch_size)
+            )
+            for table in ('notes_snapshots', 'outbound_messages'):
+                report.purged[table] = await self._drain(
+                    lambda table=table: self.database.purge_expired_rows(table, cutoff, self.batch_size)
+                )
+
+            # 空きページを少しずつファイルから返す
+            if report.incremental:
+                remaining = None  # 残りの空きページ数
+                while remaining != 0:
+                    left = await self.database.incremental_vacuum(self.vacuum_pages)
+                    if remaining is not None and left >= remaining:
+                        break  # 進まなければ諦める（次回に持ち越し）
+                    remaining = left
+                    await asyncio.sleep(self.pause_seconds)
+
+            await self.database.optimize()
+
+            stats = await self.database.get_storage_stats()
+            report.bytes_after = stats['bytes']
+            report.free_bytes = stats['free_bytes']
+        finally:
+            self._running = False
+            report.seconds = time.monotonic() - started
+        return report
+
+    async def _drain(self, purge: Callable[[], Awaitable[int]]) -> int:
+        """
+        削除するものがなくなるまでバッチを繰り返す
+
+        Args:
+            purge: 1バッチ分削除して削除数を返す関数
+
+        Returns:
+            int: 削除した合計
+        """
+        total = 0
+        while True:
+            count = await purge()
+            total += count
+            if count < self.batch_size:
+                return total
+            await asyncio.sleep(self.pause_seconds)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Discordへの送信キュー
+通知をSQLiteに保存してから送り、レート制限や一時的なエラーはバックオフして再送する
+"""
+
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import aiohttp
+import discord
+
+from config.constants import NotificationConstants
+from models.async_database import AsyncDatabase
+from services.rate_limiter import RateLimiter
+
+
+@dataclass
+class OutboundMessage:
+    """送信待ちのメッセージ"""
+    message_id: int
+    user_id: int
+    payload: dict  # discord.Embed.to_dict() の結果
+    created_at: float  # キューに入れた時刻（UNIX時間）
+    attempts: int = 0
+
+
+class MessageQueue:
+    """送信先（DMチャンネル）ごとに順番を守り、全体の送信レートも制限する送信キュー"""
+
+    def __init__(
+        self,
+        database: AsyncDatabase,
+        sender: Callable[[int, discord.Embed], Awaitable[None]],
+        workers: int = NotificationConstants.DELIVERY_WORKERS,
+        max_attempts: int = NotificationConstants.DELIVERY_MAX_ATTEMPTS,
+        on_forbidden: Optional[Callable[[int], Awaitable[None]]] = None
+    ):
+        """
+        送信キューを初期化
+
+        Args:
+            database: データベースインスタンス
+            sender: 1件を送信する関数 (user_id, embed)
+            workers: 送信ワーカー数（樹脂チェックの並行数とは独立）
+            max_attempts: 1件あたりの最大送信回数
+            on_forbidden: 送信先にDMを送れなかったとき（403）に呼ぶ関数 (user_id)
+        """
+        self.database = database
+        self.sender = sender
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.on_forbidden = on_forbidden
+        self.rate_limiter = RateLimiter(
+            rate=NotificationConstants.DELIVERY_RATE_PER_SECOND,
+            burst=NotificationConstants.DELIVERY_BURST
+        )
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._started = False
+        self._loading_ids: Optional[Set[int]] = None  # 起動時の読み込み中に追加したID（読み込み結果と重複させない）
+        self._timers: Set[asyncio.TimerHandle] = set()
+        self._inflight = 0
+        self._route_locks: Dict[int, asyncio.Lock] = {}
+        self._route_users: Dict[int, int] = {}  # ルートごとのロック利用数（0になったらロックを破棄）
+        self._route_ready_at: Dict[int, float] = {}  # レート制限中のルートが再開できる時刻（monotonic）
+        self._latencies: Deque[float] = deque(maxlen=NotificationConstants.DELIVERY_LATENCY_SAMPLES)
+        self.delivered = 0
+        self.retried = 0
+        self.dropped = 0
+
+    # === 起動・停止 ===
+
+    async def start(self) -> None:
+        """DBに残っている送信待ちを読み込み、ワーカーを起動"""
+        if self._started:
+            return
+        self._started = True
+
+        self._loading_ids = set()
+        rows = await self.database.get_pending_outbound_messages()
+        loading_ids, self._loading_ids = self._loading_ids, None
+
+        now = time.time()
+        for message_id, user_id, payload, attempts, next_attempt_at, created_at in rows:
+            if message_id in loading_ids:
+                continue
+            message = OutboundMessage(message_id, user_id, json.loads(payload), created_at, attempts)
+            self._schedule(message, max(0.0, (next_attempt_at or now) - now))
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def close(self) -> None:
+        """ワーカーを停止（送信待ちはDBに残り、次回起動時に送る）"""
+        for handle in self._timers:
+            handle.cancel()
+        self._timers.clear()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._started = False
+
+    # === 送信 ===
+
+    async def enqueue(self, user_id: int, embed: discord.Embed) -> bool:
+        """
+        メッセージをDBに保存して送信待ちに加える
+
+        Args:
+            user_id: 送信先のユーザーID
+            embed: 送信するEmbed
+
+        Returns:
+            bool: 保存できたらTrue（送信はワーカーが行う）
+        """
+        payload = embed.to_dict()
+        created_at = time.time()
+        message_id = await self.database.enqueue_outbound_message(user_id, json.dumps(payload), created_at)
+        if message_id is None:
+            return False
+
+        # 起動前はDBに保存するだけ（start時に読み込む）
+        if self._started:
+            if self._loading_ids is not None:
+                self._loading_ids.add(message_id)
+            self._queue.put_nowait(OutboundMessage(message_id, user_id, payload, created_at))
+        return True
+
+    @property
+    def depth(self) -> int:
+        """送信待ち（再送待ち・送信中を含む）の件数"""
+        return self._queue.qsize() + len(self._timers) + self._inflight
+
+    def stats(self) -> Dict[str, Any]:
+        """キューの深さ・送信数・遅延などの統計を取得"""
+        return {
+            'depth': self.depth,
+            'delivered': self.delivered,
+            'retried': self.retried,
+            'dropped': self.dropped,
+            'latency_p50': self._percentile(50),
+            'latency_p95': self._percentile(95)
+        }
+
+    def summary(self) -> str:
+        """ログ用のサマリー文字列"""
+        return (
+            f"送信キュー: 待ち{self.depth} 送信済み{self.delivered} 再送{self.retried} 破棄{self.dropped} "
+            f"p50={self._percentile(50):.2f}秒 p95={self._percentile(95):.2f}秒"
+        )
+
+    # === ワーカー ===
+
+    async def _worker(self) -> None:
+        """送信待ちを取り出して送り続ける"""
+        while True:
+            message = await self._queue.get()
+            self._inflight += 1
+            try:
+                await self._deliver(message)
+            except Exception as e:
+                print(f"送信キューエラー (User {message.user_id}): {e}")
+            finally:
+                self._inflight -= 1
+                self._queue.task_done()
+
+    async def _deliver(self, message: OutboundMessage) -> None:
+        """1件を送信し、結果に応じて削除・再送・破棄する"""
+        route = message.user_id
+        wait = self._route_ready_at.get(route, 0.0) - time.monotonic()
+        if wait > 0:
+            # 送信先がレート制限中なら、解除されるまで他のメッセージを先に送る
+            self._schedule(message, wait)
+            return
+
+        self._route_users[route] = self._route_users.get(route, 0) + 1
+        lock = self._route_locks.setdefault(route, asyncio.Lock())
+        try:
+            async with lock:
+                await self.rate_limiter.acquire()
+                await self._send(message)
+        finally:
+            self._route_users[route] -= 1
+            if self._route_users[route] == 0:
+                del self._route_users[route]
+                del self._route_locks[route]
+
+    async def _send(self, message: OutboundMessage) -> None:
+        """送信してエラーを分類"""
+        route = message.user_id
+        try:
+            await self.sender(route, discord.Embed.from_dict(message.payload))
+        except discord.RateLimited as e:
+            self._hold_route(route, e.retry_after)
+            self._schedule(message, e.retry_after)
+            return
+        except discord.Forbidden:
+            await self._drop(message, "DMが無効です")
+            if self.on_forbidden is not None:
+                await self.on_forbidden(route)
+            return
+        except discord.HTTPException as e:
+            if e.status == 429:
+                retry_after = self._retry_after(e)
+                self._hold_route(route, retry_after)
+                self._schedule(message, retry_after)
+            elif e.status >= 500:
+                await self._retry(message, e)
+            else:
+                await self._drop(message, str(e))
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            await self._retry(message, e)
+            return
+
+        self.delivered += 1
+        self._latencies.append(time.time() - message.created_at)
+        await self.database.delete_outbound_message(message.message_id)
+
+    async def _retry(self, message: OutboundMessage, error: Exception) -> None:
+        """バックオフして再送（上限に達したら破棄）"""
+        message.attempts += 1
+        if message.attempts >= self.max_attempts:
+            await self._drop(message, f"{self.max_attempts}回失敗 ({error})")
+            return
+
+        ceiling = min(
+            NotificationConstants.DELIVERY_RETRY_MAX_SECONDS,
+            NotificationConstants.DELIVERY_RETRY_BASE_SECONDS * 2 ** (message.attempts - 1)
+        )
+        delay = random.uniform(ceiling / 2, ceiling)
+        self.retried += 1
+        await self.database.update_outbound_message(message.message_id, message.attempts, time.time() + delay)
+        self._schedule(message, delay)
+
+    async def _drop(self, message: OutboundMessage, reason: str) -> None:
+        """送信を諦めてDBから削除"""
+        self.dropped += 1
+        print(f"通知送信失敗 (User {message.user_id}): {reason}")
+        await self.database.delete_outbound_message(message.message_id)
+
+    # === 補助 ===
+
+    def _schedule(self, message: OutboundMessage, delay: float) -> None:
+        """delay秒後に送信待ちへ戻す"""
+        if delay <= 0:
+            self._queue.put_nowait(message)
+            return
+
+        def fire():
+            self._timers.discard(handle)
+            self._queue.put_nowait(message)
+
+        handle = asyncio.get_running_loop().call_later(delay, fire)
+        self._timers.add(handle)
+
+    def _hold_route(self, route: int, retry_after: float) -> None:
+        """送信先をretry_after秒だけ止める"""
+        self._route_ready_at[route] = time.monotonic() + retry_after
+        # 古い記録を掃除
+        now = time.monotonic()
+        for key in [k for k, v in self._route_ready_at.items() if v <= now]:
+            del self._route_ready_at[key]
+
+    @staticmethod
+    def _retry_after(error: discord.HTTPException) -> float:
+        """429レスポンスから待ち秒数を取得"""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None) or {}
+        try:
+            return float(headers.get('Retry-After', NotificationConstants.DELIVERY_RETRY_BASE_SECONDS))
+        except (TypeError, ValueError):
+            return float(NotificationConstants.DELIVERY_RETRY_BASE_SECONDS)
+
+    def _percentile(self, p: float) -> float:
+        """送信遅延のパーセンタイル（秒、nearest-rank法）"""
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[index]
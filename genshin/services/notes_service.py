@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+リアルタイムノートサービス
+前回取得したスナップショットから現在の樹脂などを推定し、API呼び出しを減らす
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from config.constants import ResinConstants
+from models.async_database import AsyncDatabase
+from models.notes import NotesSnapshot
+from services.circuit_breaker import CircuitOpenError
+from services.hoyolab_service import HoyolabService
+from services.rate_limiter import RateLimiter
+
+
+@dataclass
+class NotesEstimate:
+    """
+    スナップショットから推定した現在のノート
+
+    属性名はgenshin.models.Notesに合わせてあり、そのままEmbedに渡せる
+    """
+    current_resin: int
+    max_resin: int
+    remaining_resin_recovery_seconds: int
+    current_realm_currency: int
+    max_realm_currency: int
+    remaining_realm_currency_recovery_seconds: int
+    remaining_transformer_recovery_seconds: Optional[int]
+    completed_commissions: int
+    max_commissions: int
+    remaining_resin_discounts: int
+    max_resin_discounts: int
+    fetched_at: float  # 元になったスナップショットの取得時刻（UNIX時間）
+    age_seconds: float  # スナップショット取得からの経過秒数（推定の鮮度）
+    expedition_remaining_seconds: Tuple[int, ...] = ()  # 各探索派遣の残り秒数
+
+    @property
+    def finished_expeditions(self) -> int:
+        """完了した探索派遣の数"""
+        return sum(1 for seconds in self.expedition_remaining_seconds if seconds <= 0)
+
+    @property
+    def is_estimated(self) -> bool:
+        """取得直後の値ではなく推定値か"""
+        return self.age_seconds >= 1
+
+    @property
+    def resin_recovery_time(self) -> datetime:
+        """樹脂が満タンになる時刻"""
+        return datetime.now().astimezone() + timedelta(seconds=self.remaining_resin_recovery_seconds)
+
+    @property
+    def realm_currency_recovery_time(self) -> datetime:
+        """洞天宝銭が満タンになる時刻"""
+        return datetime.now().astimezone() + timedelta(seconds=self.remaining_realm_currency_recovery_seconds)
+
+    @property
+    def transformer_recovery_time(self) -> Optional[datetime]:
+        """参量物質変換器が使用可能になる時刻（未入手ならNone）"""
+        if self.remaining_transformer_recovery_seconds is None:
+            return None
+        return datetime.now().astimezone() + timedelta(seconds=self.remaining_transformer_recovery_seconds)
+
+
+class NotesService:
+    """リアルタイムノートの取得とスナップショットからの推定を行うサービス"""
+
+    def __init__(self, database: AsyncDatabase, hoyolab_service: HoyolabService):
+        """
+        ノートサービスを初期化
+
+        Args:
+            database: データベースインスタンス
+            hoyolab_service: HoyolabServiceインスタンス
+        """
+        self.database = database
+        self.hoyolab_service = hoyolab_service
+
+    async def get_notes(
+        self,
+        user_id: int,
+        cookies: dict,
+        uid: Optional[int] = None,
+        refresh: bool = False,
+        max_age: Optional[float] = None,
+        priority: int = RateLimiter.INTERACTIVE
+    ) -> NotesEstimate:
+        """
+        ノートを取得（スナップショットが新しければAPIを呼ばずに推定値を返す）
+
+        Args:
+            user_id: DiscordのユーザーID
+            cookies: クッキーの辞書
+            uid: 保存済みの原神UID
+            refresh: Trueなら必ずAPIから取得
+            max_age: 推定値で済ませるスナップショットの最大経過秒数
+            priority: API呼び出しのレート制限の優先度（定期処理はRateLimiter.BACKGROUND）
+
+        Returns:
+            NotesEstimate: ノート（取得直後ならage_secondsは0）
+
+        Raises:
+            CircuitOpenError: HoYoLABの障害中で、推定に使えるスナップショットもない
+        """
+        if max_age is None:
+            max_age = ResinConstants.NOTES_SNAPSHOT_MAX_AGE_MINUTES * 60
+
+        estimate = None
+        if not refresh:
+            estimate = await self.current_estimate(user_id)
+            if estimate is not None and estimate.age_seconds <= max_age:
+                return estimate
+
+        try:
+            notes = await self.hoyolab_service.get_genshin_notes(
+                cookies, user_id=user_id, uid=uid, priority=priority
+            )
+        except CircuitOpenError:
+            # 障害中は古くても推定値で答える
+            if estimate is None:
+                estimate = await self.current_estimate(user_id)
+            if estimate is None:
+                raise
+            return estimate
+        snapshot = self.to_snapshot(user_id, notes, time.time())
+        await self.database.save_notes_snapshot(snapshot)
+        return self.estimate(snapshot, snapshot.fetched_at)
+
+    async def current_estimate(self, user_id: int) -> Optional[NotesEstimate]:
+        """
+        保存済みスナップショットから現在のノートを推定
+
+        Args:
+            user_id: DiscordのユーザーID
+
+        Returns:
+            NotesEstimate: 推定値、スナップショットがなければNone
+        """
+        snapshot = await self.database.get_notes_snapshot(user_id)
+        if snapshot is None:
+            return None
+        return self.estimate(snapshot, time.time())
+
+    @staticmethod
+    def to_snapshot(user_id: int, notes, fetched_at: float) -> NotesSnapshot:
+        """
+        genshin.models.NotesをDB保存用のスナップショットに変換
+
+        Args:
+            user_id: DiscordのユーザーID
+            notes: genshin.models.Notes
+            fetched_at: 取得時刻（UNIX時間）
+
+        Returns:
+            NotesSnapshot: スナップショット
+        """
+        transformer = getattr(notes, 'remaining_transformer_recovery_time', None)
+        expeditions = getattr(notes, 'expeditions', None) or []
+        return NotesSnapshot(
+            user_id=user_id,
+            fetched_at=fetched_at,
+            current_resin=notes.current_resin,
+            max_resin=notes.max_resin,
+            resin_recovery_seconds=int(notes.remaining_resin_recovery_time.total_seconds()),
+            current_realm_currency=notes.current_realm_currency,
+            max_realm_currency=notes.max_realm_currency,
+            realm_currency_recovery_seconds=int(notes.remaining_realm_currency_recovery_time.total_seconds()),
+            transformer_recovery_seconds=int(transformer.total_seconds()) if transformer is not None else None,
+            completed_commissions=notes.completed_commissions,
+            max_commissions=notes.max_commissions,
+            remaining_resin_discounts=notes.remaining_resin_discounts,
+            max_resin_discounts=notes.max_resin_discounts,
+            expedition_remaining_seconds=','.join(
+                str(max(0, int(exp.remaining_time.total_seconds()))) for exp in expeditions
+            )
+        )
+
+    @staticmethod
+    def estimate(snapshot: NotesSnapshot, now: float) -> NotesEstimate:
+        """
+        スナップショットから指定時刻のノートを推定
+
+        樹脂は8分で1回復、洞天宝銭は取得時点の回復ペースが続くものとして計算する
+
+        Args:
+            snapshot: スナップショット
+            now: 推定する時刻（UNIX時間）
+
+        Returns:
+            NotesEstimate: 推定値
+        """
+        elapsed = max(0.0, now - snapshot.fetched_at)
+
+        # 樹脂（満タンまでの残り秒数から端数も含めて計算）
+        resin_remaining = max(0, snapshot.resin_recovery_seconds - int(elapsed))
+        if resin_remaining == 0:
+            resin = max(snapshot.current_resin, snapshot.max_resin)
+        else:
+            missing = math.ceil(resin_remaining / ResinConstants.RESIN_RECOVERY_SECONDS)
+            resin = max(snapshot.current_resin, snapshot.max_resin - missing)
+
+        # 洞天宝銭（取得時点のペースで線形に回復）
+        realm_remaining = max(0, snapshot.realm_currency_recovery_seconds - int(elapsed))
+        realm_currency = snapshot.current_realm_currency
+        if snapshot.realm_currency_recovery_seconds > 0 and realm_currency < snapshot.max_realm_currency:
+            if realm_remaining == 0:
+                realm_currency = snapshot.max_realm_currency
+            else:
+                rate = (snapshot.max_realm_currency - realm_currency) / snapshot.realm_currency_recovery_seconds
+                realm_currency = min(snapshot.max_realm_currency, realm_currency + int(rate * elapsed))
+
+        # 参量物質変換器
+        transformer_remaining = None
+        if snapshot.transformer_recovery_seconds is not None:
+            transformer_remaining = max(0, snapshot.transformer_recovery_seconds - int(elapsed))
+
+        # 探索派遣
+        expeditions = tuple(
+            max(0, int(seconds) - int(elapsed))
+            for seconds in (snapshot.expedition_remaining_seconds or '').split(',') if seconds
+        )
+
+        return NotesEstimate(
+            current_resin=resin,
+            max_resin=snapshot.max_resin,
+            remaining_resin_recovery_seconds=resin_remaining,
+            current_realm_currency=realm_currency,
+            max_realm_currency=snapshot.max_realm_currency,
+            remaining_realm_currency_recovery_seconds=realm_remaining,
+            remaining_transformer_recovery_seconds=transformer_remaining,
+            completed_commissions=snapshot.completed_commissions,
+            max_commissions=snapshot.max_commissions,
+            remaining_resin_discounts=snapshot.remaining_resin_discounts,
+            max_resin_discounts=snapshot.max_resin_discounts,
+            fetched_at=snapshot.fetched_at,
+            age_seconds=elapsed,
+            expedition_remaining_seconds=expeditions
+        )
@@ -4,16 +4,78 @@
 Discord通知ロジックを管理
 """
 
+import asyncio
+import math
+import time
 import discord
-from typing import Optional
-from models.database import Database
+import genshin
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional, List, Tuple, Dict
+from config.constants import NotificationConstants, HealthConstants
+from models.alert import Alert
+from models.async_database import AsyncDatabase
+from models.user import ReminderTarget
+from services.circuit_breaker import CircuitOpenError
+from services.message_queue import MessageQueue
+from services.rate_limiter import RateLimiter
+from services.reminder_scheduler import ReminderScheduler
+from services.resource_alert_service import ResourceAlertService
 from views.embeds import EmbedBuilder
 
 
+@dataclass
+class CycleStats:
+    """樹脂チェック1サイクル分の集計"""
+    due: int = 0
+    successes: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    rejected: int = 0  # HoYoLABの障害中で取得を見送った数
+    latencies: List[float] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    duration: float = 0.0
+    
+    def record_success(self, latency: float) -> None:
+        """成功した処理を記録"""
+        self.successes += 1
+        self.latencies.append(latency)
+    
+    def record_failure(self, latency: float, timed_out: bool = False) -> None:
+        """失敗した処理を記録"""
+        self.failures += 1
+        if timed_out:
+            self.timeouts += 1
+        self.latencies.append(latency)
+    
+    def record_rejected(self) -> None:
+        """HoYoLABの障害中で見送った処理を記録"""
+        self.rejected += 1
+    
+    def finish(self) -> None:
+        """サイクルの所要時間を確定"""
+        self.duration = time.monotonic() - self.started_at
+    
+    def percentile(self, p: float) -> float:
+        """レイテンシのパーセンタイル（秒、nearest-rank法）"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        return ordered[index]
+    
+    def summary(self) -> str:
+        """ログ用のサマリー文字列"""
+        return (
+            f"樹脂チェック完了: 対象{self.due}人 成功{self.successes} 失敗{self.failures}"
+            f"(タイムアウト{self.timeouts}) 障害中で見送り{self.rejected} 所要{self.duration:.1f}秒 "
+            f"p50={self.percentile(50):.2f}秒 p95={self.percentile(95):.2f}秒"
+        )
+
+
 class NotificationService:
     """通知サービスクラス"""
     
-    def __init__(self, bot: discord.Client, database: Database):
+    def __init__(self, bot: discord.Client, database: AsyncDatabase):
         """
         通知サービスを初期化
         
@@ -23,10 +85,194 @@ class NotificationService:
         """
         self.bot = bot
         self.database = database
+        self.scheduler = ReminderScheduler(database)
+        self.last_cycle_stats: Optional[CycleStats] = None
+        self._notified: List[Tuple[int, str, float, int]] = []  # DB未保存の通知済み記録 (user_id, 種類, 時刻, 値)
+        self._rearmed: List[Tuple[int, str]] = []  # 条件を外れたため通知済み記録を消す (user_id, 種類)
+        self._recovered: List[int] = []  # 失敗のあと正常に処理できたユーザー（連続失敗回数を戻す）
+        self._dm_channel_ids: Dict[int, int] = {}  # ユーザーID -> DMチャンネルID
+        self._digests: Dict[int, Dict[str, Alert]] = {}  # ダイジェスト待ちの通知（ユーザーID -> 種類 -> 通知）
+        self._digest_opened_at: Dict[int, float] = {}  # ダイジェストの最初の通知を受けた時刻
+        # 通知の送信はキュー経由（チェックと独立して送る）
+        self.outbox = MessageQueue(database, self._send_embed, on_forbidden=self._on_dm_forbidden)
+    
+    async def start(self) -> None:
+        """送信キューを起動（前回送れなかった通知も送る）"""
+        await self.outbox.start()
+    
+    async def close(self) -> None:
+        """ダイジェスト待ちを送信キューに入れてから停止（送信待ちはDBに残る）"""
+        await self.flush_digests(time.time(), force=True)
+        await self.flush_notification_states()
+        await self.outbox.close()
+    
+    # === ダイジェスト ===
+    
+    def add_to_digest(self, alert: Alert) -> None:
+        """
+        通知をダイジェストに加える（同じ種類の通知は新しいもので置き換える）
+        
+        Args:
+            alert: 通知
+        """
+        self._digests.setdefault(alert.user_id, {})[alert.kind] = alert
+        self._digest_opened_at.setdefault(alert.user_id, alert.triggered_at)
+    
+    async def flush_digests(self, now: float, force: bool = False) -> int:
+        """
+        まとめる時間が過ぎたダイジェストを1ユーザー1通で送信キューに入れる
+        
+        Args:
+            now: 現在時刻（UNIX時間）
+            force: Trueなら時間に関係なくすべて送る
+            
+        Returns:
+            int: キューに入れた通数
+        """
+        window = NotificationConstants.DIGEST_WINDOW_MINUTES * 60
+        ready = [
+            user_id for user_id, opened_at in self._digest_opened_at.items()
+            if force or now - opened_at >= window
+        ]
+        
+        queued = 0
+        for user_id in ready:
+            alerts = list(self._digests.pop(user_id).values())
+            del self._digest_opened_at[user_id]
+            embed = EmbedBuilder.notification_digest_embed(alerts)
+            if await self.outbox.enqueue(user_id, embed):
+                self._mark_notified(alerts)
+                queued += 1
+        return queued
+    
+    def _mark_notified(self, alerts: List[Alert]) -> None:
+        """送信キューに入れた通知を通知済みとして記録（DBへの保存はまとめて行う）"""
+        for alert in alerts:
+            self._notified.append((alert.user_id, alert.kind, alert.triggered_at, alert.value))
+    
+    async def _enqueue_and_mark(self, send: Awaitable[bool], mark: Callable[[], None]) -> bool:
+        """
+        送信キューに入れて通知済みとして記録する（チェックのタイムアウトで中断しない）
+        
+        キューに入れた後・記録する前にキャンセルされると、次のチェックで同じ通知を再送してしまうため、
+        呼び出し元がキャンセルされても両方を終えてから抜ける
+        
+        Args:
+            send: 送信キューに入れる処理（send_resin_reminder / send_alert）
+            mark: キューに入れられたときに通知済みを記録する関数
+            
+        Returns:
+            bool: キューに入れられたらTrue
+        """
+        async def enqueue() -> bool:
+            if not await send:
+                return False
+            mark()
+            return True
+        
+        return await asyncio.shield(enqueue())
+    
+    async def send_alert(self, alert: Alert) -> bool:
+        """
+        樹脂以外の資源の通知を送信キューに入れる
+        
+        Args:
+            alert: 通知
+            
+        Returns:
+            bool: キューに入れられたらTrue
+        """
+        try:
+            return await self.outbox.enqueue(alert.user_id, EmbedBuilder.resource_alert_embed(alert))
+        except Exception as e:
+            print(f"通知送信エラー (User {alert.user_id}): {e}")
+            return False
+    
+    # === ユーザーの隔離 ===
+    
+    async def quarantine_on_failure(self, user_id: int, status: str) -> bool:
+        """
+        失敗を記録し、隔離したらチェック対象から外して1回だけ案内する
+        
+        Args:
+            user_id: ユーザーID
+            status: 失敗の種類（HealthConstants.INVALID_COOKIE / DM_CLOSED）
+            
+        Returns:
+            bool: 今回の失敗で隔離したらTrue
+        """
+        max_failures = (
+            HealthConstants.MAX_DM_FAILURES if status == HealthConstants.DM_CLOSED
+            else HealthConstants.MAX_COOKIE_FAILURES
+        )
+        if not await self.database.record_health_failure(user_id, status, max_failures):
+            return False
+        
+        print(f"ユーザーを隔離しました (User {user_id}): {status}")
+        self.scheduler.unschedule(user_id)
+        self._digests.pop(user_id, None)
+        self._digest_opened_at.pop(user_id, None)
+        if status != HealthConstants.DM_CLOSED:
+            # DMを受け取れる場合だけDMで案内（受け取れない場合はコマンドの応答で案内する）
+            await self.outbox.enqueue(user_id, EmbedBuilder.quarantine_notice_embed(status))
+        return True
+    
+    async def _on_dm_forbidden(self, user_id: int) -> None:
+        """DMを送れなかったユーザーを隔離"""
+        await self.forget_dm_channel(user_id)
+        await self.quarantine_on_failure(user_id, HealthConstants.DM_CLOSED)
+    
+    # === DMチャンネル ===
+    
+    async def _resolve_dm_channel_id(self, user_id: int) -> int:
+        """
+        DMチャンネルIDを取得（メモリ・DBになければDiscordから取得して保存）
+        
+        Args:
+            user_id: ユーザーID
+            
+        Returns:
+            int: DMチャンネルID
+        """
+        channel_id = self._dm_channel_ids.get(user_id)
+        if channel_id is None:
+            channel_id = await self.database.get_dm_channel_id(user_id)
+        if channel_id is None:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            channel = user.dm_channel or await user.create_dm()
+            channel_id = channel.id
+            await self.database.save_dm_channel_id(user_id, channel_id)
+        self._dm_channel_ids[user_id] = channel_id
+        return channel_id
+    
+    async def forget_dm_channel(self, user_id: int) -> None:
+        """保存済みのDMチャンネルを破棄（次回の送信時に取得し直す）"""
+        self._dm_channel_ids.pop(user_id, None)
+        await self.database.delete_dm_channel_id(user_id)
+    
+    async def _send_embed(self, user_id: int, embed: discord.Embed) -> None:
+        """
+        DMチャンネルに直接送信（ユーザーの取得を省く）
+        
+        チャンネルが見つからない場合は取得し直して1回だけ再送する
+        
+        Args:
+            user_id: ユーザーID
+            embed: 送信するEmbed
+        """
+        channel_id = await self._resolve_dm_channel_id(user_id)
+        channel = self.bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+        try:
+            await channel.send(embed=embed)
+        except discord.NotFound:
+            await self.forget_dm_channel(user_id)
+            channel_id = await self._resolve_dm_channel_id(user_id)
+            channel = self.bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+            await channel.send(embed=embed)
     
     async def send_resin_reminder(self, user_id: int, current_resin: int, max_resin: int, threshold: int) -> bool:
         """
-        樹脂リマインダーを送信
+        樹脂リマインダーを送信キューに入れる
         
         Args:
             user_id: ユーザーID
@@ -35,11 +281,9 @@ class NotificationService:
             threshold: 通知閾値
             
         Returns:
-            bool: 送信成功したらTrue
+            bool: キューに入れられたらTrue
         """
         try:
-            user = await self.bot.fetch_user(user_id)
-            
             embed = EmbedBuilder.resin_reminder_embed(
                 threshold=threshold,
                 current_resin=current_resin,
@@ -63,11 +307,7 @@ class NotificationService:
             
             embed.set_footer(text='通知を停止するには /resin_notification off を実行してください')
             
-            await user.send(embed=embed)
-            return True
-        except discord.Forbidden:
-            print(f"通知送信失敗 (User {user_id}): DMが無効です")
-            return False
+            return await self.outbox.enqueue(user_id, embed)
         except Exception as e:
             print(f"通知送信エラー (User {user_id}): {e}")
             return False
@@ -84,8 +324,7 @@ class NotificationService:
             bool: 送信成功したらTrue
         """
         try:
-            user = await self.bot.fetch_user(user_id)
-            await user.send(embed=embed)
+            await self._send_embed(user_id, embed)
             return True
         except discord.Forbidden:
             print(f"DM送信失敗 (User {user_id}): DMが無効です")
@@ -94,39 +333,261 @@ class NotificationService:
             print(f"DM送信エラー (User {user_id}): {e}")
             return False
     
-    async def check_all_resin_reminders(self, hoyolab_service) -> None:
+    async def check_all_resin_reminders(self, notes_service) -> Optional[CycleStats]:
         """
-        すべてのユーザーの樹脂をチェックして必要に応じて通知
+        チェック時刻を迎えたユーザーの樹脂をチェックして必要に応じて通知
+        
+        ユーザーごとの処理は上限付きで並行実行し、1人の遅延が他のユーザーを待たせないようにする
         
         Args:
-            hoyolab_service: HoyolabServiceインスタンス
+            notes_service: NotesServiceインスタンス
+            
+        Returns:
+            CycleStats: 今回のサイクルの集計（対象がいなければNone）
         """
-        users = self.database.get_all_users_with_resin_reminder()
+        if self.scheduler.needs_reconcile:
+            await self.scheduler.reconcile()
         
-        for user_id, enabled, threshold in users:
-            if not enabled:
-                continue
-            
-            # ユーザーのクッキーを取得
-            user_cookies = self.database.get_user_cookies(user_id)
-            if not user_cookies:
-                continue
+        # まとめる時間が過ぎたダイジェストを送る
+        if await self.flush_digests(time.time()):
+            await self.flush_notification_states()
+        
+        due_user_ids = self.scheduler.pop_due(time.time())
+        if not due_user_ids:
+            return None
+        
+        stats = CycleStats(due=len(due_user_ids))
+        concurrency = NotificationConstants.MAX_CONCURRENCY
+        queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        
+        async def worker():
+            while True:
+                target = await queue.get()
+                try:
+                    if target is None:
+                        return
+                    await self._check_target_with_timeout(target, notes_service, stats)
+                finally:
+                    queue.task_done()
+        
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            # 設定とクッキーを1クエリでまとめて取得（キューが埋まったら読み込みも待つ）
+            async for target in self.database.iter_reminder_targets(due_user_ids):
+                await queue.put(target)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await self.scheduler.flush()
+            await self.flush_notification_states()
+        
+        stats.finish()
+        self.last_cycle_stats = stats
+        print(stats.summary())
+        print(self.scheduler.summary())
+        print(self.outbox.summary())
+        print(notes_service.hoyolab_service.single_flight.summary())
+        return stats
+    
+    @staticmethod
+    def should_notify(target: ReminderTarget, current_resin: int, max_resin: int, threshold: int, now: float) -> bool:
+        """
+        通知するか判定（閾値以上でも、通知済みで状態が変わっていなければ送らない）
+        
+        Args:
+            target: チェック対象（前回の通知状態を含む）
+            current_resin: 現在の樹脂数
+            max_resin: 最大樹脂数
+            threshold: 通知閾値
+            now: 現在時刻（UNIX時間）
             
-            try:
-                # 樹脂情報を取得
-                notes = await hoyolab_service.get_genshin_notes(user_cookies)
-                
-                # 閾値チェック
-                resin_threshold = threshold if threshold else notes.max_resin
-                
-                if notes.current_resin >= resin_threshold:
-                    await self.send_resin_reminder(
-                        user_id=user_id,
-                        current_resin=notes.current_resin,
-                        max_resin=notes.max_resin,
-                        threshold=resin_threshold
-                    )
+        Returns:
+            bool: 通知するならTrue
+        """
+        if current_resin < threshold:
+            return False
+        
+        # 閾値を下回ってから初めて届いた
+        if target.last_notified_at is None:
+            return True
+        
+        # 閾値で通知した後、満タンになって溢れ始めた
+        if current_resin >= max_resin and (target.last_notified_resin or 0) < max_resin:
+            return True
+        
+        # ユーザーが設定した再通知間隔が過ぎた
+        if target.renotify_minutes and now - target.last_notified_at >= target.renotify_minutes * 60:
+            return True
+        
+        return False
+    
+    async def flush_notification_states(self) -> None:
+        """溜めた通知状態の変更をまとめてDBに保存"""
+        notified, self._notified = self._notified, []
+        rearmed, self._rearmed = self._rearmed, []
+        
+        # 樹脂はuser_settings、それ以外はresource_alertsに記録する
+        resin_states = [
+            (user_id, {'last_notified_at': at, 'last_notified_resin': value})
+            for user_id, kind, at, value in notified if kind == 'resin'
+        ] + [
+            (user_id, {'last_notified_at': None, 'last_notified_resin': None})
+            for user_id, kind in rearmed if kind == 'resin'
+        ]
+        other_notified = [row for row in notified if row[1] != 'resin']
+        other_rearmed = [row for row in rearmed if row[1] != 'resin']
+        
+        # 樹脂の通知・再通知可能への変更は1回の書き込みにまとめる
+        if resin_states and not await self.database.save_user_settings_bulk(resin_states):
+            self._notified.extend(row for row in notified if row[1] == 'resin')
+            self._rearmed.extend(row for row in rearmed if row[1] == 'resin')
+        if other_notified and not await self.database.mark_resource_alerts_sent(other_notified):
+            self._notified.extend(other_notified)
+        if other_rearmed and not await self.database.clear_resource_alert_states(other_rearmed):
+            self._rearmed.extend(other_rearmed)
+        
+        recovered, self._recovered = self._recovered, []
+        if recovered and not await self.database.reset_health_failures(recovered):
+            self._recovered.extend(recovered)
+    
+    async def _check_target_with_timeout(self, target: ReminderTarget, notes_service, stats: CycleStats) -> None:
+        """1ユーザー分のチェックをタイムアウト付きで実行し、結果を集計"""
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                self._check_target(target, notes_service),
+                timeout=NotificationConstants.USER_TIMEOUT_SECONDS
+            )
+            stats.record_success(time.monotonic() - started)
+        except genshin.errors.InvalidCookies:
+            stats.record_failure(time.monotonic() - started)
+            if not await self.quarantine_on_failure(target.user_id, HealthConstants.INVALID_COOKIE):
+                print(f"樹脂チェックエラー (User {target.user_id}): クッキーが無効です")
+                retry_at = time.time() + NotificationConstants.RETRY_AFTER_ERROR_MINUTES * 60
+                self.scheduler.schedule(target.user_id, retry_at)
+        except CircuitOpenError as e:
+            # 障害中はユーザーごとのログを出さず、再開の目安に合わせて再チェック
+            stats.record_rejected()
+            retry_after = min(
+                max(e.retry_after, NotificationConstants.SCHEDULER_TICK_SECONDS),
+                NotificationConstants.RETRY_AFTER_ERROR_MINUTES * 60
+            )
+            self.scheduler.schedule(target.user_id, time.time() + retry_after)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                print(f"樹脂チェックタイムアウト (User {target.user_id})")
+                stats.record_failure(time.monotonic() - started, timed_out=True)
+            else:
+                print(f"樹脂チェックエラー (User {target.user_id}): {e}")
+                stats.record_failure(time.monotonic() - started)
+            retry_at = time.time() + NotificationConstants.RETRY_AFTER_ERROR_MINUTES * 60
+            self.scheduler.schedule(target.user_id, retry_at)
+    
+    async def _check_target(self, target: ReminderTarget, notes_service) -> None:
+        """
+        1ユーザーの樹脂と資源をチェックして必要なら通知し、次回チェック時刻を設定
+        
+        すべての通知は1回のノート取得から判定する
+        
+        Args:
+            target: チェック対象
+            notes_service: NotesServiceインスタンス
+        """
+        user_id = target.user_id
+        
+        # ノートを取得（直近の取得結果が新しければ推定値を使う。コマンドの呼び出しを優先させる）
+        notes = await notes_service.get_notes(
+            user_id, target.cookies, uid=target.genshin_uid, priority=RateLimiter.BACKGROUND
+        )
+        fetched_at = time.time()
+        if target.health_failures:
+            self._recovered.append(user_id)
+        
+        # (時刻, 予測した到達時刻か)。到達時刻はスロットに揃えず、その時刻にチェックする
+        next_checks = []
+        if target.resin_reminder_enabled:
+            next_checks.append(await self._check_resin(target, notes, fetched_at))
+        
+        for setting in target.resource_alerts.values():
+            result = ResourceAlertService.evaluate(user_id, setting, notes, fetched_at, target.timezone)
+            if result.alert is not None:
+                await self._dispatch_alert(target, result.alert)
+            elif result.rearm:
+                self._rearmed.append((user_id, setting.kind))
+            if result.next_check is not None:
+                next_checks.append((result.next_check, True))
+        
+        if not next_checks:
+            next_checks.append((fetched_at + NotificationConstants.RECHECK_AFTER_NOTIFY_MINUTES * 60, False))
+        next_check, exact = min(next_checks)
+        self.scheduler.schedule(user_id, next_check, exact=exact)
+    
+    async def _dispatch_alert(self, target: ReminderTarget, alert: Alert) -> None:
+        """ダイジェストに加えるか、すぐに送信キューに入れる"""
+        if target.digest_enabled:
+            self.add_to_digest(alert)
+        else:
+            await self._enqueue_and_mark(self.send_alert(alert), lambda: self._mark_notified([alert]))
+    
+    async def _check_resin(self, target: ReminderTarget, notes, fetched_at: float) -> Tuple[float, bool]:
+        """
+        樹脂をチェックして必要なら通知
+        
+        Args:
+            target: チェック対象
+            notes: ノート
+            fetched_at: 取得時刻（UNIX時間）
             
-            except Exception as e:
-                print(f"樹脂チェックエラー (User {user_id}): {e}")
-                continue
+        Returns:
+            tuple: (樹脂の次回チェック時刻（UNIX時間）, 閾値に届く予測時刻ならTrue)
+        """
+        user_id = target.user_id
+        threshold = target.resin_threshold
+        
+        # 閾値チェック
+        resin_threshold = threshold if threshold else notes.max_resin
+        notified_at = target.last_notified_at
+        
+        if self.should_notify(target, notes.current_resin, notes.max_resin, resin_threshold, fetched_at):
+            if target.digest_enabled:
+                # ダイジェストにまとめ、送信キューに入れた時点で通知済みにする
+                self.add_to_digest(Alert(
+                    user_id=user_id,
+                    kind='resin',
+                    title='🌙 樹脂',
+                    message=f'樹脂が{resin_threshold}に達しました（{notes.current_resin}/{notes.max_resin}）',
+                    value=notes.current_resin,
+                    triggered_at=fetched_at
+                ))
+                notified_at = fetched_at
+            elif await self._enqueue_and_mark(
+                self.send_resin_reminder(
+                    user_id=user_id,
+                    current_resin=notes.current_resin,
+                    max_resin=notes.max_resin,
+                    threshold=resin_threshold
+                ),
+                lambda: self._notified.append((user_id, 'resin', fetched_at, notes.current_resin))
+            ):
+                notified_at = fetched_at
+        elif notes.current_resin < resin_threshold and notified_at is not None:
+            # 樹脂を使って閾値を下回ったので、次に届いたときに通知する
+            notified_at = None
+            self._rearmed.append((user_id, 'resin'))
+        
+        # 閾値に届く時刻まで次のチェックを見送る
+        next_check = ReminderScheduler.compute_next_check(
+            current_resin=notes.current_resin,
+            max_resin=notes.max_resin,
+            threshold=resin_threshold,
+            fetched_at=fetched_at
+        )
+        exact = notes.current_resin < min(resin_threshold, notes.max_resin)
+        if notified_at is not None and target.renotify_minutes:
+            renotify_at = notified_at + target.renotify_minutes * 60
+            if renotify_at < next_check:
+                next_check, exact = renotify_at, False
+        return next_check, exact
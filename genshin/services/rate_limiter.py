@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+HoYoLAB APIのレート制限
+プロセス全体で共有するトークンバケット（コマンドを定期処理より優先）
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from config.constants import APIConstants
+
+
+class RateLimiter:
+    """優先レーン付きトークンバケット"""
+
+    INTERACTIVE = 0  # ユーザーのコマンド（優先）
+    BACKGROUND = 1  # 樹脂チェックなどの定期処理
+
+    def __init__(
+        self,
+        rate: float = APIConstants.RATE_LIMIT_PER_SECOND,
+        burst: int = APIConstants.RATE_LIMIT_BURST
+    ):
+        """
+        レート制限を初期化
+
+        Args:
+            rate: 1秒あたりに補充するトークン数
+            burst: バケットの容量（瞬間的に許可するリクエスト数）
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._waiters: Dict[int, Deque[asyncio.Future]] = {
+            self.INTERACTIVE: deque(),
+            self.BACKGROUND: deque()
+        }
+        self._dispatch_handle: Optional[asyncio.TimerHandle] = None
+        self.granted = {self.INTERACTIVE: 0, self.BACKGROUND: 0}
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        """
+        トークンを1つ取得（なければ補充されるまで待つ）
+
+        待っているリクエストがある場合、優先度の高いレーンから順に払い出す
+
+        Args:
+            priority: INTERACTIVE または BACKGROUND
+        """
+        self._refill()
+        if self._tokens >= 1 and not self._has_waiters_before(priority):
+            self._tokens -= 1
+            self.granted[priority] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        self._schedule_dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 払い出し直後にキャンセルされた場合はトークンを戻す
+                self._tokens = min(self.burst, self._tokens + 1)
+                self.granted[priority] -= 1
+            raise
+
+    def stats(self) -> Dict[str, float]:
+        """待ち数・払い出し数などの統計を取得"""
+        self._refill()
+        return {
+            'tokens': self._tokens,
+            'waiting_interactive': len(self._waiters[self.INTERACTIVE]),
+            'waiting_background': len(self._waiters[self.BACKGROUND]),
+            'granted_interactive': self.granted[self.INTERACTIVE],
+            'granted_background': self.granted[self.BACKGROUND]
+        }
+
+    def _refill(self) -> None:
+        """経過時間分のトークンを補充"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _has_waiters_before(self, priority: int) -> bool:
+        """自分より先に払い出すべき待ちがあるか"""
+        return any(self._waiters[lane] for lane in self._waiters if lane <= priority)
+
+    def _schedule_dispatch(self) -> None:
+        """次のトークンが補充される時刻に払い出しを予約"""
+        if self._dispatch_handle is not None:
+            return
+        delay = max(0.0, (1 - self._tokens) / self.rate)
+        loop = asyncio.get_running_loop()
+        self._dispatch_handle = loop.call_later(delay, self._dispatch)
+
+    def _dispatch(self) -> None:
+        """優先レーンから順にトークンを払い出す"""
+        self._dispatch_handle = None
+        self._refill()
+
+        for lane in sorted(self._waiters):
+            waiters = self._waiters[lane]
+            while waiters and self._tokens >= 1:
+                future = waiters.popleft()
+                if future.done():  # キャンセル済み
+                    continue
+                future.set_result(None)
+                self._tokens -= 1
+                self.granted[lane] += 1
+
+        # キャンセル済みの待ちを掃除し、残りがあれば次の払い出しを予約
+        for waiters in self._waiters.values():
+            while waiters and waiters[0].done():
+                waiters.popleft()
+        if any(self._waiters.values()):
+            self._schedule_dispatch()
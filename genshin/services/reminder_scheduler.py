@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+樹脂リマインダーのスケジューラー
+樹脂の回復ペースから閾値到達時刻を計算し、その時刻にだけチェックする
+チェック時刻はユーザーごとのスロットに揃え、APIとDiscordへの呼び出しを時間方向に均す
+"""
+
+import heapq
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.constants import ResinConstants, NotificationConstants
+from models.async_database import AsyncDatabase
+
+
+class ReminderScheduler:
+    """ユーザーごとの次回チェック時刻を管理するスケジューラー（最小ヒープ＋DB永続化）"""
+
+    def __init__(self, database: AsyncDatabase):
+        """
+        スケジューラーを初期化
+
+        Args:
+            database: データベースインスタンス
+        """
+        self.database = database
+        self._heap: List[Tuple[float, int]] = []
+        self._due_at: Dict[int, float] = {}  # ヒープ内の古いエントリを見分けるための最新時刻
+        self._dirty: Dict[int, float] = {}  # DB未保存の予定
+        self._last_reconciled: Optional[float] = None
+
+        # スロット計画（ユーザーID -> スロット番号）
+        self.slot_count = NotificationConstants.SCHEDULE_SLOT_COUNT
+        self.slot_seconds = NotificationConstants.SCHEDULER_TICK_SECONDS
+        self.align_tolerance = NotificationConstants.SCHEDULE_ALIGN_TOLERANCE_SECONDS
+        self._slots: Dict[int, int] = {}
+        self._slot_fill: List[int] = [0] * self.slot_count  # スロットごとの人数
+        self._last_lags: List[float] = []  # 直近のpop_dueでの予定からの遅れ（秒）
+
+    @staticmethod
+    def compute_next_check(current_resin: int, max_resin: int, threshold: int, fetched_at: float) -> float:
+        """
+        次回チェック時刻を計算
+
+        樹脂は一定ペースで回復するため、閾値に届くまでは再取得しても通知は起きない。
+        途中で樹脂を消費した場合は到達が遅れるだけなので、この時刻より早く届くことはない。
+
+        Args:
+            current_resin: 取得時点の樹脂数
+            max_resin: 最大樹脂数
+            threshold: 通知閾値
+            fetched_at: 取得時刻（UNIX時間）
+
+        Returns:
+            float: 次回チェック時刻（UNIX時間）
+        """
+        target = min(threshold, max_resin)
+        if current_resin >= target:
+            return fetched_at + NotificationConstants.RECHECK_AFTER_NOTIFY_MINUTES * 60
+
+        return fetched_at + (target - current_resin) * ResinConstants.RESIN_RECOVERY_SECONDS
+
+    @property
+    def needs_reconcile(self) -> bool:
+        """DBとの再同期が必要か"""
+        if self._last_reconciled is None:
+            return True
+        elapsed = time.time() - self._last_reconciled
+        return elapsed >= NotificationConstants.RECONCILE_INTERVAL_MINUTES * 60
+
+    async def reconcile(self) -> None:
+        """
+        DBから対象ユーザーと予定を読み込んでヒープを作り直す
+
+        通知を無効にしたユーザーやクッキーを削除したユーザーはここで外れる
+        """
+        await self.flush()
+        rows = await self.database.get_reminder_schedule()
+
+        user_ids = {user_id for user_id, _ in rows}
+        if not self._slots:
+            self._plan(user_ids)
+        else:
+            # 既存のユーザーのスロットは動かさず、増減分だけ反映する
+            for user_id in set(self._slots) - user_ids:
+                self._release_slot(user_id)
+            for user_id in user_ids:
+                self.slot_of(user_id)
+
+        # 未チェックのユーザーや、1周期以上遅れている予定（再起動直後など）はスロットに分けて順に処理する
+        now = time.time()
+        overdue_before = now - self.slot_count * self.slot_seconds
+        self._due_at = {
+            user_id: (due_at if due_at is not None and due_at >= overdue_before else self._next_slot_time(user_id, now))
+            for user_id, due_at in rows
+        }
+        self._heap = [(due_at, user_id) for user_id, due_at in self._due_at.items()]
+        heapq.heapify(self._heap)
+        self._last_reconciled = now
+
+    # === スロット計画 ===
+
+    @staticmethod
+    def _slot_hash(user_id: int) -> int:
+        """ユーザーIDから安定したハッシュ値を計算（プロセスをまたいで同じ値）"""
+        return zlib.crc32(str(user_id).encode())
+
+    def _plan(self, user_ids) -> None:
+        """
+        ユーザーをスロットに割り当てる（起動後の最初の読み込みだけ）
+
+        ハッシュ順に並べて均等に配るため、人数が少なくてもスロットごとの人数の差は1人以内になる
+
+        Args:
+            user_ids: 対象ユーザーIDの一覧
+        """
+        ordered = sorted(set(user_ids), key=lambda user_id: (self._slot_hash(user_id), user_id))
+        count = len(ordered)
+        self._slots = {user_id: index * self.slot_count // count for index, user_id in enumerate(ordered)}
+        self._slot_fill = [0] * self.slot_count
+        for slot in self._slots.values():
+            self._slot_fill[slot] += 1
+
+    def slot_of(self, user_id: int) -> int:
+        """
+        ユーザーのスロット番号
+
+        計画にないユーザーは最も空いているスロットに入れる（同じ人数ならハッシュで選ぶ）。
+        他のユーザーのスロットは動かさない
+        """
+        slot = self._slots.get(user_id)
+        if slot is None:
+            preferred = self._slot_hash(user_id) % self.slot_count
+            slot = min(
+                range(self.slot_count),
+                key=lambda s: (self._slot_fill[s], (s - preferred) % self.slot_count)
+            )
+            self._slots[user_id] = slot
+            self._slot_fill[slot] += 1
+        return slot
+
+    def _release_slot(self, user_id: int) -> None:
+        """ユーザーのスロットを空ける"""
+        slot = self._slots.pop(user_id, None)
+        if slot is not None:
+            self._slot_fill[slot] -= 1
+
+    def _next_slot_time(self, user_id: int, after: float) -> float:
+        """after以降で最初に来るユーザーのスロットの時刻（最大1周期後）"""
+        window = self.slot_count * self.slot_seconds
+        aligned = after - after % window + self.slot_of(user_id) * self.slot_seconds
+        if aligned < after:
+            aligned += window
+        return aligned
+
+    def align(self, user_id: int, due_at: float) -> float:
+        """
+        due_atに最も近いユーザーのスロットの時刻
+
+        前後 align_tolerance 秒以内にスロットの時刻がなければ揃えずにdue_atのまま返す
+
+        Args:
+            user_id: ユーザーID
+            due_at: 本来のチェック時刻（UNIX時間）
+
+        Returns:
+            float: スロットに揃えたチェック時刻
+        """
+        window = self.slot_count * self.slot_seconds
+        after = self._next_slot_time(user_id, due_at)
+        aligned = min((after, after - window), key=lambda t: abs(t - due_at))
+        return aligned if abs(aligned - due_at) <= self.align_tolerance else due_at
+
+    # === 予定の管理 ===
+
+    def schedule(self, user_id: int, due_at: float, exact: bool = False) -> None:
+        """
+        ユーザーの次回チェック時刻を設定（DBへの保存はflush時）
+
+        Args:
+            user_id: ユーザーID
+            due_at: 次回チェック時刻（UNIX時間）
+            exact: Trueならスロットに揃えずその時刻にチェックする
+                   （閾値に届く予測時刻や、コマンドで設定を変えた直後など）
+        """
+        if not exact:
+            due_at = self.align(user_id, due_at)
+        self._due_at[user_id] = due_at
+        self._dirty[user_id] = due_at
+        heapq.heappush(self._heap, (due_at, user_id))
+
+    def unschedule(self, user_id: int) -> None:
+        """ユーザーをスケジュールから外す"""
+        self._due_at.pop(user_id, None)
+        self._dirty.pop(user_id, None)
+        self._release_slot(user_id)
+
+    def pop_due(self, now: float) -> List[int]:
+        """
+        チェック時刻を迎えたユーザーを取り出す
+
+        Args:
+            now: 現在時刻（UNIX時間）
+
+        Returns:
+            List[int]: 対象ユーザーIDのリスト
+        """
+        due_users = []
+        self._last_lags = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, user_id = heapq.heappop(self._heap)
+            # 再スケジュール済み・解除済みの古いエントリは読み飛ばす
+            if self._due_at.get(user_id) != due_at:
+                continue
+            del self._due_at[user_id]
+            due_users.append(user_id)
+            self._last_lags.append(now - due_at)
+        return due_users
+
+    def next_due_at(self) -> Optional[float]:
+        """最も早いチェック時刻（予定がなければNone）"""
+        while self._heap and self._due_at.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def stats(self) -> Dict[str, Any]:
+        """スロットごとの人数と、直近のチェックの予定からの遅れを取得"""
+        return {
+            'users': len(self._slots),
+            'slot_fill': list(self._slot_fill),
+            'lag_avg': sum(self._last_lags) / len(self._last_lags) if self._last_lags else 0.0,
+            'lag_max': max(self._last_lags, default=0.0)
+        }
+
+    def summary(self) -> str:
+        """ログ用のサマリー文字列"""
+        stats = self.stats()
+        fill = stats['slot_fill']
+        return (
+            f"スケジュール: 対象{stats['users']}人 スロット{self.slot_count}個"
+            f"（1スロット{min(fill)}〜{max(fill)}人） "
+            f"遅れ 平均{stats['lag_avg']:.1f}秒 最大{stats['lag_max']:.1f}秒"
+        )
+
+    async def flush(self) -> None:
+        """未保存の予定をまとめてDBに保存"""
+        if not self._dirty:
+            return
+        rows = list(self._dirty.items())
+        self._dirty.clear()
+        if not await self.database.save_reminder_schedules(rows):
+            # 保存に失敗した分は次回に持ち越す
+            for user_id, due_at in rows:
+                self._dirty.setdefault(user_id, due_at)
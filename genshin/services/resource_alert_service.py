@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+資源通知サービス
+樹脂以外の資源（洞天宝銭・参量物質変換器・探索派遣・デイリー任務）の通知を、樹脂と同じノートから判定する
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config.constants import NotificationConstants
+from models.alert import Alert, ResourceAlertSetting
+
+
+@dataclass
+class ResourceAlertResult:
+    """1種類の資源の判定結果"""
+    alert: Optional[Alert] = None  # 通知する場合の通知
+    rearm: bool = False  # 通知済みの記録を消す（次に条件を満たしたら再び通知する）
+    next_check: Optional[float] = None  # 次に確認すべき時刻（UNIX時間、予測できなければNone）
+
+
+@dataclass
+class _Condition:
+    """資源の状態"""
+    triggered: bool
+    value: int = 0
+    message: str = ''
+    next_check: Optional[float] = None
+
+
+class ResourceAlertService:
+    """樹脂以外の資源の通知判定（API呼び出しはしない）"""
+
+    KINDS = tuple(NotificationConstants.RESOURCE_ALERT_LABELS)
+
+    @staticmethod
+    def resolve_timezone(name: Optional[str]) -> Optional[tzinfo]:
+        """
+        タイムゾーン名を解決
+
+        Args:
+            name: IANAのタイムゾーン名（例: Asia/Tokyo）
+
+        Returns:
+            tzinfo: 解決できなければNone
+        """
+        if not name:
+            return None
+        if name.upper() == 'UTC':
+            return timezone.utc
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            return None
+
+    @classmethod
+    def evaluate(
+        cls,
+        user_id: int,
+        setting: ResourceAlertSetting,
+        notes,
+        now: float,
+        timezone_name: str = 'UTC'
+    ) -> ResourceAlertResult:
+        """
+        1種類の資源を判定
+
+        条件を満たしてから初めてのときだけ通知し、条件を外れたら次に満たしたときのために記録を消す。
+        デイリー任務は日ごとに1回通知する。
+
+        Args:
+            user_id: DiscordのユーザーID
+            setting: 通知設定と通知状態
+            notes: ノート（NotesEstimate）
+            now: 判定する時刻（UNIX時間）
+            timezone_name: ユーザーのタイムゾーン（デイリー任務の時刻と日付に使う。不正ならUTC）
+
+        Returns:
+            ResourceAlertResult: 判定結果
+        """
+        evaluator = {
+            'realm_currency': cls._realm_currency,
+            'transformer': cls._transformer,
+            'expeditions': cls._expeditions,
+            'commissions': cls._commissions,
+        }.get(setting.kind)
+        if evaluator is None:
+            return ResourceAlertResult()
+
+        if setting.kind == 'commissions':
+            zone = cls.resolve_timezone(timezone_name) or timezone.utc
+            condition = cls._commissions(setting, notes, now, zone)
+        else:
+            condition = evaluator(setting, notes, now)
+        result = ResourceAlertResult(next_check=condition.next_check)
+
+        if condition.triggered:
+            if setting.kind == 'commissions':
+                already_notified = setting.last_notified_value == condition.value
+            else:
+                already_notified = setting.last_notified_at is not None
+
+            if not already_notified:
+                result.alert = Alert(
+                    user_id=user_id,
+                    kind=setting.kind,
+                    title=NotificationConstants.RESOURCE_ALERT_LABELS[setting.kind],
+                    message=condition.message,
+                    value=condition.value,
+                    triggered_at=now
+                )
+            if result.next_check is None:
+                # 使われて条件を外れたことに気付けるよう、樹脂と同じ間隔で確認する
+                result.next_check = now + NotificationConstants.RECHECK_AFTER_NOTIFY_MINUTES * 60
+        elif setting.last_notified_at is not None and setting.kind != 'commissions':
+            result.rearm = True
+
+        return result
+
+    @staticmethod
+    def _realm_currency(setting: ResourceAlertSetting, notes, now: float) -> _Condition:
+        """洞天宝銭が閾値（既定は上限）に達したか"""
+        maximum = notes.max_realm_currency
+        if maximum <= 0:
+            return _Condition(triggered=False)
+
+        target = min(setting.threshold or maximum, maximum)
+        current = notes.current_realm_currency
+        if current >= target:
+            return _Condition(
+                triggered=True,
+                value=current,
+                message=f'洞天宝銭が{target}に達しました（{current}/{maximum}）'
+            )
+
+        # 取得時点の回復ペースから到達時刻を計算
+        remaining = notes.remaining_realm_currency_recovery_seconds
+        next_check = None
+        if remaining > 0 and maximum > current:
+            next_check = now + remaining * (target - current) / (maximum - current)
+        return _Condition(triggered=False, next_check=next_check)
+
+    @staticmethod
+    def _transformer(setting: ResourceAlertSetting, notes, now: float) -> _Condition:
+        """参量物質変換器が使用可能になったか"""
+        remaining = notes.remaining_transformer_recovery_seconds
+        if remaining is None:  # 未入手
+            return _Condition(triggered=False)
+        if remaining <= 0:
+            return _Condition(triggered=True, message='参量物質変換器が使用可能になりました')
+        return _Condition(triggered=False, next_check=now + remaining)
+
+    @staticmethod
+    def _expeditions(setting: ResourceAlertSetting, notes, now: float) -> _Condition:
+        """探索派遣が指定数（既定はすべて）完了したか"""
+        remaining = sorted(notes.expedition_remaining_seconds)
+        if not remaining:
+            return _Condition(triggered=False)
+
+        target = min(setting.threshold or len(remaining), len(remaining))
+        finished = sum(1 for seconds in remaining if seconds <= 0)
+        if finished >= target:
+            return _Condition(
+                triggered=True,
+                value=finished,
+                message=f'探索派遣が{finished}/{len(remaining)}件完了しました'
+            )
+        return _Condition(triggered=False, next_check=now + remaining[target - 1])
+
+    @staticmethod
+    def _commissions(setting: ResourceAlertSetting, notes, now: float, zone: tzinfo) -> _Condition:
+        """指定時刻（ユーザーのタイムゾーン）を過ぎてもデイリー任務が未完了か（値はユーザーの日付）"""
+        hour = setting.threshold if setting.threshold is not None \
+            else NotificationConstants.DEFAULT_COMMISSION_REMINDER_HOUR
+        local = datetime.fromtimestamp(now, zone)
+        remind_at = local.replace(hour=hour, minute=0, second=0, microsecond=0)
+        next_remind_at = remind_at if local < remind_at else remind_at + timedelta(days=1)
+
+        if local >= remind_at and notes.completed_commissions < notes.max_commissions:
+            return _Condition(
+                triggered=True,
+                value=local.date().toordinal(),
+                message=f'デイリー任務が未完了です（{notes.completed_commissions}/{notes.max_commissions}）',
+                next_check=next_remind_at.timestamp()
+            )
+        return _Condition(triggered=False, next_check=next_remind_at.timestamp())
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+所持キャラクター一覧のキャッシュ
+古くなったデータは即座に返しつつ、裏で取得し直す（stale-while-revalidate）
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Set, Any
+
+from config.constants import APIConstants
+from services.circuit_breaker import CircuitOpenError
+
+
+class _RosterEntry:
+    """キャッシュエントリ"""
+
+    __slots__ = ('characters', 'fetched_at')
+
+    def __init__(self, characters: List, fetched_at: float):
+        self.characters = characters
+        self.fetched_at = fetched_at
+
+
+@dataclass
+class Roster:
+    """キャラクター一覧と、その鮮度"""
+    characters: List
+    age_seconds: float = 0.0  # 取得してからの経過秒数
+    from_cache: bool = False  # キャッシュから返したか
+    refreshing: bool = False  # 古いため裏で取得し直しているか
+
+
+class RosterCache:
+    """UIDをキーにした所持キャラクター一覧のSWRキャッシュ"""
+
+    def __init__(
+        self,
+        fresh_seconds: float = APIConstants.ROSTER_FRESH_SECONDS,
+        max_stale_seconds: float = APIConstants.ROSTER_MAX_STALE_SECONDS,
+        max_characters: int = APIConstants.ROSTER_CACHE_MAX_CHARACTERS
+    ):
+        """
+        キャッシュを初期化
+
+        Args:
+            fresh_seconds: この秒数以内のデータはそのまま返す
+            max_stale_seconds: この秒数を超えたデータは使わずに取得し直す
+            max_characters: 全エントリ合計のキャラクター数の上限（メモリ上限）
+        """
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.max_characters = max_characters
+        self._entries: 'OrderedDict[int, _RosterEntry]' = OrderedDict()
+        self._total_characters = 0
+        self._refreshing: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_failures = 0
+
+    async def get(self, uid: int, loader: Callable[[], Awaitable[List]]) -> List:
+        """
+        キャラクター一覧を取得
+
+        Args:
+            uid: 原神UID
+            loader: キャッシュにない場合にAPIから取得する関数
+
+        Returns:
+            List: キャラクターのリスト
+        """
+        return (await self.get_roster(uid, loader)).characters
+
+    async def get_roster(self, uid: int, loader: Callable[[], Awaitable[List]]) -> Roster:
+        """
+        キャラクター一覧を鮮度つきで取得（表示でキャッシュかどうかを示すため）
+
+        Args:
+            uid: 原神UID
+            loader: キャッシュにない場合にAPIから取得する関数
+
+        Returns:
+            Roster: キャラクターのリストと鮮度
+        """
+        entry = self._entries.get(uid)
+        now = time.monotonic()
+
+        if entry is not None:
+            age = now - entry.fetched_at
+            if age <= self.fresh_seconds:
+                self.hits += 1
+                self._entries.move_to_end(uid)
+                return Roster(list(entry.characters), age, from_cache=True)
+
+            if age <= self.max_stale_seconds:
+                # 古いデータをすぐ返し、裏で取得し直す
+                self.stale_hits += 1
+                self._entries.move_to_end(uid)
+                self._refresh_in_background(uid, loader)
+                return Roster(list(entry.characters), age, from_cache=True, refreshing=True)
+
+        self.misses += 1
+        try:
+            characters = await loader()
+        except CircuitOpenError:
+            # HoYoLABの障害中は期限切れのデータでも返す
+            if entry is None:
+                raise
+            self.stale_hits += 1
+            self._entries.move_to_end(uid)
+            return Roster(list(entry.characters), now - entry.fetched_at, from_cache=True)
+        self._store(uid, list(characters))
+        return Roster(list(characters))
+
+    def invalidate(self, uid: int) -> None:
+        """UIDのエントリを破棄"""
+        entry = self._entries.pop(uid, None)
+        if entry is not None:
+            self._total_characters -= len(entry.characters)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット数などの統計を取得"""
+        return {
+            'entries': len(self._entries),
+            'characters': self._total_characters,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refresh_failures': self.refresh_failures
+        }
+
+    async def close(self) -> None:
+        """実行中の再取得を止める"""
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        self._refreshing.clear()
+
+    def _refresh_in_background(self, uid: int, loader: Callable[[], Awaitable[List]]) -> None:
+        """再取得タスクを開始（同じUIDの再取得は1本だけ）"""
+        if uid in self._refreshing:
+            return
+        self._refreshing.add(uid)
+
+        async def refresh():
+            try:
+                self._store(uid, list(await loader()))
+            except Exception as e:
+                self.refresh_failures += 1
+                print(f"キャラクター一覧の再取得エラー (UID {uid}): {e}")
+            finally:
+                self._refreshing.discard(uid)
+
+        task = asyncio.create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _store(self, uid: int, characters: List) -> None:
+        """エントリを保存し、上限を超えたら古いものから破棄"""
+        self.invalidate(uid)
+        self._entries[uid] = _RosterEntry(characters, time.monotonic())
+        self._total_characters += len(characters)
+
+        while self._total_characters > self.max_characters and len(self._entries) > 1:
+            _, oldest = self._entries.popitem(last=False)
+            self._total_characters -= len(oldest.characters)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+同一リクエストの集約（single-flight）
+同じキーの呼び出しが実行中なら、新たに実行せずその結果を共有する
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """同じキーの同時呼び出しを1回の実行にまとめるクラス"""
+
+    def __init__(self):
+        """集約テーブルを初期化"""
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0  # 実際に実行した回数
+        self.deduplicated = 0  # 実行中の呼び出しに相乗りした回数
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キーごとに1回だけfuncを実行し、同時に来た呼び出しには同じ結果（または例外）を返す
+
+        Args:
+            key: 集約のキー（例: (エンドポイント, ユーザーID)）
+            func: 実行する非同期関数
+
+        Returns:
+            Any: funcの戻り値
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+
+        # 1つの呼び出し元がキャンセル・タイムアウトしても、相乗りしている他の呼び出しは続ける
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict[str, int]:
+        """集約の統計を取得"""
+        return {
+            'calls': self.calls,
+            'deduplicated': self.deduplicated,
+            'inflight': len(self._inflight)
+        }
+
+    def summary(self) -> str:
+        """ログ用のサマリー文字列"""
+        return f"同一リクエストの集約: 実行{self.calls} 相乗り{self.deduplicated} 実行中{len(self._inflight)}"
+
+    def _finish(self, key: Hashable, future: asyncio.Future) -> None:
+        """完了した呼び出しをテーブルから外す"""
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 全員がキャンセルした後に失敗しても「未取得の例外」警告を出さない
+        if not future.cancelled():
+            future.exception()
@@ -6,7 +6,7 @@ Embed生成ロジック
 
 import discord
 from datetime import datetime
-from config.constants import ColorConstants, ElementConstants
+from config.constants import ColorConstants, ElementConstants, HealthConstants
 
 
 class EmbedBuilder:
@@ -130,6 +130,18 @@ class EmbedBuilder:
                 value=transformer_str,
                 inline=True
             )
+        elif getattr(notes, 'transformer_recovery_time', None) is not None:
+            transformer_time = notes.transformer_recovery_time
+            if transformer_time > datetime.now().astimezone():
+                transformer_str = transformer_time.strftime('%H:%M')
+            else:
+                transformer_str = '使用可能'
+            
+            embed.add_field(
+                name='参量物質変換器',
+                value=transformer_str,
+                inline=True
+            )
         
         embed.timestamp = discord.utils.utcnow()
         return embed
@@ -156,7 +168,46 @@ class EmbedBuilder:
         return embed
     
     @staticmethod
-    def resin_notification_settings_embed(enabled: bool, threshold: int) -> discord.Embed:
+    def quarantine_notice_embed(status: str) -> discord.Embed:
+        """自動通知を停止したことの案内のEmbed"""
+        embed = discord.Embed(
+            title='⚠️ 自動通知を停止しました',
+            description=HealthConstants.QUARANTINE_MESSAGES[status],
+            color=ColorConstants.WARNING_COLOR
+        )
+        embed.timestamp = discord.utils.utcnow()
+        return embed
+    
+    @staticmethod
+    def resource_alert_embed(alert) -> discord.Embed:
+        """樹脂以外の資源の通知のEmbed"""
+        embed = discord.Embed(
+            title=f'🔔 {alert.title}',
+            description=alert.message,
+            color=ColorConstants.SUCCESS_COLOR
+        )
+        embed.set_footer(text='通知を停止するには /resource_alert で無効にしてください')
+        embed.timestamp = discord.utils.utcnow()
+        return embed
+    
+    @staticmethod
+    def notification_digest_embed(alerts: list) -> discord.Embed:
+        """複数の通知をまとめたダイジェストのEmbed"""
+        embed = discord.Embed(
+            title='🔔 通知まとめ',
+            description=f'{len(alerts)}件のお知らせがあります。',
+            color=ColorConstants.SUCCESS_COLOR
+        )
+        
+        for alert in alerts[:25]:  # Embedのフィールド数の上限
+            embed.add_field(name=alert.title, value=alert.message, inline=False)
+        
+        embed.set_footer(text='まとめて受け取る設定は /notification_digest で変更できます')
+        embed.timestamp = discord.utils.utcnow()
+        return embed
+    
+    @staticmethod
+    def resin_notification_settings_embed(enabled: bool, threshold: int, renotify_minutes: int = 0) -> discord.Embed:
         """樹脂通知設定のEmbed"""
         embed = discord.Embed(
             title='✅ 樹脂通知設定完了',
@@ -166,8 +217,10 @@ class EmbedBuilder:
         if enabled:
             threshold_text = f'{threshold}' if threshold else '満タン（200）'
             embed.description = f'樹脂が{threshold_text}に達したときに通知します。'
-            embed.add_field(name='チェック間隔', value='30分ごと', inline=True)
+            embed.add_field(name='チェック間隔', value='閾値に届く時刻に合わせて確認', inline=True)
             embed.add_field(name='通知方法', value='DMで通知', inline=True)
+            renotify_text = f'{renotify_minutes}分ごと' if renotify_minutes else '閾値を下回って再び届いたとき'
+            embed.add_field(name='再通知', value=renotify_text, inline=True)
         else:
             embed.description = '樹脂通知を無効にしました。'
         
@@ -258,10 +311,15 @@ class EmbedBuilder:
         embed.add_field(
             name='🔔 通知機能',
             value=(
-                '**`/resin_notification enabled: [有効/無効] threshold: [閾値]`**\n'
+                '**`/resin_notification enabled: [有効/無効] threshold: [閾値] renotify: [分]`**\n'
                 '└ 樹脂が指定値に達したらDMで通知\n'
-                '└ 30分ごとに自動チェック\n'
-                '└ 例: `/resin_notification enabled:有効 threshold:180`'
+                '└ 樹脂の回復ペースから到達時刻を計算して自動チェック\n'
+                '└ 同じ状態での通知は1回だけ（renotifyで再通知の間隔を指定）\n'
+                '└ 例: `/resin_notification enabled:有効 threshold:180`\n'
+                '**`/resource_alert kind: [資源] enabled: [有効/無効] threshold: [閾値]`**\n'
+                '└ 洞天宝銭・参量物質変換器・探索派遣・デイリー任務の通知\n'
+                '**`/notification_digest enabled: [有効/無効]`**\n'
+                '└ 近い時間に届いた通知を1通のDMにまとめる'
             ),
             inline=False
         )